@@ -2,6 +2,9 @@ import streamlit as st
 import os
 from datetime import datetime
 
+from utils.almacenamiento import obtener_repositorio
+from utils.dinero import a_soles
+
 # Configuración de la página
 st.set_page_config(
     page_title="Peru Delivery - Sistema de Facturación",
@@ -62,45 +65,20 @@ st.sidebar.markdown("---")
 # Opciones del menú
 opcion = st.sidebar.selectbox(
     "Selecciona una opción:",
-    ["🏠 Inicio", "📝 Generar Factura", "🖊️ Editar Factura", "📋 Listar Facturas", "🗑️ Eliminar Factura"]
+    ["🏠 Inicio", "📝 Generar Factura", "🖊️ Editar Factura", "📋 Listar Facturas", "🗑️ Eliminar Factura",
+     "📈 Reportes", "💾 Respaldos"]
 )
 
 
-# Función para contar facturas
-def contar_facturas():
-    try:
-        if not os.path.exists("cache"):
-            return 0
-        archivos = [f for f in os.listdir("cache") if f.startswith("factura_") and f.endswith(".txt")]
-        return len(archivos)
-    except:
-        return 0
-
-
-# Función para obtener total de facturas (suma de montos)
-def obtener_total_general():
+# Función para obtener las métricas del dashboard (agregados incrementales)
+def obtener_metricas():
     try:
-        total = 0.0
-        if not os.path.exists("cache"):
-            return total
-
-        archivos = [f for f in os.listdir("cache") if f.startswith("factura_") and f.endswith(".txt")]
-        for archivo in archivos:
-            try:
-                with open(os.path.join("cache", archivo), "r", encoding="utf-8") as f:
-                    contenido = f.read()
-                    # Buscar línea con TOTAL
-                    for linea in contenido.split('\n'):
-                        if 'TOTAL' in linea and 'S/.' in linea:
-                            # Extraer el monto
-                            monto_str = linea.split('S/.')[1].strip()
-                            total += float(monto_str)
-                            break
-            except:
-                continue
-        return total
-    except:
-        return 0.0
+        return obtener_repositorio().agregados()
+    except Exception:
+        return {
+            'cantidad': 0, 'subtotal': 0.0, 'igv': 0.0, 'total': 0.0,
+            'minimo': None, 'maximo': None, 'promedio': 0.0
+        }
 
 
 # PÁGINA PRINCIPAL
@@ -110,18 +88,55 @@ if opcion == "🏠 Inicio":
     # Métricas del sistema
     col1, col2, col3 = st.columns(3)
 
-    num_facturas = contar_facturas()
-    total_general = obtener_total_general()
+    metricas = obtener_metricas()
+
+    with col1:
+        st.metric("📄 Total Facturas", metricas['cantidad'])
+
+    with col2:
+        st.metric("💰 Monto Total", f"S/. {metricas['total']:.2f}")
+
+    with col3:
+        st.metric("📊 Promedio", f"S/. {metricas['promedio']:.2f}")
+
+    col1, col2, col3 = st.columns(3)
 
     with col1:
-        st.metric("📄 Total Facturas", num_facturas)
+        st.metric("🧾 IGV Recaudado", f"S/. {metricas['igv']:.2f}")
 
     with col2:
-        st.metric("💰 Monto Total", f"S/. {total_general:.2f}")
+        st.metric("⬇️ Factura Mínima", f"S/. {metricas['minimo'] or 0:.2f}")
 
     with col3:
-        promedio = total_general / num_facturas if num_facturas > 0 else 0
-        st.metric("📊 Promedio", f"S/. {promedio:.2f}")
+        st.metric("⬆️ Factura Máxima", f"S/. {metricas['maximo'] or 0:.2f}")
+
+    # Facturas emitidas en un periodo (consulta por rango de fecha de emisión)
+    st.markdown("---")
+    st.subheader("📅 Facturas por Periodo")
+
+    hoy = datetime.now().date()
+    periodo = st.date_input("Periodo de emisión:", value=(hoy.replace(day=1), hoy), key="periodo_dashboard")
+
+    if isinstance(periodo, (tuple, list)) and len(periodo) == 2:
+        inicio_periodo = datetime.combine(periodo[0], datetime.min.time()).timestamp()
+        fin_periodo = datetime.combine(periodo[1], datetime.max.time()).timestamp()
+        try:
+            facturas_periodo = obtener_repositorio().buscar(fecha_desde=inicio_periodo, fecha_hasta=fin_periodo)
+        except Exception:
+            facturas_periodo = []
+        total_periodo = a_soles(sum(factura['total_centimos'] for factura in facturas_periodo))
+
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            st.metric("📄 Facturas del Periodo", len(facturas_periodo))
+
+        with col2:
+            st.metric("💰 Monto del Periodo", f"S/. {total_periodo:.2f}")
+
+        with col3:
+            promedio_periodo = total_periodo / len(facturas_periodo) if facturas_periodo else 0.0
+            st.metric("📊 Promedio del Periodo", f"S/. {promedio_periodo:.2f}")
 
     st.markdown("---")
     st.subheader("🚀 Accesos Rápidos")
@@ -135,6 +150,9 @@ if opcion == "🏠 Inicio":
         if st.button("📋 Ver Facturas", use_container_width=True):
             st.switch_page("pages/listar_facturas.py")
 
+        if st.button("📈 Reportes", use_container_width=True):
+            st.switch_page("pages/reportes.py")
+
     with col2:
         if st.button("🖊️ Editar Factura", use_container_width=True):
             st.switch_page("pages/editar_factura.py")
@@ -142,6 +160,9 @@ if opcion == "🏠 Inicio":
         if st.button("🗑️ Eliminar Factura", use_container_width=True):
             st.switch_page("pages/eliminar_factura.py")
 
+        if st.button("💾 Respaldos", use_container_width=True):
+            st.switch_page("pages/respaldos.py")
+
     st.markdown("---")
     st.info("💡 **Tip:** Usa el menú lateral para navegar entre las diferentes funciones del sistema.")
 
@@ -165,4 +186,8 @@ elif opcion == "🖊️ Editar Factura":
 elif opcion == "📋 Listar Facturas":
     st.switch_page("pages/listar_facturas.py")
 elif opcion == "🗑️ Eliminar Factura":
-    st.switch_page("pages/eliminar_factura.py")
\ No newline at end of file
+    st.switch_page("pages/eliminar_factura.py")
+elif opcion == "📈 Reportes":
+    st.switch_page("pages/reportes.py")
+elif opcion == "💾 Respaldos":
+    st.switch_page("pages/respaldos.py")
\ No newline at end of file
@@ -5,12 +5,18 @@ import os
 # Añadir el directorio raíz al path para importar utils
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
+from utils.almacenamiento import FacturaModificada, obtener_repositorio
+from utils.catalogo import invalidar_factura, invalidar_facturas, obtener_catalogo
+from utils.dinero import a_centimos, a_soles, calcular_factura, puntos_basicos
+from utils.lote import cambiar_precio_lote
 from utils.validaciones import dato_valido
 
 IGV = 0.18
 
 st.set_page_config(page_title="Editar Factura", page_icon="🖊️")
 
+repositorio = obtener_repositorio()
+
 # CSS personalizado
 st.markdown("""
 <style>
@@ -69,123 +75,8 @@ if st.button("🏠 Volver al inicio", type="secondary"):
 st.markdown("---")
 
 
-# Función para obtener facturas disponibles
-@st.cache_data
-def obtener_facturas_disponibles():
-    try:
-        if not os.path.exists("cache"):
-            os.makedirs("cache")
-            return []
-
-        archivos = sorted(
-            [f for f in os.listdir("cache") if f.startswith("factura_") and f.endswith(".txt")]
-        )
-
-        facturas = []
-        for archivo in archivos:
-            try:
-                numero = int(archivo.split("_")[1].split(".")[0])
-                ruta = os.path.join("cache", archivo)
-                tamaño_kb = os.path.getsize(ruta) / 1024
-
-                # Leer total de la factura
-                total = "0.00"
-                try:
-                    with open(ruta, "r", encoding="utf-8") as f:
-                        contenido = f.read()
-                        for linea in contenido.split('\n'):
-                            if 'TOTAL' in linea and 'S/.' in linea:
-                                total = linea.split('S/.')[1].strip()
-                                break
-                except:
-                    pass
-
-                facturas.append({
-                    'numero': numero,
-                    'archivo': archivo,
-                    'ruta': ruta,
-                    'tamaño_kb': tamaño_kb,
-                    'total': total
-                })
-            except:
-                continue
-
-        return sorted(facturas, key=lambda x: x['numero'])
-
-    except Exception as e:
-        st.error(f"Error al obtener las facturas: {e}")
-        return []
-
-
-# Función para parsear factura
-def parsear_factura(ruta):
-    try:
-        with open(ruta, "r", encoding="utf-8") as f:
-            lineas = [l.rstrip("\n") for l in f.readlines()]
-
-        # Buscar sección de items entre las líneas de guiones
-        idx_inicio = None
-        idx_fin = None
-
-        for i, linea in enumerate(lineas):
-            if i > 0 and set(linea) == {"-"}:
-                idx_inicio = i + 1
-                break
-
-        if idx_inicio is not None:
-            for j in range(idx_inicio, len(lineas)):
-                if set(lineas[j]) == {"-"}:
-                    idx_fin = j
-                    break
-
-        items = []
-        if idx_inicio is None or idx_fin is None:
-            return items
-
-        for linea in lineas[idx_inicio:idx_fin]:
-            if not linea.strip():
-                continue
-
-            nombre = linea[:20].strip()
-            resto = linea[20:].strip().split()
-
-            if len(resto) >= 3:
-                try:
-                    precio = float(resto[0])
-                    cantidad = int(resto[1])
-                    if nombre:
-                        items.append((nombre, precio, cantidad))
-                except:
-                    continue
-        return items
-    except Exception as e:
-        st.error(f"Error al parsear la factura: {e}")
-        return []
-
-
-# Función para escribir factura
-def escribir_factura(ruta, productos, subtotal, igv, total):
-    try:
-        with open(ruta, "w", encoding="utf-8") as f:
-            f.write("🧾 FACTURA ELECTRÓNICA - PERU DELIVERY\n")
-            f.write("=" * 50 + "\n")
-            f.write(f"{'Producto':<20}{'Precio':>10}{'Cant.':>8}{'Total':>10}\n")
-            f.write("-" * 50 + "\n")
-            for nombre, precio, cantidad, total_item in productos:
-                f.write(f"{nombre:<20}{precio:>10.2f}{cantidad:>8}{total_item:>10.2f}\n")
-            f.write("-" * 50 + "\n")
-            f.write(f"{'Subtotal':<30} S/. {subtotal:.2f}\n")
-            f.write(f"{'IGV (18%)':<30} S/. {igv:.2f}\n")
-            f.write(f"{'TOTAL':<30} S/. {total:.2f}\n")
-            f.write("=" * 50 + "\n")
-        return True
-    except Exception as e:
-        st.error(f"Error al escribir la factura: {e}")
-        return False
-
-
-# Obtener facturas
-facturas_disponibles = obtener_facturas_disponibles()
+# Obtener facturas (catálogo compartido entre páginas y sesiones)
+facturas_disponibles = obtener_catalogo(repositorio)
 
 if not facturas_disponibles:
     st.warning("📭 No hay facturas disponibles para editar")
@@ -230,8 +121,10 @@ else:
 
         # Botón para cargar
         if st.button("📂 Cargar datos de la factura", type="primary", use_container_width=True):
-            # Parsear y cargar datos en session_state
-            productos_parseados = parsear_factura(factura_actual['ruta'])
+            # Parsear y cargar datos en session_state; la versión se lee antes
+            # para que cualquier cambio posterior se detecte al guardar
+            version = repositorio.version(factura_actual['numero'])
+            productos_parseados = repositorio.cargar(factura_actual['numero'])
 
             # Inicializar productos en session_state
             st.session_state.productos_editando = []
@@ -250,7 +143,7 @@ else:
                         'cantidad': 0
                     })
 
-            st.session_state.factura_cargada = factura_actual
+            st.session_state.factura_cargada = dict(factura_actual, version=version)
             st.success(f"✅ Datos cargados de la Factura N° {factura_actual['numero']:03d}")
             st.rerun()
 
@@ -271,13 +164,10 @@ else:
 
         # Función para calcular totales
         def calcular_totales_edicion():
-            subtotal = 0.0
-            for producto in st.session_state.productos_editando:
-                if producto['nombre'].strip() and producto['precio'] > 0 and producto['cantidad'] > 0:
-                    subtotal += producto['precio'] * producto['cantidad']
-
-            igv = subtotal * IGV
-            total = subtotal + igv
+            productos = [(producto['nombre'], producto['precio'], producto['cantidad'])
+                         for producto in st.session_state.productos_editando
+                         if producto['nombre'].strip() and producto['precio'] > 0 and producto['cantidad'] > 0]
+            _, subtotal, igv, total = calcular_factura(productos, puntos_basicos(IGV))
             return subtotal, igv, total
 
 
@@ -330,7 +220,7 @@ else:
                 # Validar y añadir a productos válidos
                 if nombre.strip() and precio > 0 and cantidad > 0:
                     if dato_valido(precio, cantidad):
-                        total_item = precio * cantidad
+                        total_item = a_soles(a_centimos(precio) * cantidad)
                         productos_validos.append((nombre.strip(), precio, cantidad, total_item))
 
             st.markdown("---")
@@ -394,8 +284,9 @@ else:
 
                             with col1:
                                 if st.button("✅ Sí, Guardar", type="primary", use_container_width=True):
-                                    if escribir_factura(factura_cargada['ruta'], productos_validos, subtotal, igv,
-                                                        total):
+                                    if repositorio.actualizar(factura_cargada['numero'], productos_validos,
+                                                              subtotal, igv, total,
+                                                              version=factura_cargada['version']):
                                         st.success(f"✅ **¡Cambios guardados exitosamente!**")
                                         st.balloons()
 
@@ -407,8 +298,8 @@ else:
                                         if 'numero_a_editar' in st.session_state:
                                             del st.session_state.numero_a_editar
 
-                                        # Limpiar cache
-                                        st.cache_data.clear()
+                                        # Actualizar solo esta factura en el catálogo
+                                        invalidar_factura(repositorio, factura_cargada['numero'])
 
                                         st.info("🔄 La página se actualizará en unos segundos...")
 
@@ -419,6 +310,9 @@ else:
                                 if st.button("❌ Cancelar", use_container_width=True):
                                     st.info("Operación cancelada")
 
+                except FacturaModificada:
+                    st.error("❌ **Otra sesión modificó o eliminó esta factura mientras la editabas.** "
+                             "Usa 🔄 Recargar Original para ver la versión actual.")
                 except Exception as e:
                     st.error(f"❌ **Error al guardar:** {str(e)}")
 
@@ -435,7 +329,8 @@ else:
 
         if recargar:
             # Recargar datos originales
-            productos_parseados = parsear_factura(factura_cargada['ruta'])
+            factura_cargada['version'] = repositorio.version(factura_cargada['numero'])
+            productos_parseados = repositorio.cargar(factura_cargada['numero'])
             for i in range(10):
                 if i < len(productos_parseados):
                     nombre, precio, cantidad = productos_parseados[i]
@@ -463,6 +358,40 @@ else:
                 del st.session_state.numero_a_editar
             st.switch_page("app.py")
 
+    # Cambio de precio en lote
+    st.markdown("---")
+    with st.expander("💲 Cambiar el precio de un producto en varias facturas", expanded=False):
+        producto_lote = st.text_input("Producto:", key="producto_lote",
+                                      help="Sin importar mayúsculas ni tildes")
+        precio_lote = st.number_input("Nuevo precio (S/.):", min_value=0.01, value=1.0, step=0.10,
+                                      format="%.2f", key="precio_lote")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            desde_lote = st.number_input("Desde la factura N°:", min_value=1, step=1,
+                                         value=facturas_disponibles[0]['numero'], key="desde_lote")
+        with col2:
+            hasta_lote = st.number_input("Hasta la factura N°:", min_value=1, step=1,
+                                         value=facturas_disponibles[-1]['numero'], key="hasta_lote")
+
+        numeros_lote = [f['numero'] for f in facturas_disponibles if desde_lote <= f['numero'] <= hasta_lote]
+        st.caption(f"Se revisarán {len(numeros_lote)} facturas")
+
+        if st.button("💲 Aplicar nuevo precio", use_container_width=True,
+                     disabled=not producto_lote.strip() or not numeros_lote):
+            with st.spinner("Actualizando facturas..."):
+                resumen = cambiar_precio_lote(repositorio, numeros_lote, producto_lote, precio_lote)
+            # Una sola actualización del catálogo para todo el lote
+            invalidar_facturas(repositorio, resumen['modificadas'])
+
+            if resumen['modificadas']:
+                st.success(f"✅ {len(resumen['modificadas'])} facturas actualizadas "
+                           f"de {resumen['revisadas']} revisadas")
+            else:
+                st.info(f"No hay facturas con '{producto_lote}' a otro precio en ese rango")
+            if resumen['conflictos']:
+                st.warning(f"⚠️ {resumen['conflictos']} facturas cambiaron en otra sesión y no se tocaron")
+
 # Información adicional
 st.markdown("---")
 st.info("""
@@ -1,8 +1,21 @@
 import streamlit as st
+import sys
 import os
 
+# Añadir el directorio raíz al path para importar utils
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.almacenamiento import FacturaModificada, obtener_repositorio
+from utils.catalogo import invalidar_factura, invalidar_facturas, obtener_catalogo
+from utils.dinero import formatear_centimos
+
 st.set_page_config(page_title="Eliminar Factura", page_icon="🗑️")
 
+repositorio = obtener_repositorio()
+
+# Minutos durante los que se puede deshacer una eliminación (0 si no se puede)
+minutos_deshacer = int(repositorio.ventana_deshacer // 60)
+
 # CSS personalizado
 st.markdown("""
 <style>
@@ -48,10 +61,12 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Header
-st.markdown("""
+aviso_header = (f"♻️ Se puede deshacer durante {minutos_deshacer} minutos" if minutos_deshacer
+                else "⚠️ Esta acción no se puede deshacer")
+st.markdown(f"""
 <div class="main-header">
     <h1>🗑️ ELIMINAR FACTURA</h1>
-    <p>⚠️ Esta acción no se puede deshacer</p>
+    <p>{aviso_header}</p>
 </div>
 """, unsafe_allow_html=True)
 
@@ -62,68 +77,24 @@ if st.button("🏠 Volver al inicio", type="secondary"):
 st.markdown("---")
 
 # Advertencia principal
-st.markdown("""
+if minutos_deshacer:
+    aviso_eliminacion = (f"La factura eliminada se puede recuperar durante "
+                         f"<strong>{minutos_deshacer} minutos</strong>; después se borra "
+                         f"<strong>permanentemente</strong>.")
+else:
+    aviso_eliminacion = "La eliminación de una factura es <strong>permanente e irreversible</strong>."
+
+st.markdown(f"""
 <div class="warning-container">
     <h3>⚠️ ADVERTENCIA IMPORTANTE</h3>
-    <p>La eliminación de una factura es <strong>permanente e irreversible</strong>.</p>
+    <p>{aviso_eliminacion}</p>
     <p>Asegúrate de seleccionar la factura correcta antes de proceder.</p>
 </div>
 """, unsafe_allow_html=True)
 
 
-# Función para obtener facturas disponibles
-@st.cache_data
-def obtener_facturas_disponibles():
-    try:
-        if not os.path.exists("cache"):
-            os.makedirs("cache")
-            return []
-
-        archivos = sorted(
-            [f for f in os.listdir("cache") if f.startswith("factura_") and f.endswith(".txt")]
-        )
-
-        facturas = []
-        for archivo in archivos:
-            try:
-                numero = int(archivo.split("_")[1].split(".")[0])
-                ruta = os.path.join("cache", archivo)
-                tamaño_kb = os.path.getsize(ruta) / 1024
-
-                # Leer total y fecha de la factura
-                total = "0.00"
-                fecha_mod = os.path.getmtime(ruta)
-
-                try:
-                    with open(ruta, "r", encoding="utf-8") as f:
-                        contenido = f.read()
-                        for linea in contenido.split('\n'):
-                            if 'TOTAL' in linea and 'S/.' in linea:
-                                total = linea.split('S/.')[1].strip()
-                                break
-                except:
-                    pass
-
-                facturas.append({
-                    'numero': numero,
-                    'archivo': archivo,
-                    'ruta': ruta,
-                    'tamaño_kb': tamaño_kb,
-                    'total': total,
-                    'fecha_mod': fecha_mod
-                })
-            except:
-                continue
-
-        return sorted(facturas, key=lambda x: x['numero'])
-
-    except Exception as e:
-        st.error(f"Error al obtener las facturas: {e}")
-        return []
-
-
-# Obtener facturas
-facturas_disponibles = obtener_facturas_disponibles()
+# Obtener facturas (catálogo compartido entre páginas y sesiones)
+facturas_disponibles = obtener_catalogo(repositorio)
 
 if not facturas_disponibles:
     st.markdown("""
@@ -173,7 +144,6 @@ else:
     numero_directo = st.number_input(
         "Número de factura a eliminar:",
         min_value=1,
-        max_value=999,
         step=1,
         value=numero_preseleccionado if numero_preseleccionado else 1,
         key="numero_directo"
@@ -195,7 +165,8 @@ else:
         # Mostrar información de la factura
         import datetime
 
-        fecha_modificacion = datetime.datetime.fromtimestamp(factura_seleccionada['fecha_mod'])
+        fecha_emision = datetime.datetime.fromtimestamp(factura_seleccionada['fecha_emision'])
+        fecha_modificacion = datetime.datetime.fromtimestamp(factura_seleccionada['fecha_modificacion'])
 
         st.markdown(f"""
         <div class="factura-info">
@@ -203,6 +174,7 @@ else:
             <p><strong>Número:</strong> {factura_seleccionada['numero']:03d}</p>
             <p><strong>Total:</strong> S/. {factura_seleccionada['total']}</p>
             <p><strong>Tamaño:</strong> {factura_seleccionada['tamaño_kb']:.2f} KB</p>
+            <p><strong>Fecha de emisión:</strong> {fecha_emision.strftime('%d/%m/%Y %H:%M:%S')}</p>
             <p><strong>Última modificación:</strong> {fecha_modificacion.strftime('%d/%m/%Y %H:%M:%S')}</p>
             <p><strong>Archivo:</strong> {factura_seleccionada['archivo']}</p>
         </div>
@@ -211,22 +183,29 @@ else:
         # Mostrar contenido de la factura
         with st.expander("👁️ Ver contenido de la factura", expanded=False):
             try:
-                with open(factura_seleccionada['ruta'], "r", encoding="utf-8") as f:
-                    contenido = f.read()
+                contenido = repositorio.contenido(factura_seleccionada['numero'])
                 st.code(contenido, language="text")
             except Exception as e:
                 st.error(f"Error al leer el contenido: {e}")
 
         # Zona de peligro
+        if minutos_deshacer:
+            consecuencias = f"""
+                <li>Quitará la factura de todos los listados y totales</li>
+                <li>Se puede <strong>deshacer durante {minutos_deshacer} minutos</strong> desde esta página</li>
+                <li>Después el archivo se borrará <strong>permanentemente</strong></li>"""
+        else:
+            consecuencias = """
+                <li>Eliminará <strong>permanentemente</strong> el archivo de factura</li>
+                <li><strong>No se puede deshacer</strong></li>
+                <li>Perderás todos los datos de esta factura</li>"""
+
         st.markdown(f"""
         <div class="danger-container">
             <h3>⚠️ ZONA DE PELIGRO</h3>
             <p><strong>¿Estás completamente seguro de eliminar la Factura N° {factura_seleccionada['numero']:03d}?</strong></p>
             <p>Esta acción:</p>
-            <ul>
-                <li>Eliminará <strong>permanentemente</strong> el archivo de factura</li>
-                <li><strong>No se puede deshacer</strong></li>
-                <li>Perderás todos los datos de esta factura</li>
+            <ul>{consecuencias}
             </ul>
         </div>
         """, unsafe_allow_html=True)
@@ -260,22 +239,31 @@ else:
                             key="boton_eliminar_final"
                     ):
                         try:
-                            # Realizar la eliminación
-                            os.remove(factura_seleccionada['ruta'])
+                            # Realizar la eliminación solo si la factura sigue como se mostró
+                            if not repositorio.eliminar(factura_seleccionada['numero'],
+                                                        version=factura_seleccionada['version']):
+                                raise OSError(f"No se pudo eliminar {factura_seleccionada['archivo']}")
 
                             # Mensaje de éxito
+                            if minutos_deshacer:
+                                detalle_eliminacion = (f"<p>Puedes recuperarla durante {minutos_deshacer} minutos "
+                                                       f"en <strong>♻️ Eliminadas recientemente</strong>.</p>")
+                            else:
+                                detalle_eliminacion = (f"<p>El archivo <code>{factura_seleccionada['archivo']}</code> "
+                                                       f"ya no existe.</p>")
+
                             st.markdown(f"""
                             <div class="success-container">
                                 <h3>✅ FACTURA ELIMINADA EXITOSAMENTE</h3>
-                                <p><strong>Factura N° {factura_seleccionada['numero']:03d}</strong> ha sido eliminada permanentemente.</p>
-                                <p>El archivo <code>{factura_seleccionada['archivo']}</code> ya no existe.</p>
+                                <p><strong>Factura N° {factura_seleccionada['numero']:03d}</strong> ha sido eliminada.</p>
+                                {detalle_eliminacion}
                             </div>
                             """, unsafe_allow_html=True)
 
                             st.balloons()
 
-                            # Limpiar cache
-                            st.cache_data.clear()
+                            # Actualizar solo esta factura en el catálogo
+                            invalidar_factura(repositorio, factura_seleccionada['numero'])
 
                             # Limpiar session state
                             if 'numero_a_eliminar' in st.session_state:
@@ -299,6 +287,10 @@ else:
                                 if st.button("🏠 Ir al inicio", use_container_width=True):
                                     st.switch_page("app.py")
 
+                        except FacturaModificada:
+                            invalidar_factura(repositorio, factura_seleccionada['numero'])
+                            st.error("❌ **Otra sesión modificó o eliminó esta factura.** "
+                                     "Revisa sus datos actualizados antes de eliminarla.")
                         except Exception as e:
                             st.error(f"❌ **Error al eliminar la factura:** {str(e)}")
 
@@ -320,12 +312,97 @@ else:
             if st.button("📋 Ver todas las facturas", use_container_width=True):
                 st.switch_page("pages/listar_facturas.py")
 
+    # Eliminación de varias facturas en una sola operación
+    st.markdown("---")
+    with st.expander("🧹 Eliminar varias facturas a la vez", expanded=False):
+        por_numero = {f['numero']: f for f in facturas_disponibles}
+
+        col1, col2 = st.columns(2)
+        with col1:
+            desde_lote = st.number_input("Desde la factura N°:", min_value=1, step=1,
+                                         value=facturas_disponibles[0]['numero'], key="desde_eliminar_lote")
+        with col2:
+            hasta_lote = st.number_input("Hasta la factura N°:", min_value=1, step=1,
+                                         value=facturas_disponibles[0]['numero'], key="hasta_eliminar_lote")
+
+        if st.button("➕ Agregar el rango a la selección", use_container_width=True):
+            rango = [numero for numero in por_numero if desde_lote <= numero <= hasta_lote]
+            st.session_state.seleccion_eliminar_lote = sorted(
+                set(st.session_state.get('seleccion_eliminar_lote', [])) | set(rango)
+            )
+
+        # Descartar las que ya no existen (por ejemplo, eliminadas en otra sesión)
+        if 'seleccion_eliminar_lote' in st.session_state:
+            st.session_state.seleccion_eliminar_lote = [numero for numero in st.session_state.seleccion_eliminar_lote
+                                                        if numero in por_numero]
+
+        seleccion_lote = st.multiselect(
+            "Facturas a eliminar:",
+            list(por_numero),
+            format_func=lambda numero: f"N° {numero:03d} - S/. {por_numero[numero]['total']}",
+            key="seleccion_eliminar_lote"
+        )
+
+        if seleccion_lote:
+            total_lote = sum(por_numero[numero]['total_centimos'] for numero in seleccion_lote)
+            st.warning(f"⚠️ Se eliminarán {len(seleccion_lote)} facturas por un total de "
+                       f"S/. {formatear_centimos(total_lote)}")
+
+        confirmar_lote = st.checkbox(f"✅ Sí, eliminar las {len(seleccion_lote)} facturas seleccionadas",
+                                     key="confirmar_eliminar_lote", disabled=not seleccion_lote)
+
+        if st.button("🗑️ Eliminar seleccionadas", type="primary", use_container_width=True,
+                     disabled=not (seleccion_lote and confirmar_lote)):
+            with st.spinner("Eliminando facturas..."):
+                # Solo las que siguen como se mostraron
+                eliminadas_lote = repositorio.eliminar_lote(
+                    seleccion_lote, versiones={numero: por_numero[numero]['version'] for numero in seleccion_lote}
+                )
+            # Una sola actualización del catálogo para todo el lote
+            invalidar_facturas(repositorio, seleccion_lote)
+
+            st.success(f"✅ {len(eliminadas_lote)} facturas eliminadas")
+            if len(eliminadas_lote) < len(seleccion_lote):
+                st.warning(f"⚠️ {len(seleccion_lote) - len(eliminadas_lote)} facturas cambiaron en otra sesión "
+                           f"y no se eliminaron")
+
+# Facturas eliminadas que todavía se pueden recuperar
+eliminadas = repositorio.eliminadas()
+if eliminadas:
+    import datetime
+
+    st.markdown("---")
+    st.subheader("♻️ Eliminadas recientemente")
+
+    for numero, eliminada_en in eliminadas:
+        vence = eliminada_en + repositorio.ventana_deshacer
+        restante = max(0, int((vence - datetime.datetime.now().timestamp()) // 60))
+        col1, col2 = st.columns([3, 1])
+
+        with col1:
+            st.write(f"📄 Factura N° {numero:03d} - eliminada el "
+                     f"{datetime.datetime.fromtimestamp(eliminada_en).strftime('%d/%m/%Y %H:%M:%S')} "
+                     f"(quedan {restante} min)")
+
+        with col2:
+            if st.button("↩️ Deshacer", key=f"deshacer_{numero}", use_container_width=True):
+                if repositorio.deshacer_eliminacion(numero):
+                    invalidar_factura(repositorio, numero)
+                    st.rerun()
+                else:
+                    st.error(f"❌ La factura N° {numero:03d} ya no se puede recuperar")
+
 # Información de ayuda
+if minutos_deshacer:
+    ayuda_eliminacion = f"Las facturas eliminadas se pueden recuperar durante {minutos_deshacer} minutos"
+else:
+    ayuda_eliminacion = "La eliminación es irreversible - no hay papelera de reciclaje"
+
 st.markdown("---")
-st.info("""
+st.info(f"""
 💡 **Información importante:**
 - Solo se pueden eliminar facturas que existan en el sistema
-- La eliminación es irreversible - no hay papelera de reciclaje
+- {ayuda_eliminacion}
 - Se recomienda hacer una copia de respaldo antes de eliminar facturas importantes
 - Puedes ver el contenido de la factura antes de eliminarla para confirmar
 """)
@@ -336,7 +413,7 @@ if facturas_disponibles:
     st.subheader("📊 Estadísticas del Sistema")
 
     total_facturas = len(facturas_disponibles)
-    total_monto = sum(float(f['total']) for f in facturas_disponibles)
+    total_monto = sum(f['total_centimos'] for f in facturas_disponibles)
     tamaño_total = sum(f['tamaño_kb'] for f in facturas_disponibles)
 
     col1, col2, col3 = st.columns(3)
@@ -345,7 +422,7 @@ if facturas_disponibles:
         st.metric("📄 Facturas totales", total_facturas)
 
     with col2:
-        st.metric("💰 Monto total", f"S/. {total_monto:.2f}")
+        st.metric("💰 Monto total", f"S/. {formatear_centimos(total_monto)}")
 
     with col3:
         st.metric("💾 Espacio usado", f"{tamaño_total:.2f} KB")
\ No newline at end of file
@@ -5,13 +5,17 @@ import os
 # Añadir el directorio raíz al path para importar utils
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from utils.archivo import guardar_factura
+from utils.almacenamiento import obtener_repositorio
+from utils.catalogo import invalidar_factura
+from utils.dinero import a_centimos, a_soles, calcular_factura, puntos_basicos
 from utils.validaciones import dato_valido
 
 IGV = 0.18
 
 st.set_page_config(page_title="Generar Factura", page_icon="📝")
 
+repositorio = obtener_repositorio()
+
 # CSS personalizado
 st.markdown("""
 <style>
@@ -68,13 +72,10 @@ if 'productos' not in st.session_state:
 
 # Función para calcular totales
 def calcular_totales():
-    subtotal = 0.0
-    for producto in st.session_state.productos:
-        if producto['nombre'].strip() and producto['precio'] > 0 and producto['cantidad'] > 0:
-            subtotal += producto['precio'] * producto['cantidad']
-
-    igv = subtotal * IGV
-    total = subtotal + igv
+    productos = [(producto['nombre'], producto['precio'], producto['cantidad'])
+                 for producto in st.session_state.productos
+                 if producto['nombre'].strip() and producto['precio'] > 0 and producto['cantidad'] > 0]
+    _, subtotal, igv, total = calcular_factura(productos, puntos_basicos(IGV))
     return subtotal, igv, total
 
 
@@ -127,7 +128,7 @@ with st.form("formulario_factura", clear_on_submit=False):
         # Validar y añadir a productos válidos
         if nombre.strip() and precio > 0 and cantidad > 0:
             if dato_valido(precio, cantidad):
-                total_item = precio * cantidad
+                total_item = a_soles(a_centimos(precio) * cantidad)
                 productos_validos.append((nombre.strip(), precio, cantidad, total_item))
 
     st.markdown("---")
@@ -191,7 +192,10 @@ if guardar:
                     break
             else:
                 # Guardar la factura
-                guardar_factura(productos_validos, subtotal, igv, total)
+                numero = repositorio.guardar(productos_validos, subtotal, igv, total)
+                if numero is None:
+                    raise OSError("No se pudo guardar la factura")
+                invalidar_factura(repositorio, numero)
 
                 # Mostrar resumen de éxito
                 st.success("✅ **¡Factura generada exitosamente!**")
@@ -0,0 +1,124 @@
+import streamlit as st
+import sys
+import os
+import datetime
+
+import pandas as pd
+
+# Añadir el directorio raíz al path para importar utils
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.almacenamiento import obtener_repositorio
+from utils.reportes import productos_mas_vendidos, ventas_por_periodo
+
+st.set_page_config(page_title="Reportes", page_icon="📈")
+
+repositorio = obtener_repositorio()
+
+# CSS personalizado
+st.markdown("""
+<style>
+    .main-header {
+        text-align: center;
+        padding: 1.5rem;
+        background: linear-gradient(135deg, #e67e22 0%, #d35400 100%);
+        color: white;
+        border-radius: 10px;
+        margin-bottom: 2rem;
+    }
+</style>
+""", unsafe_allow_html=True)
+
+# Header
+st.markdown("""
+<div class="main-header">
+    <h1>📈 REPORTES DE VENTAS</h1>
+    <p>Ventas, IGV y productos más vendidos por periodo</p>
+</div>
+""", unsafe_allow_html=True)
+
+# Botón de regreso
+if st.button("🏠 Volver al inicio", type="secondary"):
+    st.switch_page("app.py")
+
+st.markdown("---")
+
+AGRUPACIONES = {
+    "Día": "dia",
+    "Semana": "semana",
+    "Mes": "mes"
+}
+
+hoy = datetime.date.today()
+
+col1, col2 = st.columns([2, 1])
+
+with col1:
+    rango = st.date_input("Periodo:", value=(hoy - datetime.timedelta(days=29), hoy), key="rango_reportes")
+
+with col2:
+    agrupacion = st.selectbox("Agrupar por", list(AGRUPACIONES), key="agrupacion_reportes")
+
+if not (isinstance(rango, (tuple, list)) and len(rango) == 2):
+    st.info("📅 Selecciona la fecha de inicio y la de fin del periodo")
+    st.stop()
+
+desde, hasta = rango
+
+try:
+    ventas = ventas_por_periodo(repositorio, desde, hasta, AGRUPACIONES[agrupacion])
+    productos = productos_mas_vendidos(repositorio, desde, hasta, limite=10)
+except Exception as e:
+    st.error(f"❌ Error al calcular los reportes: {e}")
+    st.stop()
+
+if not ventas:
+    st.warning("📭 No hay facturas emitidas en el periodo seleccionado")
+    st.stop()
+
+# Resumen del periodo
+col1, col2, col3 = st.columns(3)
+
+with col1:
+    st.metric("📄 Facturas", sum(fila['cantidad'] for fila in ventas))
+
+with col2:
+    st.metric("💰 Ventas", f"S/. {sum(fila['total'] for fila in ventas):.2f}")
+
+with col3:
+    st.metric("🧾 IGV", f"S/. {sum(fila['igv'] for fila in ventas):.2f}")
+
+datos = pd.DataFrame(ventas).set_index('periodo')
+
+st.subheader(f"💰 Ventas por {agrupacion.lower()}")
+st.bar_chart(datos[['total']], y_label="S/.")
+
+st.subheader(f"🧾 IGV por {agrupacion.lower()}")
+st.line_chart(datos[['igv']], y_label="S/.")
+
+with st.expander("📋 Ver detalle", expanded=False):
+    st.dataframe(
+        datos.rename(columns={'cantidad': 'Facturas', 'subtotal': 'Subtotal S/.', 'igv': 'IGV S/.',
+                              'total': 'Total S/.'}),
+        use_container_width=True
+    )
+
+st.subheader("🏆 Productos más vendidos")
+if productos:
+    tabla_productos = pd.DataFrame(productos).set_index('nombre')
+    st.bar_chart(tabla_productos[['total']], y_label="S/.", horizontal=True)
+    st.dataframe(
+        tabla_productos.rename(columns={'cantidad': 'Unidades', 'total': 'Total S/.'}),
+        use_container_width=True
+    )
+else:
+    st.info("No hay productos vendidos en el periodo")
+
+# Información adicional
+st.markdown("---")
+st.info("""
+💡 **Sobre los reportes:**
+- Los totales por día y por mes se actualizan con cada factura guardada, editada o eliminada
+- Las semanas se muestran por su lunes
+- Los productos se agrupan por nombre, sin importar tildes ni mayúsculas
+""")
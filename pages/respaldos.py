@@ -0,0 +1,117 @@
+import streamlit as st
+import sys
+import os
+from datetime import datetime
+
+# Añadir el directorio raíz al path para importar utils
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.almacenamiento import obtener_repositorio
+from utils.backup import estado_backup, iniciar_backup, leer_manifiesto, listar_backups, restaurar_backup
+
+st.set_page_config(page_title="Respaldos", page_icon="💾")
+
+repositorio = obtener_repositorio()
+
+# CSS personalizado
+st.markdown("""
+<style>
+    .main-header {
+        text-align: center;
+        padding: 1.5rem;
+        background: linear-gradient(135deg, #34495e 0%, #2c3e50 100%);
+        color: white;
+        border-radius: 10px;
+        margin-bottom: 2rem;
+    }
+</style>
+""", unsafe_allow_html=True)
+
+# Header
+st.markdown("""
+<div class="main-header">
+    <h1>💾 RESPALDOS</h1>
+    <p>Copias incrementales de todas las facturas y restauración</p>
+</div>
+""", unsafe_allow_html=True)
+
+# Botón de regreso
+if st.button("🏠 Volver al inicio", type="secondary"):
+    st.switch_page("app.py")
+
+st.markdown("---")
+
+if repositorio.nombre != "texto":
+    st.warning(f"⚠️ Los respaldos copian las facturas de texto; el almacenamiento actual es "
+               f"'{repositorio.nombre}'.")
+
+# Crear un respaldo sin bloquear la página
+estado = estado_backup()
+
+col1, col2 = st.columns(2)
+
+with col1:
+    if st.button("💾 Crear respaldo", type="primary", disabled=estado['en_curso'], use_container_width=True):
+        iniciar_backup()
+        st.rerun()
+
+with col2:
+    if st.button("🔄 Actualizar estado", use_container_width=True):
+        st.rerun()
+
+if estado['en_curso']:
+    st.info("⏳ Creando respaldo en segundo plano... puedes seguir usando el sistema")
+elif estado['error']:
+    st.error(f"❌ {estado['error']}")
+elif estado['resultado']:
+    st.success(f"✅ Último respaldo: {os.path.basename(estado['resultado'])}")
+
+st.markdown("---")
+st.subheader("📂 Respaldos disponibles")
+
+respaldos = list(reversed(listar_backups()))
+
+if not respaldos:
+    st.info("📭 Todavía no hay respaldos")
+    st.stop()
+
+filas = []
+for ruta in respaldos:
+    try:
+        manifiesto = leer_manifiesto(ruta)
+    except Exception as e:
+        st.error(f"❌ No se pudo leer {os.path.basename(ruta)}: {e}")
+        continue
+    filas.append({
+        "Respaldo": os.path.basename(ruta),
+        "Fecha": datetime.fromtimestamp(manifiesto['creado']).strftime('%d/%m/%Y %H:%M:%S'),
+        "Facturas": len(manifiesto['facturas']),
+        "Tamaño KB": round(os.path.getsize(ruta) / 1024, 2)
+    })
+
+st.dataframe(filas, hide_index=True, use_container_width=True)
+
+# Restaurar
+st.subheader("♻️ Restaurar")
+
+seleccion = st.selectbox("Selecciona un respaldo:", respaldos, format_func=os.path.basename, key="respaldo_elegido")
+
+st.warning("⚠️ Las facturas volverán a quedar como estaban en ese respaldo y las creadas después se eliminarán.")
+confirmar = st.checkbox("Entiendo que esta acción reemplaza las facturas actuales", key="confirmar_restaurar")
+
+if st.button("♻️ Restaurar respaldo", disabled=not confirmar or estado['en_curso'], use_container_width=True):
+    with st.spinner("Restaurando facturas..."):
+        restauradas = restaurar_backup(seleccion)
+    if restauradas is None:
+        st.error("❌ No se pudo restaurar el respaldo")
+    else:
+        st.success(f"✅ Respaldo restaurado: {restauradas} facturas reescritas")
+
+# Información adicional
+st.markdown("---")
+st.info("""
+💡 **Sobre los respaldos:**
+- Cada respaldo guarda el estado de todas las facturas, pero solo copia las que cambiaron
+- Se puede restaurar cualquier respaldo; los anteriores siguen siendo necesarios para los siguientes
+- También se pueden crear desde la consola con `python -m utils.backup`
+""")
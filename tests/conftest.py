@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def carpeta_temporal(tmp_path, monkeypatch):
+    # Todas las rutas del sistema son relativas (cache/, backups/): cada
+    # prueba corre en una carpeta vacía propia
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
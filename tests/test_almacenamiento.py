@@ -0,0 +1,129 @@
+import os
+
+import pytest
+
+from utils.almacenamiento import RepositorioBinario, RepositorioSQLite, RepositorioTexto
+from utils.archivo import FacturaModificada
+from utils.dinero import calcular_factura
+
+PEDIDO = [("Ceviche", 25.5, 2), ("Chicha", 4.0, 3)]
+OTRO_PEDIDO = [("Lomo saltado", 32.0, 1)]
+
+
+@pytest.fixture(params=["texto", "sqlite", "binario"])
+def repositorio(request):
+    if request.param == "texto":
+        return RepositorioTexto()
+    if request.param == "sqlite":
+        return RepositorioSQLite(os.path.join("cache", "facturas.db"))
+    return RepositorioBinario()
+
+
+def _guardar(repositorio, pedido=PEDIDO):
+    return repositorio.guardar(*calcular_factura(pedido))
+
+
+def _cambio(numero, pedido, version):
+    return (numero, *calcular_factura(pedido), version)
+
+
+def test_guardar_y_cargar(repositorio):
+    numero = _guardar(repositorio)
+
+    assert repositorio.cargar(numero) == PEDIDO
+    info = repositorio.obtener_info(numero)
+    assert (info['subtotal'], info['igv'], info['total'], info['total_centimos']) == ("63.00", "11.34", "74.34", 7434)
+    assert [f['numero'] for f in repositorio.listar()] == [numero]
+    assert repositorio.version(numero) is not None
+
+
+def test_numeros_consecutivos(repositorio):
+    primero = _guardar(repositorio)
+    reservados = list(repositorio.reservar_numeros(3))
+
+    assert reservados == [primero + 1, primero + 2, primero + 3]
+    assert _guardar(repositorio) == primero + 4
+
+
+def test_editar(repositorio):
+    numero = _guardar(repositorio)
+    version = repositorio.version(numero)
+
+    assert repositorio.actualizar(numero, *calcular_factura(OTRO_PEDIDO), version=version)
+
+    assert repositorio.cargar(numero) == OTRO_PEDIDO
+    assert repositorio.obtener_info(numero)['total'] == "37.76"
+    assert repositorio.version(numero) != version
+
+
+def test_editar_version_vieja(repositorio):
+    numero = _guardar(repositorio)
+    vieja = repositorio.version(numero)
+    repositorio.actualizar(numero, *calcular_factura(OTRO_PEDIDO), version=vieja)
+
+    # Otra sesión que leyó la versión anterior no pisa el cambio
+    with pytest.raises(FacturaModificada):
+        repositorio.actualizar(numero, *calcular_factura(PEDIDO), version=vieja)
+    with pytest.raises(FacturaModificada):
+        repositorio.eliminar(numero, version=vieja)
+
+    assert repositorio.cargar(numero) == OTRO_PEDIDO
+
+
+def test_editar_factura_eliminada(repositorio):
+    numero = _guardar(repositorio)
+    version = repositorio.version(numero)
+    assert repositorio.eliminar(numero)
+
+    with pytest.raises(FacturaModificada):
+        repositorio.actualizar(numero, *calcular_factura(OTRO_PEDIDO), version=version)
+    assert not repositorio.actualizar(numero, *calcular_factura(OTRO_PEDIDO))
+
+
+def test_eliminar(repositorio):
+    numero = _guardar(repositorio)
+    otra = _guardar(repositorio, OTRO_PEDIDO)
+
+    assert repositorio.eliminar(numero, version=repositorio.version(numero))
+
+    assert repositorio.obtener_info(numero) is None
+    assert repositorio.version(numero) is None
+    assert [f['numero'] for f in repositorio.listar()] == [otra]
+    assert repositorio.agregados()['cantidad'] == 1
+
+
+def test_deshacer_eliminacion(repositorio):
+    numero = _guardar(repositorio)
+    repositorio.eliminar(numero)
+
+    if repositorio.ventana_deshacer == 0:
+        # Backends que borran en el momento: no hay nada que recuperar
+        assert repositorio.eliminadas() == []
+        assert not repositorio.deshacer_eliminacion(numero)
+        return
+
+    assert [n for n, _ in repositorio.eliminadas()] == [numero]
+    assert repositorio.deshacer_eliminacion(numero)
+    assert repositorio.cargar(numero) == PEDIDO
+    assert [f['numero'] for f in repositorio.listar()] == [numero]
+    assert repositorio.eliminadas() == []
+    assert not repositorio.deshacer_eliminacion(numero)
+
+
+def test_lotes(repositorio):
+    numeros = list(repositorio.reservar_numeros(3))
+    facturas = [(numero, *calcular_factura(PEDIDO)) for numero in numeros]
+    assert repositorio.guardar_lote(facturas) == numeros
+
+    versiones = {numero: repositorio.version(numero) for numero in numeros}
+    repositorio.actualizar(numeros[1], *calcular_factura(PEDIDO))
+
+    # La factura que cambió desde que se leyó se salta; las demás se actualizan
+    cambios = [_cambio(numero, OTRO_PEDIDO, versiones[numero]) for numero in numeros]
+    assert repositorio.actualizar_lote(cambios) == [numeros[0], numeros[2]]
+    assert [repositorio.cargar(numero) for numero in numeros] == [OTRO_PEDIDO, PEDIDO, OTRO_PEDIDO]
+
+    versiones = {numero: repositorio.version(numero) for numero in numeros}
+    versiones[numeros[0]] = -1
+    assert repositorio.eliminar_lote(numeros, versiones) == numeros[1:]
+    assert [f['numero'] for f in repositorio.listar()] == [numeros[0]]
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from utils import api, servicio
+from utils.almacenamiento import obtener_repositorio
+
+PEDIDOS = [[("Ceviche", 25.0, 1)], [("Lomo saltado", 30.0, 2)], [("Chicha", 4.5, 3)]]
+
+
+async def _crear_juntas(pedidos):
+    return await asyncio.gather(*(api.crear_agrupada(productos) for productos in pedidos),
+                                return_exceptions=True)
+
+
+def test_error_despues_de_escribir_no_duplica(monkeypatch):
+    def fallar(*args):
+        raise OSError("disco lleno")
+
+    # El catálogo se actualiza después de guardar el lote
+    monkeypatch.setattr(servicio, "invalidar_facturas", fallar)
+    monkeypatch.setattr(servicio, "invalidar_factura", fallar)
+
+    resultados = asyncio.run(_crear_juntas(PEDIDOS))
+
+    assert [resultado['numero'] for resultado in resultados] == [1, 2, 3]
+    assert len(obtener_repositorio().listar()) == 3
+
+
+def test_error_antes_de_escribir_se_reintenta_por_separado(monkeypatch):
+    repositorio = obtener_repositorio()
+    reservar = repositorio.reservar_numeros
+    llamadas = []
+
+    def reservar_una_vez(cantidad=1):
+        llamadas.append(cantidad)
+        if cantidad > 1:
+            raise OSError("secuencia ocupada")
+        return reservar(cantidad)
+
+    monkeypatch.setattr(repositorio, "reservar_numeros", reservar_una_vez)
+
+    resultados = asyncio.run(_crear_juntas(PEDIDOS))
+
+    assert llamadas == [3, 1, 1, 1]
+    assert sorted(resultado['numero'] for resultado in resultados) == [1, 2, 3]
+    assert len(repositorio.listar()) == 3
+
+
+def test_lote_interrumpido_informa_las_guardadas(monkeypatch):
+    repositorio = obtener_repositorio()
+    guardar_lote = repositorio.guardar_lote
+
+    def guardar_la_primera(facturas, fechas=None):
+        guardar_lote(facturas[:1], fechas=fechas)
+        raise OSError("corte")
+
+    monkeypatch.setattr(repositorio, "guardar_lote", guardar_la_primera)
+
+    with pytest.raises(servicio.LoteInterrumpido) as error:
+        servicio.crear_facturas(PEDIDOS + [[]])
+
+    assert error.value.resultados[0] == {'numero': 1}
+    assert error.value.fallidas == [1, 2]
+    assert error.value.resultados[3]['errores']
@@ -0,0 +1,85 @@
+import io
+import os
+import time
+
+from utils import archivo, bitacora
+from utils.almacenamiento import RepositorioTexto
+from utils.dinero import calcular_factura
+
+PEDIDO = [("Ceviche", 25.5, 2), ("Chicha", 4.0, 3)]
+OTRO_PEDIDO = [("Lomo saltado", 32.0, 1)]
+
+
+def _guardar_varias(repositorio, cantidad):
+    numeros = list(repositorio.reservar_numeros(cantidad))
+    return repositorio.guardar_lote([(numero, *calcular_factura(PEDIDO)) for numero in numeros])
+
+
+def _cortar_ultima_linea():
+    # Una línea que quedó a medio escribir, sin salto de línea ni checksum válido
+    with open(bitacora.ARCHIVO_BITACORA, "ab") as f:
+        f.write(b'deadbeef {"seq": 99')
+
+
+def test_recuperar_escritura_cortada():
+    repositorio = RepositorioTexto()
+    editada, eliminada = _guardar_varias(repositorio, 2)
+    nueva = editada + 10
+
+    # Operaciones anotadas en la bitácora que no llegaron a aplicarse
+    contenido = archivo.formatear_factura(*calcular_factura(OTRO_PEDIDO), 1700000000)
+    bitacora.registrar([{'op': "editar", 'numero': editada, 'contenido': contenido}])
+    bitacora.registrar([{'op': "eliminar", 'numero': eliminada}])
+    bitacora.registrar([{'op': "guardar", 'numero': nueva, 'contenido': contenido}])
+    _cortar_ultima_linea()
+
+    assert archivo.recuperar_bitacora() == 3
+
+    assert repositorio.cargar(editada) == OTRO_PEDIDO
+    assert repositorio.obtener_info(eliminada) is None
+    assert repositorio.obtener_info(nueva)['fecha_emision'] == 1700000000
+    assert [f['numero'] for f in repositorio.listar()] == [editada, nueva]
+    # Lo aplicado ya no vuelve a aplicarse
+    assert archivo.recuperar_bitacora() == 0
+
+    # La siguiente escritura reemplaza la línea cortada
+    repositorio.guardar(*calcular_factura(PEDIDO))
+    assert all(registro is not None for _, registro in bitacora.registros())
+
+
+def test_recuperar_eliminacion_y_deshacer_cortados():
+    repositorio = RepositorioTexto()
+    marcada, recuperada = _guardar_varias(repositorio, 2)
+    assert repositorio.eliminar(recuperada)
+
+    bitacora.registrar([{'op': "marcar", 'numero': marcada, 'contenido': f"{time.time()}\n"}])
+    bitacora.registrar([{'op': "deshacer", 'numero': recuperada}])
+
+    assert archivo.recuperar_bitacora() == 2
+
+    assert [f['numero'] for f in repositorio.listar()] == [recuperada]
+    assert [numero for numero, _ in repositorio.eliminadas()] == [marcada]
+    assert os.path.exists(archivo.ruta_lapida(marcada))
+    assert not os.path.exists(archivo.ruta_lapida(recuperada))
+
+
+def test_replica(tmp_path, monkeypatch):
+    repositorio = RepositorioTexto()
+    editada, eliminada, marcada = _guardar_varias(repositorio, 3)
+    repositorio.actualizar(editada, *calcular_factura(OTRO_PEDIDO))
+    archivo.eliminar_factura(eliminada)
+    repositorio.eliminar(marcada)
+
+    esperado = {info['numero']: repositorio.contenido(info['numero']) for info in repositorio.listar()}
+    exportado = b"".join(bitacora.exportar(0))
+
+    replica = tmp_path / "replica"
+    replica.mkdir()
+    monkeypatch.chdir(replica)
+    assert archivo.aplicar_replica(io.BytesIO(exportado)) > 0
+
+    copia = RepositorioTexto()
+    assert {info['numero']: copia.contenido(info['numero']) for info in copia.listar()} == esperado
+    assert [numero for numero, _ in copia.eliminadas()] == [marcada]
+    # Volver a aplicar lo mismo no repite nada
+    assert archivo.aplicar_replica(io.BytesIO(exportado)) == 0
@@ -0,0 +1,59 @@
+from decimal import Decimal
+
+import pytest
+
+from utils.dinero import (a_centimos, calcular_factura, calcular_facturas_lote, calcular_igv_centimos,
+                          formatear_centimos)
+
+
+@pytest.mark.parametrize("subtotal, igv", [
+    (25, 5),      # 4.5 céntimos: la mitad sube (con redondeo bancario serían 4)
+    (75, 14),     # 13.5
+    (125, 23),    # 22.5
+    (24, 4),      # 4.32
+    (26, 5),      # 4.68
+    (0, 0),
+])
+def test_igv_redondea_la_mitad_hacia_arriba(subtotal, igv):
+    assert calcular_igv_centimos(subtotal) == igv
+
+
+def test_float_y_texto_dan_los_mismos_centimos():
+    # Todo monto de 2 decimales da lo mismo como float o como texto, aunque el
+    # float no sea exacto (19.99 * 100 == 1998.9999999999998)
+    for centimos in range(0, 1000001, 7):
+        texto = formatear_centimos(centimos)
+        assert a_centimos(float(texto)) == a_centimos(texto) == a_centimos(Decimal(texto)) == centimos
+
+
+def test_texto_se_convierte_exacto():
+    assert a_centimos(" 25.50 ") == 2550
+    assert a_centimos("0.1") + a_centimos("0.2") == a_centimos("0.3")
+    assert a_centimos(0.1 + 0.2) == 30
+
+
+def test_texto_invalido():
+    with pytest.raises(ValueError):
+        a_centimos("veinte")
+
+
+def test_factura_con_float_o_texto():
+    con_float = calcular_factura([("Ceviche", 19.99, 3), ("Chicha", 0.1, 7)])
+    con_texto = calcular_factura([("Ceviche", "19.99", 3), ("Chicha", "0.1", 7)])
+
+    assert con_float[1:] == con_texto[1:] == (60.67, 10.92, 71.59)
+    assert [producto[3] for producto in con_float[0]] == [59.97, 0.7]
+
+
+def test_lote_igual_a_factura():
+    pedidos = [[(19.99, 3), (0.1, 7)], [(1.15, 1)], [(9999.99, 999), (0.01, 1)]]
+    precios = [precio for pedido in pedidos for precio, _ in pedido]
+    cantidades = [cantidad for pedido in pedidos for _, cantidad in pedido]
+    grupos = [indice for indice, pedido in enumerate(pedidos) for _ in pedido]
+
+    _, subtotales, igv, totales = calcular_facturas_lote(precios, cantidades, grupos)
+
+    for indice, pedido in enumerate(pedidos):
+        _, subtotal, igv_factura, total = calcular_factura([("P", precio, cantidad) for precio, cantidad in pedido])
+        assert (subtotales[indice], igv[indice], totales[indice]) == (
+            a_centimos(subtotal), a_centimos(igv_factura), a_centimos(total))
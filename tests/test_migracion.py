@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from utils.almacenamiento import RepositorioBinario, RepositorioSQLite, RepositorioTexto, migrar_facturas
+from utils.dinero import calcular_factura
+
+# 2024-03-14 12:00:00 y 2023-12-31 23:59:59 (hora local), al segundo como en el texto
+FECHAS = [1710417600, 1704067199]
+
+
+def _repositorio(nombre):
+    if nombre == "texto":
+        return RepositorioTexto()
+    if nombre == "sqlite":
+        return RepositorioSQLite(os.path.join("cache", "facturas.db"))
+    return RepositorioBinario()
+
+
+def _facturas(repositorio):
+    productos, subtotal, igv, total = calcular_factura([("Ceviche", 25.5, 2), ("Chicha", 4.0, 3)])
+    numeros = list(repositorio.reservar_numeros(2))
+    facturas = [
+        (numeros[0], productos, subtotal, igv, total),
+        # Montos guardados que no coinciden con un recálculo (por ejemplo, con
+        # otra regla de redondeo): la migración debe copiarlos tal cual
+        (numeros[1], productos, subtotal, igv + 0.01, total + 0.01),
+    ]
+    assert repositorio.guardar_lote(facturas, fechas=dict(zip(numeros, FECHAS))) == numeros
+    return numeros
+
+
+def _resumen(repositorio):
+    return [(info['numero'], int(info['fecha_emision']), info['subtotal'], info['igv'], info['total'],
+             repositorio.cargar(info['numero'])) for info in repositorio.listar()]
+
+
+@pytest.mark.parametrize("origen, destino", [("texto", "sqlite"), ("sqlite", "binario"), ("binario", "texto")])
+def test_migrar_conserva_fechas_y_montos(origen, destino):
+    origen, destino = _repositorio(origen), _repositorio(destino)
+    _facturas(origen)
+
+    assert migrar_facturas(origen, destino) == 2
+
+    esperado = _resumen(origen)
+    assert [fecha for _, fecha, *_ in esperado] == FECHAS
+    assert _resumen(destino) == esperado
+
+
+def test_ida_y_vuelta_por_todos_los_backends():
+    texto = _repositorio("texto")
+    _facturas(texto)
+    original = _resumen(texto)
+
+    sqlite = _repositorio("sqlite")
+    binario = _repositorio("binario")
+    migrar_facturas(texto, sqlite)
+    migrar_facturas(sqlite, binario)
+
+    assert _resumen(binario) == original
@@ -0,0 +1,54 @@
+import itertools
+
+import pytest
+
+from utils.validaciones import dato_valido, validar_producto_completo
+from utils.validaciones_lote import mensajes_error, validar_productos_lote
+
+NOMBRES = ["Ceviche", "", "  ", "A", "x" * 51, "123", "١٢٣", None, float("nan"), 5]
+PRECIOS = [25.5, 1, 0, -3, 10000, 10000.01, None, float("nan"), float("inf"), True, False, "25", [1]]
+CANTIDADES = [2, 1, 0, -1, 999, 1000, 2.0, None, float("nan"), True, "3"]
+
+
+def _columnas(filas):
+    return {
+        'nombre': [fila[0] for fila in filas],
+        'precio': [fila[1] for fila in filas],
+        'cantidad': [fila[2] for fila in filas],
+    }
+
+
+def test_lote_igual_a_dato_valido():
+    # Con un nombre válido, la fila es válida solo si dato_valido acepta precio y cantidad
+    filas = [("Ceviche", precio, cantidad) for precio, cantidad in itertools.product(PRECIOS, CANTIDADES)]
+    validos, _ = validar_productos_lote(_columnas(filas))
+
+    for fila, valido in zip(filas, validos):
+        assert bool(valido) == dato_valido(fila[1], fila[2]), fila
+
+
+def test_lote_igual_a_validar_producto_completo():
+    filas = list(itertools.product(NOMBRES, PRECIOS, CANTIDADES))
+    validos, codigos = validar_productos_lote(_columnas(filas))
+
+    for fila, valido, codigo in zip(filas, validos, codigos):
+        esperado = validar_producto_completo(*fila)
+        assert mensajes_error(codigo) == esperado['errores'], fila
+        assert bool(valido) == esperado['valido'], fila
+
+
+@pytest.mark.parametrize("columna", ['precio', 'cantidad'])
+def test_none_en_columna_no_cambia_las_demas_filas(columna):
+    # pandas haría float toda la columna y la cantidad 1 dejaría de ser entera
+    datos = {'nombre': ["Ceviche", "Lomo"], 'precio': [10, 12], 'cantidad': [1, 2]}
+    datos[columna] = [datos[columna][0], None]
+
+    validos, _ = validar_productos_lote(datos)
+
+    assert list(validos) == [True, False]
+
+
+def test_lote_vacio():
+    validos, codigos = validar_productos_lote({'nombre': [], 'precio': [], 'cantidad': []})
+
+    assert len(validos) == 0 and len(codigos) == 0
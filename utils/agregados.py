@@ -0,0 +1,165 @@
+import json
+import os
+
+from utils.bloqueo import bloquear_archivo
+from utils.dinero import a_soles
+from utils.escritura import escribir_atomico
+
+CARPETA = "cache"
+ARCHIVO_AGREGADOS = os.path.join(CARPETA, "agregados.json")
+ARCHIVO_LOCK = os.path.join(CARPETA, "agregados.lock")
+
+
+# Los montos se acumulan en céntimos enteros para que las sumas no se desvíen
+def _vacios():
+    return {
+        'cantidad': 0,
+        'subtotal_centimos': 0,
+        'igv_centimos': 0,
+        'total_centimos': 0,
+        'minimo_centimos': None,
+        'maximo_centimos': None
+    }
+
+
+def _calcular(entradas):
+    agregados = _vacios()
+    for entrada in entradas:
+        _sumar(agregados, entrada, 1)
+    _recalcular_extremos(agregados, entradas)
+    return agregados
+
+
+def _sumar(agregados, entrada, signo):
+    agregados['cantidad'] += signo
+    for campo in ('subtotal_centimos', 'igv_centimos', 'total_centimos'):
+        agregados[campo] += signo * entrada[campo]
+
+
+def _recalcular_extremos(agregados, entradas):
+    totales = [entrada['total_centimos'] for entrada in entradas]
+    agregados['minimo_centimos'] = min(totales) if totales else None
+    agregados['maximo_centimos'] = max(totales) if totales else None
+
+
+def _en_soles(agregados):
+    cantidad = agregados['cantidad']
+    total = agregados['total_centimos']
+    return {
+        'cantidad': cantidad,
+        'subtotal': a_soles(agregados['subtotal_centimos']),
+        'igv': a_soles(agregados['igv_centimos']),
+        'total': a_soles(total),
+        'minimo': a_soles(agregados['minimo_centimos']) if agregados['minimo_centimos'] is not None else None,
+        'maximo': a_soles(agregados['maximo_centimos']) if agregados['maximo_centimos'] is not None else None,
+        'promedio': a_soles(total) / cantidad if cantidad > 0 else 0.0
+    }
+
+
+def _leer():
+    try:
+        with open(ARCHIVO_AGREGADOS, "r", encoding="utf-8") as f:
+            agregados = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    # Un archivo con otro formato se trata como si no existiera
+    return agregados if set(agregados) == set(_vacios()) else None
+
+
+def _escribir(agregados):
+    if not os.path.exists(CARPETA):
+        os.makedirs(CARPETA)
+
+    escribir_atomico(ARCHIVO_AGREGADOS, json.dumps(agregados))
+
+
+def aplicar_cambios(cambios, entradas_actuales):
+    """
+    Actualiza los agregados con los cambios hechos al índice de facturas.
+
+    Args:
+        cambios: Lista de tuplas (anterior, nueva) con las entradas del índice
+            antes y después de cada cambio; None indica que no existía o que
+            fue eliminada
+        entradas_actuales: Función que devuelve todas las entradas vigentes;
+            solo se usa si hay que recalcular el mínimo o el máximo
+    """
+    if not cambios:
+        return
+
+    with bloquear_archivo(ARCHIVO_LOCK):
+        agregados = _leer()
+        if agregados is None:
+            # Todavía no se calcularon; obtener_agregados los reconstruye completos
+            return
+
+        recalcular_extremos = False
+        for anterior, nueva in cambios:
+            if anterior is not None:
+                _sumar(agregados, anterior, -1)
+                # Si sale el valor mínimo o máximo hay que buscar el siguiente
+                if anterior['total_centimos'] in (agregados['minimo_centimos'], agregados['maximo_centimos']):
+                    recalcular_extremos = True
+
+            if nueva is not None:
+                _sumar(agregados, nueva, 1)
+                total = nueva['total_centimos']
+                if agregados['minimo_centimos'] is None or total < agregados['minimo_centimos']:
+                    agregados['minimo_centimos'] = total
+                if agregados['maximo_centimos'] is None or total > agregados['maximo_centimos']:
+                    agregados['maximo_centimos'] = total
+
+        if recalcular_extremos:
+            _recalcular_extremos(agregados, list(entradas_actuales()))
+
+        _escribir(agregados)
+
+
+def obtener_agregados():
+    """
+    Obtiene los agregados de todas las facturas sin recorrer los archivos.
+
+    Returns:
+        dict: cantidad, subtotal, igv, total, minimo, maximo y promedio en soles
+    """
+    agregados = _leer()
+    if agregados is None:
+        return reconstruir_agregados()
+    return _en_soles(agregados)
+
+
+def reconstruir_agregados(releer=False):
+    """
+    Vuelve a calcular los agregados desde las facturas guardadas.
+
+    Args:
+        releer: Si es True se vuelve a leer cada archivo de factura en lugar de
+            confiar en los totales guardados en el índice
+
+    Returns:
+        dict: Agregados recalculados, en soles
+    """
+    from utils.indice import reconciliar_indice
+    from utils.lector import leer_facturas_texto
+
+    entradas = list(reconciliar_indice().values())
+    if releer:
+        # Los archivos se releen en paralelo; los que fallan se saltan
+        entradas = [factura._asdict() for factura in leer_facturas_texto()]
+
+    agregados = _calcular(entradas)
+    with bloquear_archivo(ARCHIVO_LOCK):
+        _escribir(agregados)
+
+    print(f"✅ Agregados reconstruidos: {agregados['cantidad']} facturas")
+    return _en_soles(agregados)
+
+
+if __name__ == "__main__":
+    # Uso: python -m utils.agregados [--releer]
+    import sys
+
+    from utils.almacenamiento import obtener_repositorio
+
+    obtener_repositorio().reconstruir_agregados(releer="--releer" in sys.argv)
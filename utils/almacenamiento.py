@@ -0,0 +1,1005 @@
+import functools
+import os
+import sqlite3
+import threading
+import time
+
+from utils import archivo, binario, secuencia
+from utils.archivo import FacturaModificada
+from utils.dinero import a_centimos, a_soles, calcular_factura, formatear_centimos
+from utils.agregados import obtener_agregados, reconstruir_agregados
+from utils.archivado import leer_texto
+from utils.indice import cambios_desde, numero_desde_archivo, reconciliar_indice
+from utils.reportes import registrar_cambios
+from utils.rutas import nombre_archivo_factura
+
+# Backend configurable por variable de entorno: "texto" (por defecto), "sqlite" o "binario"
+VARIABLE_BACKEND = "PERU_DELIVERY_ALMACENAMIENTO"
+VARIABLE_BD = "PERU_DELIVERY_BD"
+RUTA_BD_POR_DEFECTO = os.path.join("cache", "facturas.db")
+
+# Cada cuántos segundos se vuelve a recorrer la carpeta de facturas para
+# detectar cambios hechos fuera del sistema
+RECONCILIAR_CADA = 60
+
+# Cambios recientes que se conservan en la tabla cambios de SQLite
+CAMBIOS_CONSERVADOS = 100000
+
+
+def _actualiza_reportes(metodo):
+    """
+    Decora un método de escritura del repositorio para que, al terminar,
+    sume a los totales de los reportes las facturas que escribió (ver
+    utils.reportes.registrar_cambios).
+
+    El método devuelve el número de la factura nueva, True si escribió la
+    factura de su primer argumento o la lista de números escritos.
+    """
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        resultado = metodo(self, *args, **kwargs)
+        if isinstance(resultado, list):
+            numeros = resultado
+        elif resultado is True:
+            numeros = [args[0] if args else kwargs['numero']]
+        elif isinstance(resultado, int) and not isinstance(resultado, bool):
+            numeros = [resultado]
+        else:
+            numeros = []
+        if numeros:
+            registrar_cambios(self, numeros)
+        return resultado
+    return envoltura
+
+
+class RepositorioFacturas:
+    """
+    Interfaz común para guardar y consultar facturas.
+
+    Las páginas trabajan solo con estos métodos, así que el backend de
+    almacenamiento se puede cambiar sin tocarlas.
+
+    Las facturas se describen con diccionarios de información con las claves
+    numero, archivo, ruta, tamaño_bytes, tamaño_kb, subtotal, igv, total,
+    total_centimos, num_items, fecha_modificacion, fecha_emision y version
+    (los montos como texto con 2 decimales, salvo total_centimos que es un
+    entero; las fechas como timestamp).
+
+    La versión sirve para el control de concurrencia optimista: quien edita o
+    elimina entrega la versión que leyó y, si otra sesión cambió la factura
+    mientras tanto, la operación se rechaza con FacturaModificada.
+    """
+
+    nombre = None
+
+    # Segundos durante los que una factura eliminada se puede recuperar
+    # (0 si el backend la borra en el momento)
+    ventana_deshacer = 0
+
+    def reservar_numeros(self, cantidad=1):
+        """Reserva un bloque de números de factura consecutivos."""
+        raise NotImplementedError
+
+    def guardar(self, productos, subtotal, igv, total, numero=None):
+        """Guarda una factura nueva y devuelve su número, o None si hubo error."""
+        raise NotImplementedError
+
+    def guardar_lote(self, facturas, fechas=None):
+        """
+        Guarda varias facturas con números ya reservados.
+
+        Args:
+            facturas: Lista de tuplas (numero, productos, subtotal, igv, total)
+            fechas: Diccionario numero -> fecha de emisión (timestamp) de las
+                facturas que conservan la de otra copia (por ejemplo, al
+                migrar); las demás llevan la fecha actual
+
+        Returns:
+            list: Números de las facturas guardadas
+        """
+        raise NotImplementedError
+
+    def cargar(self, numero):
+        """Devuelve los productos de una factura como tuplas (nombre, precio, cantidad)."""
+        raise NotImplementedError
+
+    def actualizar(self, numero, productos, subtotal, igv, total, version=None):
+        """
+        Reemplaza los productos y totales de una factura existente.
+
+        Si se indica version y la factura ya no está en esa versión, lanza
+        FacturaModificada sin escribir nada.
+        """
+        raise NotImplementedError
+
+    def eliminar(self, numero, version=None):
+        """
+        Elimina una factura. Devuelve True si se eliminó.
+
+        Si se indica version y la factura ya no está en esa versión, lanza
+        FacturaModificada sin eliminarla.
+        """
+        raise NotImplementedError
+
+    def actualizar_lote(self, cambios):
+        """
+        Reemplaza varias facturas de una vez.
+
+        Args:
+            cambios: Lista de tuplas (numero, productos, subtotal, igv, total,
+                version); las facturas eliminadas o que ya no están en esa
+                versión (si no es None) se saltan
+
+        Returns:
+            list: Números de las facturas actualizadas
+        """
+        raise NotImplementedError
+
+    def eliminar_lote(self, numeros, versiones=None):
+        """
+        Elimina varias facturas de una vez.
+
+        Args:
+            numeros: Números de las facturas
+            versiones: Diccionario numero -> versión que vio el usuario
+                (opcional); las facturas que cambiaron desde entonces se saltan
+
+        Returns:
+            list: Números de las facturas eliminadas
+        """
+        raise NotImplementedError
+
+    def eliminadas(self):
+        """
+        Facturas eliminadas que todavía se pueden recuperar, como tuplas
+        (numero, eliminada_en) con la fecha de eliminación como timestamp.
+        """
+        return []
+
+    def deshacer_eliminacion(self, numero):
+        """Recupera una factura eliminada. Devuelve True si se recuperó."""
+        return False
+
+    def version(self, numero):
+        """Devuelve la versión actual de una factura o None si no existe."""
+        raise NotImplementedError
+
+    def cambios_desde(self, token):
+        """
+        Indica qué facturas cambiaron desde una llamada anterior.
+
+        Args:
+            token: Valor devuelto por la llamada anterior, o None
+
+        Returns:
+            tuple: (token_actual, numeros) con los números de las facturas
+                guardadas, editadas o eliminadas desde entonces; numeros es
+                None cuando no se puede saber y hay que volver a listar todo
+        """
+        return None, None
+
+    def obtener_info(self, numero):
+        """Devuelve la información de una factura o None si no existe."""
+        raise NotImplementedError
+
+    def listar(self):
+        """Devuelve la información de todas las facturas ordenadas por número."""
+        raise NotImplementedError
+
+    def contenido(self, numero):
+        """Devuelve el texto imprimible de una factura o None si no existe."""
+        raise NotImplementedError
+
+    def agregados(self):
+        """
+        Agregados de todas las facturas: cantidad, subtotal, igv, total,
+        minimo, maximo y promedio.
+        """
+        facturas = self.listar()
+        totales = [f['total_centimos'] for f in facturas]
+        suma = sum(totales)
+        return {
+            'cantidad': len(facturas),
+            'subtotal': a_soles(sum(a_centimos(f['subtotal']) for f in facturas)),
+            'igv': a_soles(sum(a_centimos(f['igv']) for f in facturas)),
+            'total': a_soles(suma),
+            'minimo': a_soles(min(totales)) if totales else None,
+            'maximo': a_soles(max(totales)) if totales else None,
+            'promedio': a_soles(suma) / len(totales) if totales else 0.0
+        }
+
+    def reconstruir_agregados(self, releer=False):
+        """Vuelve a calcular los agregados desde las facturas guardadas."""
+        return self.agregados()
+
+    def contar(self):
+        """Cantidad de facturas guardadas."""
+        return self.agregados()['cantidad']
+
+    def total_general(self):
+        """Suma de los totales de todas las facturas."""
+        return self.agregados()['total']
+
+    def buscar(self, numero_desde=None, numero_hasta=None, total_min=None, total_max=None,
+               fecha_desde=None, fecha_hasta=None):
+        """
+        Filtra facturas por rango de número, de total y de fecha de emisión
+        (timestamp).
+
+        Los límites son inclusivos y los que se dejan en None no filtran.
+        """
+        resultado = []
+        for info in self.listar():
+            total = a_soles(info['total_centimos'])
+            if numero_desde is not None and info['numero'] < numero_desde:
+                continue
+            if numero_hasta is not None and info['numero'] > numero_hasta:
+                continue
+            if total_min is not None and total < total_min:
+                continue
+            if total_max is not None and total > total_max:
+                continue
+            if fecha_desde is not None and info['fecha_emision'] < fecha_desde:
+                continue
+            if fecha_hasta is not None and info['fecha_emision'] > fecha_hasta:
+                continue
+            resultado.append(info)
+        return resultado
+
+
+class RepositorioTexto(RepositorioFacturas):
+    """Facturas como archivos factura_XXX.txt en la carpeta cache."""
+
+    nombre = "texto"
+    ventana_deshacer = archivo.VENTANA_DESHACER
+    _ultima_reconciliacion = float("-inf")
+
+    def __init__(self):
+        # Terminar las escrituras que quedaron a medias en la bitácora
+        archivo.recuperar_bitacora()
+        # Borrar las facturas eliminadas que quedaron de una ejecución anterior
+        if archivo.listar_eliminadas():
+            archivo.programar_compactacion()
+
+    def reservar_numeros(self, cantidad=1):
+        return secuencia.reservar_numeros(cantidad)
+
+    @_actualiza_reportes
+    def guardar(self, productos, subtotal, igv, total, numero=None):
+        ruta = archivo.guardar_factura(productos, subtotal, igv, total, numero=numero)
+        return numero_desde_archivo(ruta) if ruta else None
+
+    @_actualiza_reportes
+    def guardar_lote(self, facturas, fechas=None):
+        return archivo.guardar_facturas_lote(facturas, fechas=fechas)
+
+    def cargar(self, numero):
+        info = archivo.obtener_info_factura(numero)
+        return archivo.parsear_factura(info['ruta']) if info else []
+
+    @_actualiza_reportes
+    def actualizar(self, numero, productos, subtotal, igv, total, version=None):
+        info = archivo.obtener_info_factura(numero)
+        if info is None:
+            if version is not None:
+                raise FacturaModificada(f"La factura {numero:03d} fue eliminada por otra sesión")
+            return False
+        return archivo.escribir_factura(info['ruta'], productos, subtotal, igv, total, version=version)
+
+    @_actualiza_reportes
+    def actualizar_lote(self, cambios):
+        return archivo.escribir_facturas_lote(cambios)
+
+    @_actualiza_reportes
+    def eliminar(self, numero, version=None):
+        if self.ventana_deshacer > 0:
+            return archivo.marcar_eliminada(numero, version=version)
+        return archivo.eliminar_factura(numero, version=version)
+
+    @_actualiza_reportes
+    def eliminar_lote(self, numeros, versiones=None):
+        if self.ventana_deshacer > 0:
+            return archivo.marcar_eliminadas(numeros, versiones)
+        return archivo.eliminar_facturas(numeros, versiones)
+
+    def eliminadas(self):
+        return archivo.listar_eliminadas()
+
+    @_actualiza_reportes
+    def deshacer_eliminacion(self, numero):
+        return archivo.deshacer_eliminacion(numero)
+
+    def version(self, numero):
+        return archivo.version_factura(numero)
+
+    def cambios_desde(self, token):
+        # Los cambios externos aparecen en el índice al reconciliarlo
+        ahora = time.monotonic()
+        if ahora - self._ultima_reconciliacion > RECONCILIAR_CADA:
+            self._ultima_reconciliacion = ahora
+            reconciliar_indice()
+        return cambios_desde(token)
+
+    def obtener_info(self, numero):
+        return archivo.obtener_info_factura(numero)
+
+    def listar(self):
+        self._ultima_reconciliacion = time.monotonic()
+        return archivo.listar_todas_las_facturas()
+
+    def contenido(self, numero):
+        info = archivo.obtener_info_factura(numero)
+        if info is None:
+            return None
+        return leer_texto(info['ruta'])
+
+    def agregados(self):
+        # Se mantienen al guardar, editar y eliminar, sin recorrer los archivos
+        return obtener_agregados()
+
+    def buscar(self, numero_desde=None, numero_hasta=None, total_min=None, total_max=None,
+               fecha_desde=None, fecha_hasta=None):
+        # Fecha y total con los índices ordenados; el rango de números sobre el resultado
+        return [info for info in archivo.buscar_facturas(fecha_desde, fecha_hasta, total_min, total_max)
+                if (numero_desde is None or info['numero'] >= numero_desde)
+                and (numero_hasta is None or info['numero'] <= numero_hasta)]
+
+    def reconstruir_agregados(self, releer=False):
+        return reconstruir_agregados(releer=releer)
+
+
+class RepositorioSQLite(RepositorioFacturas):
+    """
+    Facturas en una base SQLite (modo WAL) con tablas normalizadas.
+
+    Cada hilo usa su propia conexión, porque Streamlit atiende cada sesión
+    en un hilo distinto.
+    """
+
+    nombre = "sqlite"
+
+    # Los montos se guardan como céntimos enteros
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS facturas (
+            numero INTEGER PRIMARY KEY,
+            fecha REAL NOT NULL,
+            subtotal_centimos INTEGER NOT NULL,
+            igv_centimos INTEGER NOT NULL,
+            total_centimos INTEGER NOT NULL,
+            num_items INTEGER NOT NULL,
+            tamano_bytes INTEGER NOT NULL,
+            version INTEGER NOT NULL DEFAULT 1
+        );
+        CREATE TABLE IF NOT EXISTS items (
+            numero INTEGER NOT NULL REFERENCES facturas(numero) ON DELETE CASCADE,
+            posicion INTEGER NOT NULL,
+            nombre TEXT NOT NULL,
+            precio_centimos INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL,
+            total_item_centimos INTEGER NOT NULL,
+            PRIMARY KEY (numero, posicion)
+        );
+        CREATE TABLE IF NOT EXISTS secuencia (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            siguiente INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_facturas_fecha ON facturas(fecha);
+        CREATE INDEX IF NOT EXISTS idx_facturas_total ON facturas(total_centimos);
+
+        -- Sumas acumuladas mantenidas por triggers; el mínimo y el máximo
+        -- salen del índice por total
+        CREATE TABLE IF NOT EXISTS agregados (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            cantidad INTEGER NOT NULL,
+            subtotal_centimos INTEGER NOT NULL,
+            igv_centimos INTEGER NOT NULL,
+            total_centimos INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO agregados (id, cantidad, subtotal_centimos, igv_centimos, total_centimos)
+            SELECT 1, COUNT(*), COALESCE(SUM(subtotal_centimos), 0), COALESCE(SUM(igv_centimos), 0),
+                   COALESCE(SUM(total_centimos), 0)
+            FROM facturas;
+        CREATE TRIGGER IF NOT EXISTS agregados_insert AFTER INSERT ON facturas BEGIN
+            UPDATE agregados SET cantidad = cantidad + 1,
+                subtotal_centimos = subtotal_centimos + NEW.subtotal_centimos,
+                igv_centimos = igv_centimos + NEW.igv_centimos,
+                total_centimos = total_centimos + NEW.total_centimos
+            WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS agregados_update
+        AFTER UPDATE OF subtotal_centimos, igv_centimos, total_centimos ON facturas BEGIN
+            UPDATE agregados SET
+                subtotal_centimos = subtotal_centimos - OLD.subtotal_centimos + NEW.subtotal_centimos,
+                igv_centimos = igv_centimos - OLD.igv_centimos + NEW.igv_centimos,
+                total_centimos = total_centimos - OLD.total_centimos + NEW.total_centimos
+            WHERE id = 1;
+        END;
+        -- Registro de qué facturas cambiaron, para refrescar cachés sin releer todo
+        CREATE TABLE IF NOT EXISTS cambios (
+            generacion INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero INTEGER NOT NULL
+        );
+        CREATE TRIGGER IF NOT EXISTS cambios_insert AFTER INSERT ON facturas BEGIN
+            INSERT INTO cambios (numero) VALUES (NEW.numero);
+        END;
+        CREATE TRIGGER IF NOT EXISTS cambios_update AFTER UPDATE ON facturas BEGIN
+            INSERT INTO cambios (numero) VALUES (NEW.numero);
+        END;
+        CREATE TRIGGER IF NOT EXISTS cambios_delete AFTER DELETE ON facturas BEGIN
+            INSERT INTO cambios (numero) VALUES (OLD.numero);
+        END;
+        CREATE TRIGGER IF NOT EXISTS agregados_delete AFTER DELETE ON facturas BEGIN
+            UPDATE agregados SET cantidad = cantidad - 1,
+                subtotal_centimos = subtotal_centimos - OLD.subtotal_centimos,
+                igv_centimos = igv_centimos - OLD.igv_centimos,
+                total_centimos = total_centimos - OLD.total_centimos
+            WHERE id = 1;
+        END;
+    """
+
+    def __init__(self, ruta_bd=RUTA_BD_POR_DEFECTO):
+        self.ruta_bd = ruta_bd
+        self._local = threading.local()
+
+        carpeta = os.path.dirname(ruta_bd)
+        if carpeta and not os.path.exists(carpeta):
+            os.makedirs(carpeta)
+
+        conexion = self._conexion()
+        conexion.executescript(self.ESQUEMA)
+        conexion.execute("INSERT OR IGNORE INTO secuencia (id, siguiente) VALUES (1, 1)")
+        conexion.commit()
+
+    def _conexion(self):
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta_bd, timeout=30)
+            conexion.row_factory = sqlite3.Row
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            conexion.execute("PRAGMA foreign_keys=ON")
+            self._local.conexion = conexion
+        return conexion
+
+    @staticmethod
+    def _info_desde_fila(fila):
+        return {
+            'numero': fila['numero'],
+            'archivo': f"factura_{str(fila['numero']).zfill(3)}.txt",
+            'ruta': None,
+            'tamaño_bytes': fila['tamano_bytes'],
+            'tamaño_kb': round(fila['tamano_bytes'] / 1024, 2),
+            'subtotal': formatear_centimos(fila['subtotal_centimos']),
+            'igv': formatear_centimos(fila['igv_centimos']),
+            'total': formatear_centimos(fila['total_centimos']),
+            'total_centimos': fila['total_centimos'],
+            'num_items': fila['num_items'],
+            'fecha_modificacion': fila['fecha'],
+            'fecha_emision': fila['fecha'],
+            'version': fila['version']
+        }
+
+    def _reservar(self, conexion, cantidad):
+        # Debe llamarse dentro de una transacción BEGIN IMMEDIATE
+        siguiente = conexion.execute("SELECT siguiente FROM secuencia WHERE id = 1").fetchone()[0]
+        conexion.execute("UPDATE secuencia SET siguiente = ? WHERE id = 1", (siguiente + cantidad,))
+        return range(siguiente, siguiente + cantidad)
+
+    def _escribir(self, conexion, numero, productos, subtotal, igv, total, nueva=False, fecha=None):
+        # Con nueva=True no se toca una factura que ya exista y se devuelve False
+        if fecha is None:
+            fecha = time.time()
+        tamaño = len(archivo.formatear_factura(productos, subtotal, igv, total, fecha).encode("utf-8"))
+        if nueva:
+            conflicto = "ON CONFLICT(numero) DO NOTHING"
+        else:
+            # Al editar se conserva la fecha de emisión original y se sube la versión
+            conflicto = ("ON CONFLICT(numero) DO UPDATE SET subtotal_centimos = excluded.subtotal_centimos, "
+                         "igv_centimos = excluded.igv_centimos, total_centimos = excluded.total_centimos, "
+                         "num_items = excluded.num_items, tamano_bytes = excluded.tamano_bytes, "
+                         "version = facturas.version + 1")
+        cursor = conexion.execute(
+            "INSERT INTO facturas (numero, fecha, subtotal_centimos, igv_centimos, total_centimos, "
+            "num_items, tamano_bytes) VALUES (?, ?, ?, ?, ?, ?, ?) " + conflicto,
+            (numero, fecha, a_centimos(subtotal), a_centimos(igv), a_centimos(total),
+             len(productos), tamaño)
+        )
+        if nueva and cursor.rowcount == 0:
+            return False
+
+        conexion.execute("DELETE FROM items WHERE numero = ?", (numero,))
+        filas = []
+        for i, (nombre, precio, cantidad, _) in enumerate(productos):
+            precio_centimos = a_centimos(precio)
+            filas.append((numero, i, nombre, precio_centimos, cantidad, precio_centimos * cantidad))
+        conexion.executemany(
+            "INSERT INTO items (numero, posicion, nombre, precio_centimos, cantidad, total_item_centimos) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            filas
+        )
+        return True
+
+    def reservar_numeros(self, cantidad=1):
+        if cantidad < 1:
+            raise ValueError("La cantidad a reservar debe ser mayor que 0")
+
+        conexion = self._conexion()
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            numeros = self._reservar(conexion, cantidad)
+            conexion.commit()
+            return numeros
+        except Exception:
+            conexion.rollback()
+            raise
+
+    @_actualiza_reportes
+    def guardar(self, productos, subtotal, igv, total, numero=None):
+        conexion = self._conexion()
+        try:
+            conexion.execute("BEGIN IMMEDIATE")
+            if numero is None:
+                numero = self._reservar(conexion, 1)[0]
+            elif conexion.execute("SELECT 1 FROM facturas WHERE numero = ?", (numero,)).fetchone():
+                raise ValueError(f"Ya existe la factura {numero:03d}")
+            else:
+                # Mantener la secuencia por delante de los números usados
+                conexion.execute(
+                    "UPDATE secuencia SET siguiente = MAX(siguiente, ?) WHERE id = 1", (numero + 1,)
+                )
+
+            self._escribir(conexion, numero, productos, subtotal, igv, total)
+            conexion.commit()
+
+            print(f"✅ Factura {numero:03d} guardada en {self.ruta_bd}")
+            return numero
+
+        except Exception as e:
+            conexion.rollback()
+            print(f"❌ Error al guardar la factura: {str(e)}")
+            return None
+
+    @_actualiza_reportes
+    def guardar_lote(self, facturas, fechas=None):
+        conexion = self._conexion()
+        try:
+            # Una sola transacción para todo el lote
+            conexion.execute("BEGIN IMMEDIATE")
+            guardadas = []
+            for numero, productos, subtotal, igv, total in facturas:
+                if not self._escribir(conexion, numero, productos, subtotal, igv, total, nueva=True,
+                                      fecha=(fechas or {}).get(numero)):
+                    print(f"❌ Ya existe la factura {numero:03d}")
+                    continue
+                guardadas.append(numero)
+            if guardadas:
+                conexion.execute(
+                    "UPDATE secuencia SET siguiente = MAX(siguiente, ?) WHERE id = 1", (max(guardadas) + 1,)
+                )
+            conexion.commit()
+            return sorted(guardadas)
+
+        except Exception as e:
+            conexion.rollback()
+            print(f"❌ Error al guardar el lote de facturas: {e}")
+            return []
+
+    def cargar(self, numero):
+        filas = self._conexion().execute(
+            "SELECT nombre, precio_centimos, cantidad FROM items WHERE numero = ? ORDER BY posicion", (numero,)
+        ).fetchall()
+        return [(fila['nombre'], a_soles(fila['precio_centimos']), fila['cantidad']) for fila in filas]
+
+    def _comprobar_version(self, conexion, numero, version):
+        # Debe llamarse dentro de una transacción BEGIN IMMEDIATE
+        if version is None:
+            return
+        fila = conexion.execute("SELECT version FROM facturas WHERE numero = ?", (numero,)).fetchone()
+        if fila is None or fila['version'] != version:
+            raise FacturaModificada(f"La factura {numero:03d} fue modificada por otra sesión")
+
+    @_actualiza_reportes
+    def actualizar(self, numero, productos, subtotal, igv, total, version=None):
+        conexion = self._conexion()
+        try:
+            conexion.execute("BEGIN IMMEDIATE")
+            self._comprobar_version(conexion, numero, version)
+            if not conexion.execute("SELECT 1 FROM facturas WHERE numero = ?", (numero,)).fetchone():
+                conexion.rollback()
+                return False
+
+            self._escribir(conexion, numero, productos, subtotal, igv, total)
+            conexion.commit()
+            return True
+
+        except FacturaModificada:
+            conexion.rollback()
+            raise
+        except Exception as e:
+            conexion.rollback()
+            print(f"❌ Error al actualizar la factura {numero:03d}: {e}")
+            return False
+
+    @_actualiza_reportes
+    def eliminar(self, numero, version=None):
+        conexion = self._conexion()
+        try:
+            conexion.execute("BEGIN IMMEDIATE")
+            self._comprobar_version(conexion, numero, version)
+            cursor = conexion.execute("DELETE FROM facturas WHERE numero = ?", (numero,))
+            conexion.commit()
+            if cursor.rowcount:
+                print(f"✅ Factura {numero:03d} eliminada correctamente")
+                return True
+            print(f"❌ No existe la factura {numero:03d}")
+            return False
+
+        except FacturaModificada:
+            conexion.rollback()
+            raise
+        except Exception as e:
+            conexion.rollback()
+            print(f"❌ Error al eliminar factura {numero:03d}: {e}")
+            return False
+
+    def _vigentes(self, conexion, versiones):
+        # Números que existen y siguen en la versión indicada (None no se compara)
+        vigentes = []
+        for numero, version in sorted(versiones.items()):
+            fila = conexion.execute("SELECT version FROM facturas WHERE numero = ?", (numero,)).fetchone()
+            if fila is None or (version is not None and fila['version'] != version):
+                print(f"❌ La factura {numero:03d} fue modificada o eliminada por otra sesión")
+                continue
+            vigentes.append(numero)
+        return vigentes
+
+    @_actualiza_reportes
+    def actualizar_lote(self, cambios):
+        conexion = self._conexion()
+        try:
+            # Una sola transacción para todo el lote
+            conexion.execute("BEGIN IMMEDIATE")
+            vigentes = set(self._vigentes(conexion, {numero: version for numero, *_, version in cambios}))
+            for numero, productos, subtotal, igv, total, _ in cambios:
+                if numero in vigentes:
+                    self._escribir(conexion, numero, productos, subtotal, igv, total)
+            conexion.commit()
+            return sorted(vigentes)
+
+        except Exception as e:
+            conexion.rollback()
+            print(f"❌ Error al actualizar el lote de facturas: {e}")
+            return []
+
+    @_actualiza_reportes
+    def eliminar_lote(self, numeros, versiones=None):
+        conexion = self._conexion()
+        try:
+            conexion.execute("BEGIN IMMEDIATE")
+            vigentes = self._vigentes(conexion, {numero: (versiones or {}).get(numero) for numero in numeros})
+            conexion.executemany("DELETE FROM facturas WHERE numero = ?", [(numero,) for numero in vigentes])
+            conexion.commit()
+            print(f"✅ Facturas eliminadas: {len(vigentes)}")
+            return vigentes
+
+        except Exception as e:
+            conexion.rollback()
+            print(f"❌ Error al eliminar el lote de facturas: {e}")
+            return []
+
+    def version(self, numero):
+        fila = self._conexion().execute("SELECT version FROM facturas WHERE numero = ?", (numero,)).fetchone()
+        return fila['version'] if fila else None
+
+    def cambios_desde(self, token):
+        conexion = self._conexion()
+        minimo, actual = conexion.execute(
+            "SELECT COALESCE(MIN(generacion), 1), COALESCE(MAX(generacion), 0) FROM cambios"
+        ).fetchone()
+
+        # Descartar los cambios viejos de vez en cuando
+        if actual - minimo > 2 * CAMBIOS_CONSERVADOS:
+            minimo = actual - CAMBIOS_CONSERVADOS
+            conexion.execute("DELETE FROM cambios WHERE generacion < ?", (minimo,))
+            conexion.commit()
+
+        if token is None or token > actual or token < minimo - 1:
+            return actual, None
+
+        filas = conexion.execute(
+            "SELECT DISTINCT numero FROM cambios WHERE generacion > ? AND generacion <= ?", (token, actual)
+        ).fetchall()
+        return actual, {fila['numero'] for fila in filas}
+
+    def obtener_info(self, numero):
+        fila = self._conexion().execute("SELECT * FROM facturas WHERE numero = ?", (numero,)).fetchone()
+        return self._info_desde_fila(fila) if fila else None
+
+    def listar(self):
+        filas = self._conexion().execute("SELECT * FROM facturas ORDER BY numero").fetchall()
+        return [self._info_desde_fila(fila) for fila in filas]
+
+    def contenido(self, numero):
+        fila = self._conexion().execute(
+            "SELECT fecha, subtotal_centimos, igv_centimos, total_centimos FROM facturas WHERE numero = ?", (numero,)
+        ).fetchone()
+        if fila is None:
+            return None
+
+        productos = self._conexion().execute(
+            "SELECT nombre, precio_centimos, cantidad, total_item_centimos FROM items "
+            "WHERE numero = ? ORDER BY posicion",
+            (numero,)
+        ).fetchall()
+        return archivo.formatear_factura(
+            [(p['nombre'], a_soles(p['precio_centimos']), p['cantidad'], a_soles(p['total_item_centimos']))
+             for p in productos],
+            a_soles(fila['subtotal_centimos']), a_soles(fila['igv_centimos']), a_soles(fila['total_centimos']),
+            fila['fecha']
+        )
+
+    def agregados(self):
+        conexion = self._conexion()
+        fila = conexion.execute(
+            "SELECT cantidad, subtotal_centimos, igv_centimos, total_centimos FROM agregados WHERE id = 1"
+        ).fetchone()
+        minimo, maximo = conexion.execute(
+            "SELECT MIN(total_centimos), MAX(total_centimos) FROM facturas"
+        ).fetchone()
+        return {
+            'cantidad': fila['cantidad'],
+            'subtotal': a_soles(fila['subtotal_centimos']),
+            'igv': a_soles(fila['igv_centimos']),
+            'total': a_soles(fila['total_centimos']),
+            'minimo': a_soles(minimo) if minimo is not None else None,
+            'maximo': a_soles(maximo) if maximo is not None else None,
+            'promedio': a_soles(fila['total_centimos']) / fila['cantidad'] if fila['cantidad'] > 0 else 0.0
+        }
+
+    def reconstruir_agregados(self, releer=False):
+        conexion = self._conexion()
+        conexion.execute(
+            "UPDATE agregados SET (cantidad, subtotal_centimos, igv_centimos, total_centimos) = "
+            "(SELECT COUNT(*), COALESCE(SUM(subtotal_centimos), 0), COALESCE(SUM(igv_centimos), 0), "
+            "COALESCE(SUM(total_centimos), 0) FROM facturas) WHERE id = 1"
+        )
+        conexion.commit()
+        return self.agregados()
+
+    def buscar(self, numero_desde=None, numero_hasta=None, total_min=None, total_max=None,
+               fecha_desde=None, fecha_hasta=None):
+        condiciones = []
+        parametros = []
+        for columna, operador, valor in (
+                ('numero', '>=', numero_desde), ('numero', '<=', numero_hasta),
+                ('total_centimos', '>=', a_centimos(total_min) if total_min is not None else None),
+                ('total_centimos', '<=', a_centimos(total_max) if total_max is not None else None),
+                ('fecha', '>=', fecha_desde), ('fecha', '<=', fecha_hasta)):
+            if valor is not None:
+                condiciones.append(f"{columna} {operador} ?")
+                parametros.append(valor)
+
+        consulta = "SELECT * FROM facturas"
+        if condiciones:
+            consulta += " WHERE " + " AND ".join(condiciones)
+        consulta += " ORDER BY numero"
+
+        filas = self._conexion().execute(consulta, parametros).fetchall()
+        return [self._info_desde_fila(fila) for fila in filas]
+
+
+class RepositorioBinario(RepositorioFacturas):
+    """
+    Facturas en registros binarios con los montos en céntimos (utils/binario),
+    un archivo por bloque de 1000 facturas.
+
+    El formato binario es el que se guarda; el texto imprimible de cada
+    factura se genera solo cuando se pide con contenido().
+    """
+
+    nombre = "binario"
+
+    @staticmethod
+    def _info_desde_cabecera(cabecera):
+        return {
+            'numero': cabecera['numero'],
+            'archivo': nombre_archivo_factura(cabecera['numero']),
+            'ruta': None,
+            'tamaño_bytes': cabecera['tamaño_bytes'],
+            'tamaño_kb': round(cabecera['tamaño_bytes'] / 1024, 2),
+            'subtotal': formatear_centimos(cabecera['subtotal_centimos']),
+            'igv': formatear_centimos(cabecera['igv_centimos']),
+            'total': formatear_centimos(cabecera['total_centimos']),
+            'total_centimos': cabecera['total_centimos'],
+            'num_items': cabecera['num_items'],
+            'fecha_modificacion': cabecera['fecha'],
+            'fecha_emision': cabecera['fecha'],
+            'version': cabecera['version']
+        }
+
+    def reservar_numeros(self, cantidad=1):
+        return binario.reservar_numeros(cantidad)
+
+    @_actualiza_reportes
+    def guardar(self, productos, subtotal, igv, total, numero=None):
+        try:
+            if numero is None:
+                numero = binario.reservar_numeros(1)[0]
+            if not binario.guardar_facturas([(numero, productos, subtotal, igv, total)]):
+                return None
+
+            print(f"✅ Factura {numero:03d} guardada en {binario.CARPETA_BINARIO}")
+            return numero
+
+        except Exception as e:
+            print(f"❌ Error al guardar la factura: {str(e)}")
+            return None
+
+    @_actualiza_reportes
+    def guardar_lote(self, facturas, fechas=None):
+        try:
+            return binario.guardar_facturas(facturas, fechas=fechas)
+        except Exception as e:
+            print(f"❌ Error al guardar el lote de facturas: {e}")
+            return []
+
+    def cargar(self, numero):
+        factura = binario.leer_factura(numero)
+        if factura is None:
+            return []
+        return [(nombre, a_soles(precio), cantidad) for nombre, precio, cantidad in factura[1]]
+
+    @_actualiza_reportes
+    def actualizar(self, numero, productos, subtotal, igv, total, version=None):
+        try:
+            return binario.actualizar_factura(numero, productos, subtotal, igv, total, version=version)
+        except FacturaModificada:
+            raise
+        except Exception as e:
+            print(f"❌ Error al actualizar la factura {numero:03d}: {e}")
+            return False
+
+    @_actualiza_reportes
+    def eliminar(self, numero, version=None):
+        try:
+            if binario.eliminar_factura(numero, version=version):
+                print(f"✅ Factura {numero:03d} eliminada correctamente")
+                return True
+            print(f"❌ No existe la factura {numero:03d}")
+            return False
+        except FacturaModificada:
+            raise
+        except Exception as e:
+            print(f"❌ Error al eliminar factura {numero:03d}: {e}")
+            return False
+
+    @_actualiza_reportes
+    def actualizar_lote(self, cambios):
+        try:
+            return binario.actualizar_facturas(cambios)
+        except Exception as e:
+            print(f"❌ Error al actualizar el lote de facturas: {e}")
+            return []
+
+    @_actualiza_reportes
+    def eliminar_lote(self, numeros, versiones=None):
+        try:
+            eliminadas = binario.eliminar_facturas(numeros, versiones)
+            print(f"✅ Facturas eliminadas: {len(eliminadas)}")
+            return eliminadas
+        except Exception as e:
+            print(f"❌ Error al eliminar el lote de facturas: {e}")
+            return []
+
+    def version(self, numero):
+        cabecera = binario.leer_cabecera(numero)
+        return cabecera['version'] if cabecera else None
+
+    def cambios_desde(self, token):
+        return binario.cambios_desde(token)
+
+    def obtener_info(self, numero):
+        cabecera = binario.leer_cabecera(numero)
+        return self._info_desde_cabecera(cabecera) if cabecera else None
+
+    def listar(self):
+        return [self._info_desde_cabecera(cabecera) for cabecera in binario.recorrer_cabeceras()]
+
+    def contenido(self, numero):
+        factura = binario.leer_factura(numero)
+        if factura is None:
+            return None
+
+        cabecera, productos = factura
+        return archivo.formatear_factura(
+            [(nombre, a_soles(precio), cantidad, a_soles(precio * cantidad)) for nombre, precio, cantidad in productos],
+            a_soles(cabecera['subtotal_centimos']), a_soles(cabecera['igv_centimos']),
+            a_soles(cabecera['total_centimos']), cabecera['fecha']
+        )
+
+    def agregados(self):
+        # Solo se leen las columnas de montos de la cabecera
+        columnas = binario.columnas('subtotal_centimos', 'igv_centimos', 'total_centimos')
+        totales = columnas['total_centimos']
+        cantidad = len(totales)
+        suma = int(totales.sum())
+        return {
+            'cantidad': cantidad,
+            'subtotal': a_soles(int(columnas['subtotal_centimos'].sum())),
+            'igv': a_soles(int(columnas['igv_centimos'].sum())),
+            'total': a_soles(suma),
+            'minimo': a_soles(int(totales.min())) if cantidad else None,
+            'maximo': a_soles(int(totales.max())) if cantidad else None,
+            'promedio': a_soles(suma) / cantidad if cantidad else 0.0
+        }
+
+
+_repositorios = {}
+_lock_repositorios = threading.Lock()
+
+
+def obtener_repositorio(backend=None):
+    """
+    Devuelve el repositorio de facturas configurado.
+
+    Args:
+        backend: "texto", "sqlite" o "binario"; si es None se lee la variable de entorno
+            PERU_DELIVERY_ALMACENAMIENTO (por defecto "texto")
+
+    Returns:
+        RepositorioFacturas: Instancia compartida del backend elegido
+    """
+    backend = (backend or os.environ.get(VARIABLE_BACKEND, "texto")).strip().lower()
+
+    with _lock_repositorios:
+        if backend not in _repositorios:
+            if backend == "texto":
+                _repositorios[backend] = RepositorioTexto()
+            elif backend == "sqlite":
+                _repositorios[backend] = RepositorioSQLite(os.environ.get(VARIABLE_BD, RUTA_BD_POR_DEFECTO))
+            elif backend == "binario":
+                _repositorios[backend] = RepositorioBinario()
+            else:
+                raise ValueError(f"Backend de almacenamiento desconocido: {backend}")
+        return _repositorios[backend]
+
+
+def migrar_facturas(origen, destino):
+    """
+    Copia todas las facturas de un repositorio a otro conservando su número,
+    su fecha de emisión y sus montos guardados.
+
+    Args:
+        origen: Repositorio del que se leen las facturas
+        destino: Repositorio donde se guardan
+
+    Returns:
+        int: Cantidad de facturas copiadas
+    """
+    copiadas = 0
+    lote = []
+    fechas = {}
+    for info in origen.listar():
+        # De los productos solo se calcula el total de cada línea
+        productos = calcular_factura(origen.cargar(info['numero']))[0]
+        lote.append((info['numero'], productos, a_soles(a_centimos(info['subtotal'])),
+                     a_soles(a_centimos(info['igv'])), a_soles(info['total_centimos'])))
+        if info['fecha_emision'] is not None:
+            fechas[info['numero']] = info['fecha_emision']
+        if len(lote) == 500:
+            copiadas += len(destino.guardar_lote(lote, fechas=fechas))
+            lote, fechas = [], {}
+    if lote:
+        copiadas += len(destino.guardar_lote(lote, fechas=fechas))
+    return copiadas
+
+
+if __name__ == "__main__":
+    # Uso: python -m utils.almacenamiento migrar texto binario
+    import sys
+
+    if len(sys.argv) == 4 and sys.argv[1] == "migrar":
+        copiadas = migrar_facturas(obtener_repositorio(sys.argv[2]), obtener_repositorio(sys.argv[3]))
+        print(f"✅ Facturas copiadas de {sys.argv[2]} a {sys.argv[3]}: {copiadas}")
+    else:
+        print("Uso: python -m utils.almacenamiento migrar ORIGEN DESTINO")
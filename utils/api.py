@@ -0,0 +1,351 @@
+import asyncio
+import json
+import os
+import re
+from urllib.parse import parse_qs
+
+from utils import servicio
+from utils.almacenamiento import obtener_repositorio
+from utils.asincrono import cerrar_pool, ejecutar
+from utils.lote import leer_productos
+from utils.servicio import DatosInvalidos, FacturaModificada, LoteInterrumpido
+
+# API HTTP con JSON sobre utils.servicio, como aplicación ASGI sin
+# dependencias (se sirve con uvicorn u otro servidor ASGI, que mantiene las
+# conexiones abiertas entre pedidos):
+#
+#   GET    /facturas?pagina=1&por_pagina=25&orden=total&producto=...
+#   GET    /facturas/{numero}
+#   POST   /facturas              {"productos": [{"nombre", "precio", "cantidad"}]}
+#   POST   /facturas/lote         {"facturas": [{"productos": [...]}, ...]}
+#   PUT    /facturas/{numero}     {"productos": [...], "version": ...}
+#   DELETE /facturas/{numero}?version=...
+#   POST   /facturas/eliminar     {"numeros": [...], "versiones": {"12": ...}}
+#   GET    /salud
+#
+# Las facturas que llegan por separado a POST /facturas casi al mismo tiempo
+# se guardan juntas con un solo guardado en lote, así que muchos terminales
+# enviando a la vez no hacen una escritura cada uno. El acceso al disco se
+# hace en el pool acotado de utils.asincrono.
+ESPERA_AGRUPACION = float(os.environ.get("PERU_DELIVERY_API_ESPERA_MS", 5)) / 1000
+MAX_AGRUPACION = 500
+MAX_CUERPO = 10 * 1024 * 1024
+MAX_POR_PAGINA = 1000
+KEEP_ALIVE = 75
+
+# Facturas esperando a guardarse juntas y tareas de guardado en curso (el
+# bucle de eventos solo guarda referencias débiles a las tareas); solo se
+# usan desde el bucle de eventos
+_agrupacion = {
+    'pendientes': [],
+    'temporizador': None,
+    'tareas': set()
+}
+
+
+class ErrorHTTP(Exception):
+    """Error que se responde al cliente con su código HTTP."""
+
+    def __init__(self, estado, mensaje, **datos):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.datos = {'error': mensaje, **datos}
+
+
+async def _leer_cuerpo(receive):
+    partes = []
+    tamaño = 0
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == "http.disconnect":
+            raise ErrorHTTP(400, "Conexión cerrada antes de terminar el pedido")
+        parte = mensaje.get('body', b"")
+        tamaño += len(parte)
+        if tamaño > MAX_CUERPO:
+            raise ErrorHTTP(413, "El pedido es demasiado grande")
+        partes.append(parte)
+        if not mensaje.get('more_body', False):
+            return b"".join(partes)
+
+
+async def _leer_json(receive):
+    try:
+        datos = json.loads(await _leer_cuerpo(receive))
+    except (ValueError, UnicodeDecodeError):
+        raise ErrorHTTP(400, "El cuerpo no es JSON válido")
+    if not isinstance(datos, dict):
+        raise ErrorHTTP(400, "Se esperaba un objeto JSON")
+    return datos
+
+
+def _productos(datos):
+    try:
+        return leer_productos(datos.get('productos') or [])
+    except (AttributeError, TypeError):
+        raise ErrorHTTP(400, "'productos' debe ser una lista de objetos con nombre, precio y cantidad")
+
+
+def _entero(valor, nombre):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise ErrorHTTP(400, f"'{nombre}' debe ser un número entero")
+
+
+def _version(valor):
+    # Las versiones de SQLite y binario son enteros y las de texto cadenas
+    return int(valor) if isinstance(valor, str) and valor.isdigit() else valor
+
+
+async def _enviar(send, estado, datos):
+    cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+    await send({
+        'type': "http.response.start",
+        'status': estado,
+        'headers': [(b"content-type", b"application/json; charset=utf-8"),
+                    (b"content-length", str(len(cuerpo)).encode())]
+    })
+    await send({'type': "http.response.body", 'body': cuerpo})
+
+
+def _despachar():
+    # Guarda en un solo lote todas las facturas que esperan; devuelve la tarea
+    temporizador = _agrupacion['temporizador']
+    if temporizador is not None:
+        temporizador.cancel()
+    pendientes = _agrupacion['pendientes']
+    _agrupacion.update({'pendientes': [], 'temporizador': None})
+    if not pendientes:
+        return None
+    tarea = asyncio.ensure_future(_guardar_agrupadas(pendientes))
+    _agrupacion['tareas'].add(tarea)
+    tarea.add_done_callback(_agrupacion['tareas'].discard)
+    return tarea
+
+
+def _resultados_interrumpidos(error):
+    # Los pedidos que se guardaron responden con su número; los demás con el
+    # error, que llega al cliente como cualquier error interno
+    fallidas = set(error.fallidas)
+    return [error.__cause__ if i in fallidas else resultado for i, resultado in enumerate(error.resultados)]
+
+
+async def _crear_una(productos):
+    try:
+        return (await ejecutar(servicio.crear_facturas, [productos]))[0]
+    except LoteInterrumpido as e:
+        return _resultados_interrumpidos(e)[0]
+    except Exception as e:
+        return e
+
+
+async def _guardar_agrupadas(pendientes):
+    try:
+        resultados = await ejecutar(servicio.crear_facturas, [productos for productos, _ in pendientes])
+    except LoteInterrumpido as e:
+        # Parte del grupo ya está guardada: reintentarlo la duplicaría
+        resultados = _resultados_interrumpidos(e)
+    except Exception:
+        # Falló antes de escribir nada: se reintenta cada factura por
+        # separado para que solo falle (con su propio error) la que lo causó
+        resultados = await asyncio.gather(*(_crear_una(productos) for productos, _ in pendientes))
+
+    for (_, futuro), resultado in zip(pendientes, resultados):
+        if futuro.done():
+            continue
+        if isinstance(resultado, Exception):
+            futuro.set_exception(resultado)
+        else:
+            futuro.set_result(resultado)
+
+
+async def crear_agrupada(productos):
+    """
+    Crea una factura juntándola con las que lleguen en los próximos
+    ESPERA_AGRUPACION segundos (hasta MAX_AGRUPACION) para guardarlas en lote.
+
+    Args:
+        productos: Lista de tuplas (nombre, precio, cantidad)
+
+    Returns:
+        dict: {'numero': N} o {'errores': [...]} (ver servicio.crear_facturas)
+    """
+    bucle = asyncio.get_running_loop()
+    futuro = bucle.create_future()
+    _agrupacion['pendientes'].append((productos, futuro))
+
+    if len(_agrupacion['pendientes']) >= MAX_AGRUPACION:
+        _despachar()
+    elif _agrupacion['temporizador'] is None:
+        _agrupacion['temporizador'] = bucle.call_later(ESPERA_AGRUPACION, _despachar)
+    return await futuro
+
+
+async def _salud(scope, receive):
+    return 200, {'estado': "ok"}
+
+
+async def _listar(scope, receive):
+    parametros = {clave: valores[-1] for clave, valores in parse_qs(scope['query_string'].decode()).items()}
+    filtros = {}
+    for clave in ('numero_desde', 'numero_hasta'):
+        if clave in parametros:
+            filtros[clave] = _entero(parametros[clave], clave)
+    for clave in ('total_min', 'total_max', 'fecha_desde', 'fecha_hasta'):
+        if clave in parametros:
+            try:
+                filtros[clave] = float(parametros[clave])
+            except ValueError:
+                raise ErrorHTTP(400, f"'{clave}' debe ser un número")
+    if 'orden' in parametros:
+        if parametros['orden'] not in ('numero', 'total', 'fecha'):
+            raise ErrorHTTP(400, "'orden' debe ser numero, total o fecha")
+        filtros['orden'] = parametros['orden']
+    if parametros.get('descendente') in ("1", "true", "si"):
+        filtros['descendente'] = True
+    if parametros.get('producto'):
+        filtros['producto'] = parametros['producto']
+
+    pagina = max(_entero(parametros.get('pagina', 1), 'pagina'), 1)
+    por_pagina = min(max(_entero(parametros.get('por_pagina', 25), 'por_pagina'), 1), MAX_POR_PAGINA)
+    return 200, await ejecutar(servicio.listar_facturas, pagina, por_pagina, **filtros)
+
+
+async def _obtener(scope, receive, numero):
+    factura = await ejecutar(servicio.obtener_factura, numero)
+    if factura is None:
+        raise ErrorHTTP(404, f"No existe la factura {numero:03d}")
+    return 200, factura
+
+
+async def _crear(scope, receive):
+    resultado = await crear_agrupada(_productos(await _leer_json(receive)))
+    if 'errores' in resultado:
+        raise ErrorHTTP(422, "La factura no es válida", errores=resultado['errores'])
+    return 201, resultado
+
+
+async def _crear_lote(scope, receive):
+    datos = await _leer_json(receive)
+    facturas = datos.get('facturas')
+    if not isinstance(facturas, list):
+        raise ErrorHTTP(400, "'facturas' debe ser una lista")
+    pedidos = [_productos(factura if isinstance(factura, dict) else {}) for factura in facturas]
+    try:
+        return 200, {'resultados': await ejecutar(servicio.crear_facturas, pedidos)}
+    except LoteInterrumpido as e:
+        # Se informan las que sí se guardaron para que el cliente no las repita
+        raise ErrorHTTP(500, str(e), resultados=e.resultados)
+
+
+async def _editar(scope, receive, numero):
+    datos = await _leer_json(receive)
+    try:
+        editada = await ejecutar(servicio.editar_factura, numero, _productos(datos), _version(datos.get('version')))
+    except DatosInvalidos as e:
+        raise ErrorHTTP(422, "La factura no es válida", errores=e.errores)
+    if not editada:
+        raise ErrorHTTP(404, f"No existe la factura {numero:03d}")
+    return 200, {'numero': numero}
+
+
+async def _eliminar(scope, receive, numero):
+    parametros = parse_qs(scope['query_string'].decode())
+    version = _version(parametros['version'][-1]) if 'version' in parametros else None
+    if not await ejecutar(servicio.eliminar_factura, numero, version):
+        raise ErrorHTTP(404, f"No existe la factura {numero:03d}")
+    return 200, {'numero': numero}
+
+
+async def _eliminar_lote(scope, receive):
+    datos = await _leer_json(receive)
+    if not isinstance(datos.get('numeros'), list):
+        raise ErrorHTTP(400, "'numeros' debe ser una lista")
+    numeros = [_entero(numero, 'numeros') for numero in datos['numeros']]
+    versiones = {_entero(numero, 'versiones'): _version(version)
+                 for numero, version in (datos.get('versiones') or {}).items()}
+    eliminadas = await ejecutar(servicio.eliminar_facturas, numeros, versiones)
+    return 200, {'eliminadas': eliminadas}
+
+
+# (método, ruta, función); los grupos de la ruta se pasan como números
+RUTAS = [
+    ("GET", re.compile(r"/salud"), _salud),
+    ("GET", re.compile(r"/facturas"), _listar),
+    ("POST", re.compile(r"/facturas"), _crear),
+    ("POST", re.compile(r"/facturas/lote"), _crear_lote),
+    ("POST", re.compile(r"/facturas/eliminar"), _eliminar_lote),
+    ("GET", re.compile(r"/facturas/(\d+)"), _obtener),
+    ("PUT", re.compile(r"/facturas/(\d+)"), _editar),
+    ("DELETE", re.compile(r"/facturas/(\d+)"), _eliminar)
+]
+
+
+async def _atender(scope, receive):
+    ruta = scope['path'].rstrip("/") or "/"
+    metodos = []
+    for metodo, patron, funcion in RUTAS:
+        coincidencia = patron.fullmatch(ruta)
+        if coincidencia is None:
+            continue
+        if metodo != scope['method']:
+            metodos.append(metodo)
+            continue
+        return await funcion(scope, receive, *(int(grupo) for grupo in coincidencia.groups()))
+
+    if metodos:
+        raise ErrorHTTP(405, f"Método no permitido; use {', '.join(metodos)}")
+    raise ErrorHTTP(404, f"No existe la ruta {scope['path']}")
+
+
+async def aplicacion(scope, receive, send):
+    """
+    Aplicación ASGI de la API de facturas.
+
+    Ejemplo: uvicorn utils.api:aplicacion --port 8000
+    """
+    if scope['type'] == "lifespan":
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == "lifespan.startup":
+                # Abrir el repositorio (y recuperar la bitácora) antes del primer pedido
+                await ejecutar(obtener_repositorio)
+                await send({'type': "lifespan.startup.complete"})
+            elif mensaje['type'] == "lifespan.shutdown":
+                _despachar()
+                if _agrupacion['tareas']:
+                    await asyncio.gather(*_agrupacion['tareas'])
+                await asyncio.get_running_loop().run_in_executor(None, cerrar_pool)
+                await send({'type': "lifespan.shutdown.complete"})
+                return
+
+    if scope['type'] != "http":
+        return
+
+    try:
+        estado, datos = await _atender(scope, receive)
+    except ErrorHTTP as e:
+        estado, datos = e.estado, e.datos
+    except FacturaModificada as e:
+        estado, datos = 409, {'error': str(e)}
+    except Exception as e:
+        print(f"❌ Error en {scope['method']} {scope['path']}: {e}")
+        estado, datos = 500, {'error': "Error interno"}
+    await _enviar(send, estado, datos)
+
+
+if __name__ == "__main__":
+    # Uso: python -m utils.api [--host 127.0.0.1] [--puerto 8000]
+    import sys
+
+    def _valor(opcion, defecto):
+        return sys.argv[sys.argv.index(opcion) + 1] if opcion in sys.argv else defecto
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("❌ Para servir la API hace falta un servidor ASGI: pip install uvicorn")
+        sys.exit(1)
+
+    uvicorn.run(aplicacion, host=_valor("--host", "127.0.0.1"), port=int(_valor("--puerto", 8000)),
+                timeout_keep_alive=KEEP_ALIVE)
@@ -0,0 +1,305 @@
+import io
+import os
+import threading
+import time
+import zipfile
+from collections import namedtuple
+
+from utils.bloqueo import bloquear_archivo
+from utils.escritura import escribir_atomico
+
+# Archivo de facturas antiguas: las facturas de texto con más de cierta edad
+# se empaquetan en un zip comprimido por cada bloque de 1000 números
+# (cache/archivo/facturas_0000.zip, ...) en lugar de ocupar un archivo suelto
+# cada una. El directorio central del zip sirve de índice de sus miembros.
+#
+# Una factura archivada se identifica con la ruta del zip seguida del nombre
+# del miembro (cache/archivo/facturas_0000.zip/factura_001.txt), así que el
+# resto del sistema la trata como una ruta más. Si existe el archivo suelto,
+# tiene prioridad sobre la copia archivada.
+CARPETA_ARCHIVO = os.path.join("cache", "archivo")
+CARPETA_BLOQUEOS = os.path.join("cache", "bloqueos")
+FACTURAS_POR_PAQUETE = 1000
+DIAS_ARCHIVO = 90
+
+_SUFIJO_PAQUETE = ".zip" + os.sep
+
+# Estado de una factura archivada con los mismos campos que usa el índice de
+# os.stat_result; la fecha de modificación es la del archivo suelto original
+EstadoArchivada = namedtuple("EstadoArchivada", ["st_size", "st_mtime", "st_mtime_ns"])
+
+
+class EntradaArchivada(namedtuple("EntradaArchivada", ["name", "path", "info"])):
+    """Miembro de un paquete con la interfaz de os.DirEntry que usa recorrer_facturas."""
+
+    def is_file(self):
+        return True
+
+    def stat(self):
+        return _estado_miembro(self.info)
+
+
+# Paquetes abiertos: ruta -> (firma del archivo, ZipFile). Un ZipFile se
+# puede leer desde varios hilos, y si el paquete se reescribe (os.replace)
+# el objeto anterior sigue leyendo la versión que abrió
+_lock_paquetes = threading.Lock()
+_paquetes = {}
+
+
+def ruta_paquete(numero_factura):
+    """Ruta del paquete donde se archiva una factura."""
+    return os.path.join(CARPETA_ARCHIVO, f"facturas_{numero_factura // FACTURAS_POR_PAQUETE:04d}.zip")
+
+
+def es_ruta_archivada(ruta):
+    """Indica si una ruta apunta a una factura dentro de un paquete."""
+    return _SUFIJO_PAQUETE in ruta
+
+
+def _separar(ruta):
+    posicion = ruta.rindex(_SUFIJO_PAQUETE) + len(".zip")
+    return ruta[:posicion], ruta[posicion + 1:]
+
+
+def _abrir_paquete(paquete):
+    try:
+        stat = os.stat(paquete)
+    except FileNotFoundError:
+        return None
+    firma = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    with _lock_paquetes:
+        abierto = _paquetes.get(paquete)
+        if abierto is None or abierto[0] != firma:
+            abierto = (firma, zipfile.ZipFile(paquete))
+            _paquetes[paquete] = abierto
+        return abierto[1]
+
+
+def _estado_miembro(info):
+    # La fecha de modificación original se guarda en el comentario del miembro
+    mtime_ns = int(info.comment) if info.comment else int(time.mktime(info.date_time + (0, 0, -1))) * 10**9
+    return EstadoArchivada(info.file_size, mtime_ns / 1e9, mtime_ns)
+
+
+def _info(ruta):
+    paquete, nombre = _separar(ruta)
+    zf = _abrir_paquete(paquete)
+    if zf is None:
+        return None, None
+    try:
+        return zf, zf.getinfo(nombre)
+    except KeyError:
+        return zf, None
+
+
+def ruta_archivada(numero_factura, nombre_archivo):
+    """
+    Busca una factura en su paquete.
+
+    Args:
+        numero_factura: Número de la factura
+        nombre_archivo: Nombre de su archivo (factura_XXX.txt)
+
+    Returns:
+        str: Ruta de la factura archivada o None si no está archivada
+    """
+    ruta = os.path.join(ruta_paquete(numero_factura), nombre_archivo)
+    return ruta if _info(ruta)[1] is not None else None
+
+
+def estado_factura(ruta):
+    """
+    os.stat de una factura, suelta o archivada.
+
+    Raises:
+        FileNotFoundError: Si la factura no existe
+    """
+    if not es_ruta_archivada(ruta):
+        return os.stat(ruta)
+    info = _info(ruta)[1]
+    if info is None:
+        raise FileNotFoundError(ruta)
+    return _estado_miembro(info)
+
+
+def leer_texto(ruta):
+    """
+    Lee el contenido de una factura, suelta o archivada.
+
+    Args:
+        ruta: Ruta de la factura
+
+    Returns:
+        str: Contenido de la factura
+
+    Raises:
+        OSError, UnicodeDecodeError: Si no se puede leer
+    """
+    if not es_ruta_archivada(ruta):
+        with open(ruta, "r", encoding="utf-8") as f:
+            return f.read()
+
+    zf, info = _info(ruta)
+    if info is None:
+        raise FileNotFoundError(ruta)
+    try:
+        return zf.read(info).decode("utf-8")
+    except zipfile.BadZipFile as e:
+        raise OSError(f"Paquete dañado {ruta}: {e}")
+
+
+def recorrer_archivadas():
+    """
+    Recorre las facturas de todos los paquetes.
+
+    Yields:
+        EntradaArchivada: Una por miembro, paquete por paquete
+    """
+    if not os.path.isdir(CARPETA_ARCHIVO):
+        return
+    with os.scandir(CARPETA_ARCHIVO) as entradas:
+        paquetes = sorted(e.path for e in entradas if e.name.endswith(".zip") and e.is_file())
+
+    for paquete in paquetes:
+        try:
+            zf = _abrir_paquete(paquete)
+        except (OSError, zipfile.BadZipFile) as e:
+            print(f"❌ No se pudo leer el paquete {paquete}: {e}")
+            continue
+        if zf is None:
+            continue
+        for info in zf.infolist():
+            yield EntradaArchivada(info.filename, os.path.join(paquete, info.filename), info)
+
+
+def bloquear_paquete(paquete):
+    """Bloqueo entre procesos para reescribir un paquete."""
+    return bloquear_archivo(os.path.join(CARPETA_BLOQUEOS, f"{os.path.basename(paquete)}.lock"))
+
+
+def reescribir_paquete(paquete, agregar=(), quitar=()):
+    """
+    Reescribe un paquete agregando, reemplazando o quitando facturas.
+
+    El zip nuevo se arma en memoria y reemplaza al anterior de forma atómica;
+    si queda vacío se borra. Hay que llamarla dentro de bloquear_paquete.
+
+    Args:
+        paquete: Ruta del paquete
+        agregar: Tuplas (nombre, contenido en bytes, stat del archivo suelto)
+        quitar: Nombres de los miembros a quitar
+
+    Returns:
+        int: Cantidad de facturas que quedaron en el paquete
+    """
+    nuevos = {nombre: (contenido, stat) for nombre, contenido, stat in agregar}
+    descartar = set(quitar) | set(nuevos)
+
+    zf = _abrir_paquete(paquete)
+    anteriores = [] if zf is None else [info for info in zf.infolist() if info.filename not in descartar]
+
+    datos = io.BytesIO()
+    with zipfile.ZipFile(datos, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as nuevo:
+        for info in anteriores:
+            nuevo.writestr(info, zf.read(info))
+        for nombre in sorted(nuevos):
+            contenido, stat = nuevos[nombre]
+            info = zipfile.ZipInfo(nombre, time.localtime(stat.st_mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.comment = str(stat.st_mtime_ns).encode()
+            nuevo.writestr(info, contenido)
+
+    cantidad = len(anteriores) + len(nuevos)
+    if cantidad:
+        os.makedirs(CARPETA_ARCHIVO, exist_ok=True)
+        escribir_atomico(paquete, datos.getvalue())
+    elif zf is not None:
+        os.remove(paquete)
+    return cantidad
+
+
+def quitar_archivada(numero_factura, nombre_archivo):
+    """
+    Quita una factura de su paquete, si está archivada.
+
+    Returns:
+        bool: True si estaba archivada
+    """
+    paquete = ruta_paquete(numero_factura)
+    if not os.path.exists(paquete):
+        return False
+    with bloquear_paquete(paquete):
+        if ruta_archivada(numero_factura, nombre_archivo) is None:
+            return False
+        reescribir_paquete(paquete, quitar=[nombre_archivo])
+        return True
+
+
+def archivar_facturas(dias=DIAS_ARCHIVO):
+    """
+    Empaqueta las facturas de texto emitidas hace más de `dias` días.
+
+    Primero se escribe cada paquete con las facturas nuevas; después, con el
+    bloqueo de cada factura, se borra el archivo suelto solo si no cambió
+    mientras tanto (si cambió, queda suelto y se archiva en otra pasada).
+
+    Args:
+        dias: Antigüedad mínima según la fecha de emisión
+
+    Returns:
+        int: Cantidad de facturas archivadas
+    """
+    from utils.archivo import bloquear_factura
+    from utils.indice import consultar_rango, reconciliar_indice, registrar_facturas
+
+    facturas = reconciliar_indice()
+    limite = time.time() - dias * 86400
+
+    por_paquete = {}
+    for numero in consultar_rango(fecha_hasta=limite):
+        ruta = facturas[numero]['ruta']
+        if not es_ruta_archivada(ruta):
+            por_paquete.setdefault(ruta_paquete(numero), []).append((numero, ruta))
+
+    archivadas = 0
+    for paquete, sueltas in sorted(por_paquete.items()):
+        agregar = []
+        with bloquear_paquete(paquete):
+            for numero, ruta in sueltas:
+                try:
+                    with open(ruta, "rb") as f:
+                        stat = os.fstat(f.fileno())
+                        agregar.append((numero, ruta, f.read(), stat))
+                except FileNotFoundError:
+                    continue
+            reescribir_paquete(paquete, [(os.path.basename(ruta), contenido, stat)
+                                         for _, ruta, contenido, stat in agregar])
+
+        movidas = []
+        for numero, ruta, _, stat in agregar:
+            with bloquear_factura(numero):
+                try:
+                    actual = os.stat(ruta)
+                except FileNotFoundError:
+                    continue
+                if (actual.st_mtime_ns, actual.st_size) != (stat.st_mtime_ns, stat.st_size):
+                    continue
+                os.remove(ruta)
+                movidas.append((os.path.join(paquete, os.path.basename(ruta)), None, None, None, None, None))
+
+        registrar_facturas(movidas)
+        archivadas += len(movidas)
+
+    print(f"✅ Facturas archivadas en {CARPETA_ARCHIVO}: {archivadas}")
+    return archivadas
+
+
+if __name__ == "__main__":
+    # Uso: python -m utils.archivado [--dias 90]
+    import sys
+
+    dias = DIAS_ARCHIVO
+    if "--dias" in sys.argv:
+        dias = float(sys.argv[sys.argv.index("--dias") + 1])
+    archivar_facturas(dias)
@@ -1,89 +1,425 @@
+import datetime
 import os
+import threading
+import time
+from contextlib import ExitStack
+
+from utils import bitacora
+from utils.archivado import (bloquear_paquete, es_ruta_archivada, estado_factura, leer_texto, quitar_archivada,
+                             reescribir_paquete, ruta_archivada, ruta_paquete)
+from utils.backup import crear_backup
+from utils.bloqueo import bloquear_archivo
+from utils.dinero import a_centimos, a_soles, formatear_centimos
+from utils.escritura import escribir_atomico, escribir_atomico_lote
+from utils.indice import (cargar_indice, consultar_rango, quitar_factura, quitar_facturas, reconciliar_indice,
+                          registrar_factura, registrar_facturas)
+from utils.lector import ETIQUETA_FECHA, FORMATO_FECHA, leer_factura_texto
+from utils.rutas import (buscar_ruta_factura, nombre_archivo_factura, numeros_eliminados, numero_desde_archivo,
+                         ruta_factura, ruta_factura_antigua, ruta_lapida)
+from utils.secuencia import ajustar_secuencia, reservar_numeros
+
+CARPETA_BLOQUEOS = os.path.join("cache", "bloqueos")
+ARCHIVO_REPLICA = os.path.join("cache", "bitacora_replica.txt")
+
+# Segundos durante los que una factura eliminada se puede recuperar antes de
+# que el compactador la borre del disco; con 0 se borra en el momento
+VENTANA_DESHACER = float(os.environ.get("PERU_DELIVERY_VENTANA_DESHACER", 600))
+
+# Facturas con lápida que el compactador borra por tanda
+TAMAÑO_TANDA_COMPACTACION = 200
+
+# Las facturas se reparten entre una cantidad fija de archivos de lock: dos
+# operaciones solo se esperan si les toca el mismo, sin bloquear toda la carpeta
+BLOQUEOS_FACTURAS = 64
+
+
+class FacturaModificada(Exception):
+    """La factura cambió o fue eliminada desde que se leyó."""
+
+
+def bloquear_factura(numero_factura):
+    """
+    Bloqueo entre procesos para editar o eliminar una factura.
+
+    Args:
+        numero_factura: Número de la factura
+
+    Returns:
+        Gestor de contexto que mantiene el bloqueo dentro del bloque `with`
+    """
+    nombre = f"factura_{numero_factura % BLOQUEOS_FACTURAS:02d}.lock"
+    return bloquear_archivo(os.path.join(CARPETA_BLOQUEOS, nombre))
+
+
+def bloquear_facturas(numeros):
+    """
+    Bloquea varias facturas a la vez (por ejemplo, las de un lote).
+
+    Cada archivo de lock se toma una sola vez y en orden, así que no se
+    bloquea contra sí mismo ni contra otro proceso que haga lo mismo.
+
+    Args:
+        numeros: Números de las facturas
+
+    Returns:
+        Gestor de contexto que mantiene los bloqueos dentro del bloque `with`
+    """
+    pila = ExitStack()
+    try:
+        for posicion in sorted({numero % BLOQUEOS_FACTURAS for numero in numeros}):
+            pila.enter_context(bloquear_factura(posicion))
+    except BaseException:
+        pila.close()
+        raise
+    return pila
+
+
+def _version_archivo(ruta):
+    if ruta is None:
+        return None
+    try:
+        stat = estado_factura(ruta)
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def version_factura(numero_factura):
+    """
+    Obtiene la versión actual de una factura.
+
+    La versión cambia cada vez que se reescribe el archivo. Quien edita la
+    guarda al cargar la factura y la entrega al guardar, para detectar si
+    otra sesión la modificó mientras tanto.
+
+    Args:
+        numero_factura: Número de la factura
+
+    Returns:
+        str: Versión de la factura o None si no existe
+    """
+    return _version_archivo(buscar_ruta_factura(numero_factura))
 
 
 def obtener_siguiente_numero_factura():
     """
     Obtiene el siguiente número de factura disponible.
-    Busca en la carpeta cache y devuelve el número más alto + 1.
+    Lo toma del contador persistente de utils/secuencia, sin recorrer la
+    carpeta cache. El número queda reservado para quien lo solicita.
+    """
+    return reservar_numeros(1)[0]
+
+
+def formatear_factura(productos, subtotal, igv, total, fecha_emision=None):
+    """
+    Genera el texto de una factura con el formato de ancho fijo.
+
+    Args:
+        productos: Lista de tuplas (nombre, precio, cantidad, total_item)
+        subtotal: Subtotal sin IGV
+        igv: Monto del IGV
+        total: Total final con IGV
+        fecha_emision: Fecha de emisión como timestamp (opcional)
+
+    Returns:
+        str: Contenido de la factura listo para guardar o mostrar
     """
-    carpeta = "cache"
+    # Encabezado
+    lineas = [
+        "🧾 FACTURA ELECTRÓNICA - PERU DELIVERY",
+        "=" * 50
+    ]
+    if fecha_emision is not None:
+        lineas.append(f"{ETIQUETA_FECHA} {datetime.datetime.fromtimestamp(fecha_emision).strftime(FORMATO_FECHA)}")
+    lineas.extend([
+        f"{'Producto':<20}{'Precio':>10}{'Cant.':>8}{'Total':>10}",
+        "-" * 50
+    ])
+
+    # Productos (el total de cada línea se calcula en céntimos desde el precio)
+    for prod, precio, cantidad, _ in productos:
+        # Truncar nombre del producto si es muy largo
+        nombre_truncado = prod[:19] if len(prod) > 19 else prod
+        precio_centimos = a_centimos(precio)
+        lineas.append(f"{nombre_truncado:<20}{formatear_centimos(precio_centimos):>10}{cantidad:>8}"
+                      f"{formatear_centimos(precio_centimos * cantidad):>10}")
 
-    # Crear carpeta si no existe
-    if not os.path.exists(carpeta):
-        os.makedirs(carpeta)
+    # Totales
+    lineas.append("-" * 50)
+    lineas.append(f"{'Subtotal':<30} S/. {formatear_centimos(a_centimos(subtotal))}")
+    lineas.append(f"{'IGV (18%)':<30} S/. {formatear_centimos(a_centimos(igv))}")
+    lineas.append(f"{'TOTAL':<30} S/. {formatear_centimos(a_centimos(total))}")
+    lineas.append("=" * 50)
+
+    return "\n".join(lineas) + "\n"
+
+
+def _ruta_nueva(numero):
+    # Un número usado por una factura antigua de cache/ o archivada cuenta como ocupado
+    if os.path.exists(ruta_factura_antigua(numero)):
+        raise FileExistsError(ruta_factura_antigua(numero))
+    if ruta_archivada(numero, nombre_archivo_factura(numero)) is not None:
+        raise FileExistsError(ruta_archivada(numero, nombre_archivo_factura(numero)))
+    return ruta_factura(numero, crear_carpeta=True)
+
+
+def guardar_factura(productos, subtotal, igv, total, numero=None):
+    """
+    Guarda una factura en formato texto en su subcarpeta de cache/facturas.
+
+    Args:
+        productos: Lista de tuplas (nombre, precio, cantidad, total_item)
+        subtotal: Subtotal sin IGV
+        igv: Monto del IGV
+        total: Total final con IGV
+        numero: Número ya reservado para la factura (opcional)
+
+    Returns:
+        str: Nombre del archivo creado o None si hubo error
+    """
+    def crear(numero):
+        with bloquear_factura(numero):
+            nombre_archivo = _ruta_nueva(numero)
+            with bitacora.operacion("guardar", numero, contenido):
+                escribir_atomico(nombre_archivo, contenido, exclusivo=True)
+                registrar_factura(nombre_archivo, subtotal, igv, total, len(productos), fecha_emision)
+        return nombre_archivo
 
     try:
-        archivos = os.listdir(carpeta)
-        numeros = []
+        # El texto guarda la fecha al segundo; el índice usa la misma
+        fecha_emision = int(time.time())
+        contenido = formatear_factura(productos, subtotal, igv, total, fecha_emision)
 
-        for archivo in archivos:
-            if archivo.startswith("factura_") and archivo.endswith(".txt"):
+        if numero is not None:
+            nombre_archivo = crear(numero)
+        else:
+            # Obtener número de factura; si el archivo ya existe (creado por
+            # fuera del sistema) se adelanta la secuencia y se pide otro número
+            while True:
+                numero = obtener_siguiente_numero_factura()
                 try:
-                    # Extraer número del archivo factura_XXX.txt
-                    num = int(archivo.split("_")[1].split(".")[0])
-                    numeros.append(num)
-                except (ValueError, IndexError):
-                    # Ignorar archivos con formato incorrecto
-                    continue
+                    nombre_archivo = crear(numero)
+                    break
+                except FileExistsError:
+                    ajustar_secuencia(numero)
 
-        if numeros:
-            return max(numeros) + 1
+        print(f"✅ Factura guardada como: {nombre_archivo}")
+        return nombre_archivo
+
+    except Exception as e:
+        print(f"❌ Error al guardar la factura: {str(e)}")
+        return None
+
+
+def guardar_facturas_lote(facturas, agrupar=True, fechas=None):
+    """
+    Guarda muchas facturas con números ya reservados.
+
+    Cada archivo se escribe de forma atómica; la bitácora y el índice se
+    actualizan con una única escritura para todo el lote.
+
+    Args:
+        facturas: Lista de tuplas (numero, productos, subtotal, igv, total)
+        agrupar: Si es True los archivos se renombran juntos y cada carpeta
+            se sincroniza una sola vez para todo el lote en lugar de una vez
+            por factura
+        fechas: Diccionario numero -> fecha de emisión (timestamp) de las
+            facturas que conservan la de otra copia (por ejemplo, al migrar);
+            las demás llevan la fecha actual
+
+    Returns:
+        list: Números de las facturas guardadas
+    """
+    with bloquear_facturas([numero for numero, *_ in facturas]):
+        datos = {}
+        archivos = []
+        ahora = int(time.time())
+        for numero, productos, subtotal, igv, total in facturas:
+            try:
+                nombre_archivo = _ruta_nueva(numero)
+            except OSError as e:
+                print(f"❌ Error al guardar la factura {numero:03d}: {e}")
+                continue
+            # El texto guarda la fecha al segundo; el índice usa la misma
+            fecha_emision = int(fechas[numero]) if fechas and numero in fechas else ahora
+            datos[nombre_archivo] = (numero, subtotal, igv, total, len(productos), fecha_emision)
+            archivos.append((nombre_archivo, formatear_factura(productos, subtotal, igv, total, fecha_emision)))
+
+        seqs = dict(zip(
+            (nombre_archivo for nombre_archivo, _ in archivos),
+            bitacora.registrar([{'op': "guardar", 'numero': datos[nombre_archivo][0], 'contenido': contenido}
+                                for nombre_archivo, contenido in archivos])
+        ))
+
+        if agrupar:
+            resultados = escribir_atomico_lote(archivos, exclusivo=True)
         else:
-            return 1
-    except OSError:
-        # Si hay error al acceder a la carpeta, empezar desde 1
-        return 1
+            resultados = []
+            for nombre_archivo, contenido in archivos:
+                try:
+                    escribir_atomico(nombre_archivo, contenido, exclusivo=True)
+                    resultados.append((nombre_archivo, None))
+                except OSError as e:
+                    resultados.append((nombre_archivo, e))
+
+        guardadas = []
+        registros = []
+        fallidas = []
+        for nombre_archivo, error in resultados:
+            numero, subtotal, igv, total, num_items, fecha_emision = datos[nombre_archivo]
+            if error is not None:
+                print(f"❌ Error al guardar la factura {numero:03d}: {error}")
+                fallidas.append(seqs[nombre_archivo])
+                continue
 
+            guardadas.append(numero)
+            registros.append((nombre_archivo, subtotal, igv, total, num_items, fecha_emision))
 
-def guardar_factura(productos, subtotal, igv, total):
+        registrar_facturas(registros)
+        bitacora.confirmar([seqs[nombre_archivo] for nombre_archivo, *_ in registros])
+        bitacora.confirmar(fallidas, ok=False)
+    return sorted(guardadas)
+
+
+def escribir_factura(ruta, productos, subtotal, igv, total, version=None):
     """
-    Guarda una factura en formato texto en la carpeta cache.
+    Sobrescribe una factura existente con nuevos productos y totales.
+
+    Una factura archivada se vuelve a escribir como archivo suelto, que tiene
+    prioridad sobre la copia del paquete hasta que se vuelva a archivar.
 
     Args:
+        ruta: Ruta del archivo de la factura
         productos: Lista de tuplas (nombre, precio, cantidad, total_item)
         subtotal: Subtotal sin IGV
         igv: Monto del IGV
         total: Total final con IGV
+        version: Versión leída al cargar la factura (opcional); si el archivo
+            cambió desde entonces no se escribe y se lanza FacturaModificada
 
     Returns:
-        str: Nombre del archivo creado o None si hubo error
+        bool: True si se escribió correctamente, False si hubo error
     """
     try:
-        # Obtener número de factura
-        numero = obtener_siguiente_numero_factura()
-        nombre_archivo = f"cache/factura_{str(numero).zfill(3)}.txt"
+        numero = numero_desde_archivo(ruta)
+        with bloquear_factura(numero):
+            # Si se archivó desde que se leyó, la versión es la misma
+            actual = buscar_ruta_factura(numero)
+            if actual is None:
+                if version is not None:
+                    raise FacturaModificada(f"La factura {numero:03d} fue eliminada por otra sesión")
+                raise FileNotFoundError(ruta)
+            ruta = actual
+            if version is not None and _version_archivo(ruta) != version:
+                raise FacturaModificada(f"La factura {ruta} fue modificada por otra sesión")
 
-        # Crear contenido de la factura
-        with open(nombre_archivo, "w", encoding="utf-8") as f:
-            # Encabezado
-            f.write("🧾 FACTURA ELECTRÓNICA - PERU DELIVERY\n")
-            f.write("=" * 50 + "\n")
+            # Se conserva la fecha de emisión; las facturas anteriores a
+            # registrarla toman la fecha de su última modificación
+            fecha_emision = leer_factura_texto(ruta).fecha_emision
+            if fecha_emision is None:
+                fecha_emision = int(estado_factura(ruta).st_mtime)
 
-            # Cabecera de la tabla
-            f.write(f"{'Producto':<20}{'Precio':>10}{'Cant.':>8}{'Total':>10}\n")
-            f.write("-" * 50 + "\n")
+            if es_ruta_archivada(ruta):
+                ruta = ruta_factura(numero, crear_carpeta=True)
+            contenido = formatear_factura(productos, subtotal, igv, total, fecha_emision)
+            with bitacora.operacion("editar", numero, contenido):
+                escribir_atomico(ruta, contenido)
+                registrar_factura(ruta, subtotal, igv, total, len(productos), fecha_emision)
+        return True
 
-            # Productos
-            for prod, precio, cantidad, total_item in productos:
-                # Truncar nombre del producto si es muy largo
-                nombre_truncado = prod[:19] if len(prod) > 19 else prod
-                f.write(f"{nombre_truncado:<20}{precio:>10.2f}{cantidad:>8}{total_item:>10.2f}\n")
+    except FacturaModificada:
+        raise
+    except Exception as e:
+        print(f"❌ Error al escribir la factura {ruta}: {e}")
+        return False
 
-            # Separador
-            f.write("-" * 50 + "\n")
 
-            # Totales
-            f.write(f"{'Subtotal':<30} S/. {subtotal:.2f}\n")
-            f.write(f"{'IGV (18%)':<30} S/. {igv:.2f}\n")
-            f.write(f"{'TOTAL':<30} S/. {total:.2f}\n")
-            f.write("=" * 50 + "\n")
+def escribir_facturas_lote(cambios):
+    """
+    Sobrescribe varias facturas existentes de una vez (por ejemplo, al
+    cambiar el precio de un producto en muchas facturas).
 
-        print(f"✅ Factura guardada como: {nombre_archivo}")
-        return nombre_archivo
+    Se bloquean todas juntas; la bitácora, los archivos (en un solo commit
+    agrupado) y el índice se escriben una sola vez para todo el lote.
+
+    Args:
+        cambios: Lista de tuplas (numero, productos, subtotal, igv, total,
+            version); las facturas eliminadas o que ya no están en esa
+            versión (si no es None) no se escriben
+
+    Returns:
+        list: Números de las facturas escritas
+    """
+    try:
+        with bloquear_facturas([numero for numero, *_ in cambios]):
+            versiones = {numero: version for numero, *_, version in cambios}
+            vigentes = _vigentes(sorted(versiones), versiones)
+
+            datos = {}
+            archivos = []
+            for numero, productos, subtotal, igv, total, _ in cambios:
+                if numero not in vigentes:
+                    continue
+                ruta = vigentes[numero]
+                try:
+                    fecha_emision = leer_factura_texto(ruta).fecha_emision
+                    if fecha_emision is None:
+                        fecha_emision = int(estado_factura(ruta).st_mtime)
+                except Exception as e:
+                    print(f"❌ Error al leer la factura {numero:03d}: {e}")
+                    continue
+
+                if es_ruta_archivada(ruta):
+                    ruta = ruta_factura(numero, crear_carpeta=True)
+                datos[ruta] = (numero, subtotal, igv, total, len(productos), fecha_emision)
+                archivos.append((ruta, formatear_factura(productos, subtotal, igv, total, fecha_emision)))
+
+            seqs = dict(zip(
+                (ruta for ruta, _ in archivos),
+                bitacora.registrar([{'op': "editar", 'numero': datos[ruta][0], 'contenido': contenido}
+                                    for ruta, contenido in archivos])
+            ))
+
+            escritas = []
+            registros = []
+            fallidas = []
+            for ruta, error in escribir_atomico_lote(archivos):
+                if error is not None:
+                    print(f"❌ Error al escribir la factura {datos[ruta][0]:03d}: {error}")
+                    fallidas.append(seqs[ruta])
+                    continue
+                escritas.append(datos[ruta][0])
+                registros.append((ruta, *datos[ruta][1:]))
+
+            registrar_facturas(registros)
+            bitacora.confirmar([seqs[ruta] for ruta, *_ in registros])
+            bitacora.confirmar(fallidas, ok=False)
+
+        print(f"✅ Facturas actualizadas: {len(escritas)}")
+        return sorted(escritas)
 
     except Exception as e:
-        print(f"❌ Error al guardar la factura: {str(e)}")
-        return None
+        print(f"❌ Error al actualizar las facturas: {e}")
+        return []
+
+
+def parsear_factura(ruta):
+    """
+    Obtiene los productos de una factura guardada en texto.
+
+    Args:
+        ruta: Ruta del archivo de la factura
+
+    Returns:
+        list: Lista de tuplas (nombre, precio, cantidad)
+    """
+    try:
+        return [(nombre, a_soles(precio), cantidad)
+                for nombre, precio, cantidad, _ in leer_factura_texto(ruta).productos]
+
+    except Exception as e:
+        print(f"❌ Error al parsear la factura {ruta}: {e}")
+        return []
 
 
 def verificar_factura_existe(numero_factura):
@@ -96,49 +432,57 @@ def verificar_factura_existe(numero_factura):
     Returns:
         bool: True si existe, False si no existe
     """
-    nombre_archivo = f"cache/factura_{str(numero_factura).zfill(3)}.txt"
-    return os.path.exists(nombre_archivo)
+    return buscar_ruta_factura(numero_factura) is not None
+
+
+def _info_desde_indice(entrada):
+    return {
+        'numero': entrada['numero'],
+        'archivo': entrada['archivo'],
+        'ruta': entrada['ruta'],
+        'tamaño_bytes': entrada['tamaño_bytes'],
+        'tamaño_kb': round(entrada['tamaño_bytes'] / 1024, 2),
+        'subtotal': formatear_centimos(entrada['subtotal_centimos']),
+        'igv': formatear_centimos(entrada['igv_centimos']),
+        'total': formatear_centimos(entrada['total_centimos']),
+        'total_centimos': entrada['total_centimos'],
+        'num_items': entrada['num_items'],
+        'fecha_modificacion': entrada['fecha_modificacion'],
+        'fecha_emision': entrada['fecha_emision'],
+        'version': f"{entrada['mtime_ns']}-{entrada['tamaño_bytes']}"
+    }
 
 
 def obtener_info_factura(numero_factura):
     """
     Obtiene información básica de una factura.
 
+    Usa el índice de facturas y solo vuelve a leer el archivo si cambió
+    desde que fue indexado.
+
     Args:
         numero_factura: Número de la factura
 
     Returns:
         dict: Información de la factura o None si no existe
     """
-    nombre_archivo = f"cache/factura_{str(numero_factura).zfill(3)}.txt"
+    nombre_archivo = buscar_ruta_factura(numero_factura)
 
-    if not os.path.exists(nombre_archivo):
+    if nombre_archivo is None:
         return None
 
     try:
-        stat = os.stat(nombre_archivo)
+        stat = estado_factura(nombre_archivo)
+        entrada = cargar_indice().get(numero_factura)
 
-        # Leer total de la factura
-        total = "0.00"
-        try:
-            with open(nombre_archivo, "r", encoding="utf-8") as f:
-                contenido = f.read()
-                for linea in contenido.split('\n'):
-                    if 'TOTAL' in linea and 'S/.' in linea:
-                        total = linea.split('S/.')[1].strip()
-                        break
-        except:
-            pass
+        if (entrada is None
+                or entrada['mtime_ns'] != stat.st_mtime_ns
+                or entrada['tamaño_bytes'] != stat.st_size):
+            entrada = registrar_factura(nombre_archivo)
+            if entrada is None:
+                return None
 
-        return {
-            'numero': numero_factura,
-            'archivo': f"factura_{str(numero_factura).zfill(3)}.txt",
-            'ruta': nombre_archivo,
-            'tamaño_bytes': stat.st_size,
-            'tamaño_kb': round(stat.st_size / 1024, 2),
-            'total': total,
-            'fecha_modificacion': stat.st_mtime
-        }
+        return _info_desde_indice(entrada)
 
     except Exception as e:
         print(f"Error al obtener info de factura {numero_factura}: {e}")
@@ -149,66 +493,435 @@ def listar_todas_las_facturas():
     """
     Lista todas las facturas disponibles en el sistema.
 
+    Lee el índice de facturas en lugar de abrir cada archivo; el índice se
+    reconcilia con las carpetas de facturas para detectar cambios externos.
+
     Returns:
         list: Lista de diccionarios con información de cada factura
     """
     try:
-        if not os.path.exists("cache"):
-            os.makedirs("cache")
-            return []
+        indice = reconciliar_indice()
+        return [_info_desde_indice(indice[numero]) for numero in sorted(indice)]
+
+    except Exception as e:
+        print(f"Error al listar facturas: {e}")
+        return []
 
-        archivos = os.listdir("cache")
-        facturas = []
 
-        for archivo in archivos:
-            if archivo.startswith("factura_") and archivo.endswith(".txt"):
-                try:
-                    numero = int(archivo.split("_")[1].split(".")[0])
-                    info = obtener_info_factura(numero)
-                    if info:
-                        facturas.append(info)
-                except:
-                    continue
+def buscar_facturas(fecha_desde=None, fecha_hasta=None, total_min=None, total_max=None):
+    """
+    Busca facturas por rango de fecha de emisión y de total.
 
-        # Ordenar por número de factura
-        facturas.sort(key=lambda x: x['numero'])
-        return facturas
+    Usa los índices ordenados del índice de facturas (búsqueda binaria), así
+    que no recorre todas las facturas.
+
+    Args:
+        fecha_desde, fecha_hasta: Rango de fecha de emisión como timestamp
+        total_min, total_max: Rango del total en soles
+
+    Returns:
+        list: Diccionarios de información de las facturas, ordenadas por
+            número (los límites son inclusivos y los que son None no filtran)
+    """
+    try:
+        numeros = consultar_rango(fecha_desde, fecha_hasta,
+                                  a_centimos(total_min) if total_min is not None else None,
+                                  a_centimos(total_max) if total_max is not None else None)
+        indice = cargar_indice()
+        return [_info_desde_indice(indice[numero]) for numero in numeros if numero in indice]
 
     except Exception as e:
-        print(f"Error al listar facturas: {e}")
+        print(f"Error al buscar facturas: {e}")
         return []
 
 
-def eliminar_factura(numero_factura):
+def _aplicar_contenido(numero_factura, contenido):
+    # Deja la factura con este contenido; una archivada pasa a archivo suelto
+    ruta = buscar_ruta_factura(numero_factura, incluir_eliminadas=True)
+    if ruta is None or es_ruta_archivada(ruta):
+        ruta = ruta_factura(numero_factura, crear_carpeta=True)
+    escribir_atomico(ruta, contenido)
+    quitar_lapida(numero_factura)
+    registrar_factura(ruta)
+    return ruta
+
+
+def _quitar_sueltas(numero_factura):
+    # Borra los archivos sueltos de la factura, en su subcarpeta y en cache/
+    # (una restauración o una migración a medias pueden dejar los dos)
+    for ruta in (ruta_factura(numero_factura), ruta_factura_antigua(numero_factura)):
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+
+def _aplicar_eliminacion(numero_factura):
+    # Se borran los archivos sueltos y la copia archivada, si hay, para que
+    # ninguna otra copia reaparezca en su lugar
+    _quitar_sueltas(numero_factura)
+    quitar_archivada(numero_factura, nombre_archivo_factura(numero_factura))
+    quitar_lapida(numero_factura)
+    quitar_factura(numero_factura)
+
+
+def _aplicar_lapida(numero_factura, marca):
+    # Deja la lápida con la fecha de eliminación de la bitácora (también como
+    # fecha de modificación, que es la que mira el compactador)
+    if buscar_ruta_factura(numero_factura, incluir_eliminadas=True) is None:
+        return
+    ruta = ruta_lapida(numero_factura)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    escribir_atomico(ruta, marca)
+    eliminada_en = float(marca)
+    os.utime(ruta, (eliminada_en, eliminada_en))
+    quitar_factura(numero_factura)
+
+
+def _aplicar_deshacer(numero_factura):
+    quitar_lapida(numero_factura)
+    ruta = buscar_ruta_factura(numero_factura)
+    if ruta is not None:
+        registrar_factura(ruta)
+
+
+def _rehacer(registro):
+    # Vuelve a aplicar una operación de la bitácora (recuperación o réplica)
+    numero, op = registro['numero'], registro['op']
+    if op == "eliminar":
+        _aplicar_eliminacion(numero)
+    elif op == "marcar":
+        _aplicar_lapida(numero, registro['contenido'])
+    elif op == "deshacer":
+        _aplicar_deshacer(numero)
+    else:
+        _aplicar_contenido(numero, registro['contenido'])
+
+
+def quitar_lapida(numero_factura):
+    """Quita la lápida de una factura; devuelve True si tenía."""
+    try:
+        os.remove(ruta_lapida(numero_factura))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def eliminar_factura(numero_factura, version=None):
     """
     Elimina una factura del sistema.
 
     Args:
         numero_factura: Número de la factura a eliminar
+        version: Versión que vio el usuario (opcional); si la factura cambió
+            desde entonces no se elimina y se lanza FacturaModificada
 
     Returns:
         bool: True si se eliminó correctamente, False si hubo error
     """
-    nombre_archivo = f"cache/factura_{str(numero_factura).zfill(3)}.txt"
+    try:
+        with bloquear_factura(numero_factura):
+            nombre_archivo = buscar_ruta_factura(numero_factura)
+            if version is not None and _version_archivo(nombre_archivo) != version:
+                raise FacturaModificada(f"La factura {numero_factura:03d} fue modificada por otra sesión")
+
+            if nombre_archivo is not None:
+                with bitacora.operacion("eliminar", numero_factura):
+                    _aplicar_eliminacion(numero_factura)
+                print(f"✅ Factura {numero_factura:03d} eliminada correctamente")
+                return True
+            else:
+                print(f"❌ No existe la factura {numero_factura:03d}")
+                return False
 
+    except FacturaModificada:
+        raise
+    except Exception as e:
+        print(f"❌ Error al eliminar factura {numero_factura:03d}: {e}")
+        return False
+
+
+def marcar_eliminada(numero_factura, version=None):
+    """
+    Elimina una factura dejando una lápida, sin borrar todavía el archivo.
+
+    La factura desaparece en el momento del índice (y con él de los listados,
+    agregados y reportes), pero se puede recuperar con deshacer_eliminacion
+    hasta que el compactador la borre (ver compactar_eliminadas).
+
+    Args:
+        numero_factura: Número de la factura a eliminar
+        version: Versión que vio el usuario (opcional); si la factura cambió
+            desde entonces no se elimina y se lanza FacturaModificada
+
+    Returns:
+        bool: True si se eliminó correctamente, False si hubo error
+    """
     try:
-        if os.path.exists(nombre_archivo):
-            os.remove(nombre_archivo)
-            print(f"✅ Factura {numero_factura:03d} eliminada correctamente")
-            return True
-        else:
-            print(f"❌ No existe la factura {numero_factura:03d}")
-            return False
+        with bloquear_factura(numero_factura):
+            nombre_archivo = buscar_ruta_factura(numero_factura)
+            if version is not None and _version_archivo(nombre_archivo) != version:
+                raise FacturaModificada(f"La factura {numero_factura:03d} fue modificada por otra sesión")
+
+            if nombre_archivo is None:
+                print(f"❌ No existe la factura {numero_factura:03d}")
+                return False
+
+            marca = f"{time.time()}\n"
+            with bitacora.operacion("marcar", numero_factura, marca):
+                _aplicar_lapida(numero_factura, marca)
 
+        programar_compactacion()
+        print(f"✅ Factura {numero_factura:03d} eliminada (se puede deshacer)")
+        return True
+
+    except FacturaModificada:
+        raise
     except Exception as e:
         print(f"❌ Error al eliminar factura {numero_factura:03d}: {e}")
         return False
 
 
+def _vigentes(numeros, versiones):
+    # Rutas de las facturas que existen y siguen en la versión indicada; debe
+    # llamarse con las facturas bloqueadas
+    vigentes = {}
+    for numero in numeros:
+        ruta = buscar_ruta_factura(numero)
+        version = versiones.get(numero) if versiones else None
+        if ruta is None or (version is not None and _version_archivo(ruta) != version):
+            print(f"❌ La factura {numero:03d} fue modificada o eliminada por otra sesión")
+            continue
+        vigentes[numero] = ruta
+    return vigentes
+
+
+def eliminar_facturas(numeros, versiones=None):
+    """
+    Elimina varias facturas de una vez.
+
+    Se bloquean todas juntas y se borran con un solo registro en la
+    bitácora y una sola actualización del índice.
+
+    Args:
+        numeros: Números de las facturas a eliminar
+        versiones: Diccionario numero -> versión que vio el usuario
+            (opcional); las facturas que cambiaron desde entonces no se
+            eliminan
+
+    Returns:
+        list: Números de las facturas eliminadas
+    """
+    numeros = sorted(set(numeros))
+    try:
+        with bloquear_facturas(numeros):
+            eliminadas = sorted(_vigentes(numeros, versiones))
+            if eliminadas:
+                _borrar_facturas(eliminadas)
+
+        print(f"✅ Facturas eliminadas: {len(eliminadas)}")
+        return eliminadas
+
+    except Exception as e:
+        print(f"❌ Error al eliminar las facturas: {e}")
+        return []
+
+
+def marcar_eliminadas(numeros, versiones=None):
+    """
+    Elimina varias facturas dejando una lápida en cada una (ver
+    marcar_eliminada), escribiendo todas las lápidas en un solo commit
+    agrupado y con una sola actualización del índice.
+
+    Args:
+        numeros: Números de las facturas a eliminar
+        versiones: Diccionario numero -> versión que vio el usuario
+            (opcional); las facturas que cambiaron desde entonces no se
+            eliminan
+
+    Returns:
+        list: Números de las facturas eliminadas
+    """
+    numeros = sorted(set(numeros))
+    try:
+        with bloquear_facturas(numeros):
+            vigentes = sorted(_vigentes(numeros, versiones))
+            if vigentes:
+                os.makedirs(os.path.dirname(ruta_lapida(vigentes[0])), exist_ok=True)
+            marca = f"{time.time()}\n"
+            seqs = dict(zip(vigentes, bitacora.registrar([{'op': "marcar", 'numero': numero, 'contenido': marca}
+                                                          for numero in vigentes])))
+            errores = dict(escribir_atomico_lote([(ruta_lapida(numero), marca) for numero in vigentes]))
+            eliminadas = [numero for numero in vigentes if errores[ruta_lapida(numero)] is None]
+            for numero in eliminadas:
+                os.utime(ruta_lapida(numero), (float(marca), float(marca)))
+            quitar_facturas(eliminadas)
+            bitacora.confirmar([seqs[numero] for numero in eliminadas])
+            bitacora.confirmar([seqs[numero] for numero in vigentes if numero not in eliminadas], ok=False)
+
+        if eliminadas:
+            programar_compactacion()
+        print(f"✅ Facturas eliminadas (se puede deshacer): {len(eliminadas)}")
+        return eliminadas
+
+    except Exception as e:
+        print(f"❌ Error al eliminar las facturas: {e}")
+        return []
+
+
+def deshacer_eliminacion(numero_factura):
+    """
+    Recupera una factura eliminada con marcar_eliminada que todavía no se
+    compactó.
+
+    Args:
+        numero_factura: Número de la factura
+
+    Returns:
+        bool: True si se recuperó, False si ya no se puede
+    """
+    try:
+        with bloquear_factura(numero_factura):
+            ruta = buscar_ruta_factura(numero_factura, incluir_eliminadas=True)
+            if ruta is None or not os.path.exists(ruta_lapida(numero_factura)):
+                print(f"❌ La factura {numero_factura:03d} ya no se puede recuperar")
+                return False
+            with bitacora.operacion("deshacer", numero_factura):
+                _aplicar_deshacer(numero_factura)
+
+        print(f"✅ Factura {numero_factura:03d} recuperada")
+        return True
+
+    except Exception as e:
+        print(f"❌ Error al recuperar la factura {numero_factura:03d}: {e}")
+        return False
+
+
+def listar_eliminadas():
+    """
+    Facturas eliminadas que todavía se pueden recuperar.
+
+    Returns:
+        list: Tuplas (numero, eliminada_en) ordenadas por número, con la
+            fecha de eliminación como timestamp
+    """
+    eliminadas = []
+    for numero in sorted(numeros_eliminados()):
+        try:
+            eliminadas.append((numero, os.stat(ruta_lapida(numero)).st_mtime))
+        except FileNotFoundError:
+            continue
+    return eliminadas
+
+
+def _borrar_facturas(numeros):
+    # Borra del disco varias facturas ya bloqueadas, con un solo registro en
+    # la bitácora, una sola reescritura por paquete del archivo y una sola
+    # escritura del índice. Si algo falla, la eliminación queda pendiente en
+    # la bitácora y recuperar_bitacora la termina.
+    seqs = bitacora.registrar([{'op': "eliminar", 'numero': numero} for numero in numeros])
+
+    por_paquete = {}
+    for numero in numeros:
+        _quitar_sueltas(numero)
+        if ruta_archivada(numero, nombre_archivo_factura(numero)) is not None:
+            por_paquete.setdefault(ruta_paquete(numero), []).append(nombre_archivo_factura(numero))
+
+    for paquete, nombres in sorted(por_paquete.items()):
+        with bloquear_paquete(paquete):
+            reescribir_paquete(paquete, quitar=nombres)
+
+    for numero in numeros:
+        quitar_lapida(numero)
+    quitar_facturas(numeros)
+    bitacora.confirmar(seqs)
+
+
+def _compactar_tanda(numeros):
+    # Borra del disco una tanda de facturas con lápida; devuelve cuántas borró
+    with bloquear_facturas(numeros):
+        # Las que se recuperaron mientras tanto se dejan
+        numeros = [numero for numero in numeros if os.path.exists(ruta_lapida(numero))]
+        if numeros:
+            _borrar_facturas(numeros)
+    return len(numeros)
+
+
+def compactar_eliminadas(espera=None):
+    """
+    Borra del disco las facturas eliminadas hace más de `espera` segundos,
+    por tandas: un solo registro en la bitácora por tanda y una sola
+    reescritura por paquete del archivo.
+
+    Args:
+        espera: Segundos desde la eliminación (por defecto VENTANA_DESHACER)
+
+    Returns:
+        int: Cantidad de facturas borradas
+    """
+    if espera is None:
+        espera = VENTANA_DESHACER
+    limite = time.time() - espera
+    vencidas = [numero for numero, eliminada_en in listar_eliminadas() if eliminada_en <= limite]
+
+    compactadas = 0
+    try:
+        for inicio in range(0, len(vencidas), TAMAÑO_TANDA_COMPACTACION):
+            compactadas += _compactar_tanda(vencidas[inicio:inicio + TAMAÑO_TANDA_COMPACTACION])
+    except Exception as e:
+        print(f"❌ Error al compactar las facturas eliminadas: {e}")
+
+    if compactadas:
+        print(f"✅ Facturas eliminadas borradas del disco: {compactadas}")
+    return compactadas
+
+
+# Compactador en segundo plano: uno por proceso, mientras haya lápidas
+_lock_compactador = threading.Lock()
+_compactador = {
+    'hilo': None
+}
+
+
+def _compactar_en_segundo_plano():
+    while True:
+        with _lock_compactador:
+            eliminadas = listar_eliminadas()
+            if not eliminadas:
+                _compactador['hilo'] = None
+                return
+        # Se duerme hasta que venza la lápida más antigua
+        espera = min(eliminada_en for _, eliminada_en in eliminadas) + VENTANA_DESHACER - time.time()
+        time.sleep(min(max(espera, 0) + 1, VENTANA_DESHACER + 1))
+        if not compactar_eliminadas() and espera <= 0:
+            # No se pudo compactar nada de lo vencido: se reintenta más tarde
+            time.sleep(60)
+
+
+def programar_compactacion():
+    """
+    Inicia el compactador en un hilo aparte si todavía no está corriendo;
+    termina solo cuando ya no quedan facturas eliminadas.
+
+    Returns:
+        bool: True si se inició, False si ya había uno en curso
+    """
+    with _lock_compactador:
+        if _compactador['hilo'] is not None:
+            return False
+        hilo = threading.Thread(target=_compactar_en_segundo_plano, name="compactador-facturas", daemon=True)
+        _compactador['hilo'] = hilo
+        hilo.start()
+        return True
+
+
 def crear_backup_factura(numero_factura, carpeta_backup="backups"):
     """
     Crea una copia de respaldo de una factura.
 
+    Hace un respaldo incremental de todas las facturas (ver utils.backup):
+    la factura solo se copia si cambió desde el respaldo anterior.
+
     Args:
         numero_factura: Número de la factura a respaldar
         carpeta_backup: Carpeta donde guardar el respaldo
@@ -216,29 +929,133 @@ def crear_backup_factura(numero_factura, carpeta_backup="backups"):
     Returns:
         str: Ruta del archivo de respaldo o None si hubo error
     """
-    import shutil
-    from datetime import datetime
+    if buscar_ruta_factura(numero_factura) is None:
+        return None
 
-    nombre_archivo = f"cache/factura_{str(numero_factura).zfill(3)}.txt"
+    return crear_backup(carpeta_backup)
+
+
+def _terminada(seq, desde_seq):
+    return any(registro['op'] == bitacora.HECHO and registro['ref'] == seq
+               for _, registro in bitacora.registros(desde_seq))
 
-    if not os.path.exists(nombre_archivo):
-        return None
 
+def recuperar_bitacora():
+    """
+    Termina las operaciones de la bitácora que quedaron a medias (por
+    ejemplo, por un corte de luz) y avanza el punto de control.
+
+    De cada factura solo se vuelve a aplicar la última operación pendiente,
+    que tiene su contenido completo; las anteriores se cancelan.
+
+    Returns:
+        int: Cantidad de operaciones aplicadas de nuevo
+    """
     try:
-        # Crear carpeta de respaldo si no existe
-        if not os.path.exists(carpeta_backup):
-            os.makedirs(carpeta_backup)
+        desde = bitacora.leer_punto() + 1
+        operaciones, ultimo = bitacora.operaciones_desde(desde)
+        ultimas = {registro['numero']: registro['seq'] for registro, _ in operaciones}
 
-        # Nombre del archivo de respaldo con timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        nombre_backup = f"{carpeta_backup}/factura_{numero_factura:03d}_backup_{timestamp}.txt"
+        rehechas = 0
+        for registro, ok in operaciones:
+            if ok is not None:
+                continue
+            numero, seq = registro['numero'], registro['seq']
+            if ultimas[numero] != seq:
+                bitacora.confirmar([seq], ok=False)
+                continue
 
-        # Copiar archivo
-        shutil.copy2(nombre_archivo, nombre_backup)
+            with bloquear_factura(numero):
+                # Si otro proceso la estaba aplicando, ya la terminó
+                if _terminada(seq, ultimo + 1):
+                    continue
+                _rehacer(registro)
+                bitacora.confirmar([seq])
+                rehechas += 1
 
-        print(f"✅ Backup creado: {nombre_backup}")
-        return nombre_backup
+        if ultimo >= desde:
+            bitacora.guardar_punto(ultimo)
+        if rehechas:
+            print(f"✅ Bitácora recuperada: {rehechas} operaciones aplicadas de nuevo")
+        return rehechas
 
     except Exception as e:
-        print(f"❌ Error al crear backup de factura {numero_factura:03d}: {e}")
-        return None
\ No newline at end of file
+        print(f"❌ Error al recuperar la bitácora: {e}")
+        return 0
+
+
+def reindexar_desde(desde_seq):
+    """
+    Actualiza el índice (y con él los agregados) solo con las facturas que
+    la bitácora registra como modificadas desde un seq, en lugar de
+    reconstruirlo entero.
+
+    Args:
+        desde_seq: Seq desde el cual reindexar (por ejemplo, un punto de control)
+
+    Returns:
+        int: Cantidad de facturas reindexadas
+    """
+    numeros = bitacora.facturas_modificadas(desde_seq)
+    rutas = {numero: buscar_ruta_factura(numero) for numero in numeros}
+    registrar_facturas([(ruta, None, None, None, None, None) for ruta in rutas.values() if ruta is not None])
+    for numero, ruta in rutas.items():
+        if ruta is None:
+            quitar_factura(numero)
+
+    print(f"✅ Facturas reindexadas desde la bitácora: {len(numeros)}")
+    return len(numeros)
+
+
+def posicion_replica():
+    """Último seq de la bitácora del servidor principal aplicado en esta réplica."""
+    try:
+        with open(ARCHIVO_REPLICA, "r", encoding="utf-8") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return 0
+
+
+def aplicar_replica(lineas):
+    """
+    Aplica en esta réplica las operaciones exportadas por el servidor
+    principal (bitacora.exportar), en orden y una sola vez cada una.
+
+    Las facturas quedan con el mismo contenido que en el principal, y cada
+    operación pasa también por la bitácora local.
+
+    Args:
+        lineas: Iterable de líneas (bytes) de la bitácora del principal
+
+    Returns:
+        int: Cantidad de operaciones aplicadas
+    """
+    aplicado = posicion_replica()
+    aplicadas = 0
+    try:
+        for registro in bitacora.leer_lineas(lineas):
+            if registro['seq'] <= aplicado or registro['op'] == bitacora.HECHO:
+                continue
+
+            numero = registro['numero']
+            with bloquear_factura(numero), bitacora.operacion(registro['op'], numero, registro.get('contenido')):
+                _rehacer(registro)
+                if registro['op'] in ("guardar", "editar", "restaurar"):
+                    ajustar_secuencia(numero)
+            aplicado = registro['seq']
+            aplicadas += 1
+    finally:
+        if aplicadas:
+            escribir_atomico(ARCHIVO_REPLICA, f"{aplicado}\n")
+
+    print(f"✅ Réplica actualizada hasta el seq {aplicado}: {aplicadas} operaciones")
+    return aplicadas
+
+
+if __name__ == "__main__":
+    # Uso: python -m utils.archivo --compactar [SEGUNDOS]
+    import sys
+
+    if "--compactar" in sys.argv:
+        posicion = sys.argv.index("--compactar") + 1
+        compactar_eliminadas(float(sys.argv[posicion]) if posicion < len(sys.argv) else None)
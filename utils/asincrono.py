@@ -0,0 +1,196 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.almacenamiento import obtener_repositorio
+from utils.paralelo import TRABAJADORES
+
+# Versión asíncrona del almacenamiento: las operaciones del repositorio como
+# corrutinas que esperan al disco en un pool de hilos de tamaño fijo, sin
+# bloquear el bucle de eventos (API HTTP, trabajos por lotes con asyncio).
+#
+# El pool es uno solo por proceso, así que por muchas corrutinas que esperen
+# nunca hay más de HILOS_ASINCRONOS operaciones de disco a la vez; las
+# consultas en abanico (cargar_muchas, ...) además dejan como máximo
+# MAX_EN_CURSO pedidos en la cola del pool.
+HILOS_ASINCRONOS = int(os.environ.get("PERU_DELIVERY_HILOS_ASINCRONOS", "0")) or TRABAJADORES
+MAX_EN_CURSO = HILOS_ASINCRONOS * 4
+
+_lock_pool = threading.Lock()
+_pool = {
+    'ejecutor': None
+}
+
+
+def _ejecutor():
+    with _lock_pool:
+        if _pool['ejecutor'] is None:
+            _pool['ejecutor'] = ThreadPoolExecutor(max_workers=HILOS_ASINCRONOS, thread_name_prefix="facturas-async")
+        return _pool['ejecutor']
+
+
+def cerrar_pool():
+    """Espera a que terminen las operaciones en curso y cierra el pool de hilos."""
+    with _lock_pool:
+        ejecutor, _pool['ejecutor'] = _pool['ejecutor'], None
+    if ejecutor is not None:
+        ejecutor.shutdown(wait=True)
+
+
+async def ejecutar(funcion, *args, **kwargs):
+    """
+    Ejecuta una función bloqueante en el pool de hilos y espera su resultado
+    sin bloquear el bucle de eventos.
+
+    Args:
+        funcion: Función a ejecutar
+        *args, **kwargs: Sus argumentos
+
+    Returns:
+        Lo que devuelve la función (sus excepciones se propagan)
+    """
+    return await asyncio.get_running_loop().run_in_executor(_ejecutor(), functools.partial(funcion, *args, **kwargs))
+
+
+async def mapear(funcion, elementos, limite=MAX_EN_CURSO):
+    """
+    Aplica una función bloqueante a muchos elementos a la vez en el pool.
+
+    Args:
+        funcion: Función a aplicar
+        elementos: Iterable con los elementos
+        limite: Máximo de llamadas en curso o en espera en el pool
+
+    Returns:
+        list: Resultados en el mismo orden que los elementos
+    """
+    semaforo = asyncio.Semaphore(limite)
+
+    async def aplicar(elemento):
+        async with semaforo:
+            return await ejecutar(funcion, elemento)
+
+    return await asyncio.gather(*(aplicar(elemento) for elemento in elementos))
+
+
+class RepositorioAsincrono:
+    """
+    Envoltura asíncrona de un RepositorioFacturas: los mismos métodos (con
+    los mismos argumentos y resultados) como corrutinas, más consultas en
+    abanico para muchas facturas a la vez.
+    """
+
+    def __init__(self, repositorio):
+        self.repositorio = repositorio
+        self.nombre = repositorio.nombre
+
+    async def guardar(self, productos, subtotal, igv, total, numero=None):
+        """Guarda una factura nueva y devuelve su número, o None si hubo error."""
+        return await ejecutar(self.repositorio.guardar, productos, subtotal, igv, total, numero=numero)
+
+    async def guardar_lote(self, facturas, fechas=None):
+        """Guarda varias facturas con números ya reservados (ver RepositorioFacturas.guardar_lote)."""
+        return await ejecutar(self.repositorio.guardar_lote, facturas, fechas=fechas)
+
+    async def reservar_numeros(self, cantidad=1):
+        """Reserva un bloque de números de factura consecutivos."""
+        return await ejecutar(self.repositorio.reservar_numeros, cantidad)
+
+    async def cargar(self, numero):
+        """Devuelve los productos de una factura como tuplas (nombre, precio, cantidad)."""
+        return await ejecutar(self.repositorio.cargar, numero)
+
+    async def cargar_muchas(self, numeros, limite=MAX_EN_CURSO):
+        """
+        Carga los productos de muchas facturas a la vez.
+
+        Returns:
+            list: Productos de cada factura, en el mismo orden que numeros
+        """
+        return await mapear(self.repositorio.cargar, numeros, limite)
+
+    async def obtener_info(self, numero):
+        """Devuelve la información de una factura o None si no existe."""
+        return await ejecutar(self.repositorio.obtener_info, numero)
+
+    async def obtener_muchas(self, numeros, limite=MAX_EN_CURSO):
+        """
+        Obtiene la información de muchas facturas a la vez.
+
+        Returns:
+            list: Información de cada factura (None si no existe), en el
+                mismo orden que numeros
+        """
+        return await mapear(self.repositorio.obtener_info, numeros, limite)
+
+    async def contenido(self, numero):
+        """Devuelve el texto imprimible de una factura o None si no existe."""
+        return await ejecutar(self.repositorio.contenido, numero)
+
+    async def listar(self):
+        """Devuelve la información de todas las facturas ordenadas por número."""
+        return await ejecutar(self.repositorio.listar)
+
+    async def buscar(self, **filtros):
+        """Filtra facturas (ver RepositorioFacturas.buscar)."""
+        return await ejecutar(self.repositorio.buscar, **filtros)
+
+    async def version(self, numero):
+        """Devuelve la versión actual de una factura o None si no existe."""
+        return await ejecutar(self.repositorio.version, numero)
+
+    async def actualizar(self, numero, productos, subtotal, igv, total, version=None):
+        """Reemplaza una factura; lanza FacturaModificada si cambió la versión."""
+        return await ejecutar(self.repositorio.actualizar, numero, productos, subtotal, igv, total,
+                              version=version)
+
+    async def actualizar_lote(self, cambios):
+        """Reemplaza varias facturas de una vez (ver RepositorioFacturas.actualizar_lote)."""
+        return await ejecutar(self.repositorio.actualizar_lote, cambios)
+
+    async def eliminar(self, numero, version=None):
+        """Elimina una factura; lanza FacturaModificada si cambió la versión."""
+        return await ejecutar(self.repositorio.eliminar, numero, version=version)
+
+    async def eliminar_lote(self, numeros, versiones=None):
+        """Elimina varias facturas de una vez (ver RepositorioFacturas.eliminar_lote)."""
+        return await ejecutar(self.repositorio.eliminar_lote, numeros, versiones)
+
+    async def agregados(self):
+        """Agregados de todas las facturas (ver RepositorioFacturas.agregados)."""
+        return await ejecutar(self.repositorio.agregados)
+
+    async def crear_backup(self, carpeta_backup=None):
+        """
+        Crea un respaldo incremental de las facturas de texto (ver
+        utils.backup.crear_backup).
+
+        Returns:
+            str: Ruta del respaldo creado o None si hubo error
+        """
+        from utils.backup import CARPETA_BACKUP, crear_backup
+
+        return await ejecutar(crear_backup, carpeta_backup or CARPETA_BACKUP)
+
+
+_repositorios = {}
+_lock_repositorios = threading.Lock()
+
+
+def obtener_repositorio_asincrono(backend=None):
+    """
+    Devuelve la versión asíncrona del repositorio configurado.
+
+    Args:
+        backend: "texto", "sqlite" o "binario" (ver obtener_repositorio)
+
+    Returns:
+        RepositorioAsincrono: Instancia compartida
+    """
+    repositorio = obtener_repositorio(backend)
+    with _lock_repositorios:
+        if repositorio not in _repositorios:
+            _repositorios[repositorio] = RepositorioAsincrono(repositorio)
+        return _repositorios[repositorio]
@@ -0,0 +1,281 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+from utils.archivado import es_ruta_archivada, leer_texto
+from utils.escritura import escribir_atomico
+from utils.paralelo import mapear_ordenado
+
+# Respaldos incrementales de las facturas de texto. Cada ejecución escribe un
+# solo zip (backups/backup_AAAAMMDD_HHMMSS.zip) con:
+# - manifiesto.json: todas las facturas en ese momento, cada una con el hash
+#   SHA-256 de su contenido, y en qué respaldo está guardado cada contenido
+# - objetos/<hash>: solo los contenidos que ningún respaldo anterior tenía
+# Así cada respaldo permite restaurar el estado completo de su momento,
+# aunque solo copie lo que cambió.
+CARPETA_BACKUP = "backups"
+MANIFIESTO = "manifiesto.json"
+PREFIJO = "backup_"
+
+# Respaldo en segundo plano: lo comparten todas las sesiones del proceso
+_lock_segundo_plano = threading.Lock()
+_segundo_plano = {
+    'hilo': None,
+    'resultado': None,
+    'error': None
+}
+
+
+def listar_backups(carpeta_backup=CARPETA_BACKUP):
+    """
+    Lista los respaldos disponibles, del más antiguo al más reciente.
+
+    Returns:
+        list: Rutas de los archivos de respaldo
+    """
+    if not os.path.isdir(carpeta_backup):
+        return []
+    with os.scandir(carpeta_backup) as entradas:
+        return sorted(e.path for e in entradas
+                      if e.name.startswith(PREFIJO) and e.name.endswith(".zip") and e.is_file())
+
+
+def leer_manifiesto(ruta_backup):
+    """
+    Lee el manifiesto de un respaldo.
+
+    Returns:
+        dict: 'creado' (timestamp), 'facturas' (numero -> [hash, mtime_ns,
+            tamaño]) y 'objetos' (hash -> nombre del respaldo que lo guarda)
+    """
+    with zipfile.ZipFile(ruta_backup) as zf:
+        manifiesto = json.loads(zf.read(MANIFIESTO))
+    manifiesto['facturas'] = {int(numero): datos for numero, datos in manifiesto['facturas'].items()}
+    return manifiesto
+
+
+def _leer_contenido(ruta):
+    # Contenido en bytes de una factura suelta o archivada, y su hash
+    if es_ruta_archivada(ruta):
+        contenido = leer_texto(ruta).encode("utf-8")
+    else:
+        with open(ruta, "rb") as f:
+            contenido = f.read()
+    return hashlib.sha256(contenido).hexdigest(), contenido
+
+
+def _leer_o_ninguno(ruta):
+    try:
+        return _leer_contenido(ruta)
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def crear_backup(carpeta_backup=CARPETA_BACKUP, trabajadores=None):
+    """
+    Crea un respaldo incremental de todas las facturas de texto.
+
+    Solo se leen las facturas cuya fecha de modificación o tamaño cambió
+    desde el respaldo anterior, y solo se copian los contenidos nuevos.
+
+    Args:
+        carpeta_backup: Carpeta de los respaldos
+        trabajadores: Cantidad de hilos o procesos para leer las facturas
+
+    Returns:
+        str: Ruta del respaldo creado o None si hubo error
+    """
+    from utils.indice import reconciliar_indice
+
+    try:
+        respaldos = listar_backups(carpeta_backup)
+        anterior = leer_manifiesto(respaldos[-1]) if respaldos else {'facturas': {}, 'objetos': {}}
+
+        facturas = {}
+        pendientes = []
+        for numero, entrada in sorted(reconciliar_indice().items()):
+            previa = anterior['facturas'].get(numero)
+            estado = [entrada['mtime_ns'], entrada['tamaño_bytes']]
+            if previa is not None and previa[1:] == estado and previa[0] in anterior['objetos']:
+                facturas[numero] = previa
+            else:
+                pendientes.append((numero, entrada['ruta'], estado))
+
+        creado = time.time()
+        marca = datetime.fromtimestamp(creado).strftime('%Y%m%d_%H%M%S')
+        nombre = f"{PREFIJO}{marca}.zip"
+        repeticion = 1
+        while os.path.exists(os.path.join(carpeta_backup, nombre)):
+            nombre = f"{PREFIJO}{marca}_{repeticion}.zip"
+            repeticion += 1
+
+        objetos = {}
+        nuevos = {}
+        leidos = mapear_ordenado(_leer_o_ninguno, [ruta for _, ruta, _ in pendientes], trabajadores)
+        for (numero, _, estado), leido in zip(pendientes, leidos):
+            if leido is None:
+                continue
+            hash_contenido, contenido = leido
+            facturas[numero] = [hash_contenido, *estado]
+            if hash_contenido not in anterior['objetos']:
+                nuevos[hash_contenido] = contenido
+
+        for hash_contenido, _, _ in facturas.values():
+            objetos[hash_contenido] = nombre if hash_contenido in nuevos else anterior['objetos'][hash_contenido]
+
+        manifiesto = {
+            'creado': creado,
+            'facturas': {str(numero): datos for numero, datos in sorted(facturas.items())},
+            'objetos': objetos
+        }
+
+        datos = io.BytesIO()
+        with zipfile.ZipFile(datos, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for hash_contenido, contenido in nuevos.items():
+                zf.writestr(f"objetos/{hash_contenido}", contenido)
+            zf.writestr(MANIFIESTO, json.dumps(manifiesto))
+
+        os.makedirs(carpeta_backup, exist_ok=True)
+        ruta_backup = os.path.join(carpeta_backup, nombre)
+        escribir_atomico(ruta_backup, datos.getvalue(), exclusivo=True)
+
+        print(f"✅ Backup creado: {ruta_backup} ({len(facturas)} facturas, {len(nuevos)} archivos nuevos)")
+        return ruta_backup
+
+    except Exception as e:
+        print(f"❌ Error al crear el backup: {e}")
+        return None
+
+
+def restaurar_backup(ruta_backup, numeros=None):
+    """
+    Restaura las facturas tal como estaban en un respaldo.
+
+    Cada factura que cambió desde el respaldo se reescribe como archivo suelto
+    con su contenido y su fecha de modificación originales; las que no
+    cambiaron no se tocan. Si se restaura todo el respaldo, las facturas
+    creadas después de él se eliminan.
+
+    Args:
+        ruta_backup: Ruta del respaldo
+        numeros: Números de las facturas a restaurar (por defecto todas)
+
+    Returns:
+        int: Cantidad de facturas reescritas, o None si hubo error
+    """
+    from utils import bitacora
+    from utils.archivo import bloquear_factura, eliminar_factura, quitar_lapida
+    from utils.indice import reconciliar_indice, registrar_facturas
+    from utils.rutas import buscar_ruta_factura, ruta_factura
+    from utils.secuencia import ajustar_secuencia
+
+    try:
+        manifiesto = leer_manifiesto(ruta_backup)
+        carpeta_backup = os.path.dirname(ruta_backup)
+        facturas = manifiesto['facturas']
+        elegidas = sorted(facturas) if numeros is None else sorted(n for n in numeros if n in facturas)
+        actuales = dict(reconciliar_indice())
+
+        # Se abre una sola vez cada respaldo que guarda alguno de los contenidos
+        por_respaldo = {}
+        for numero in elegidas:
+            actual = actuales.get(numero)
+            if actual is not None and [actual['mtime_ns'], actual['tamaño_bytes']] == facturas[numero][1:]:
+                continue
+            hash_contenido = facturas[numero][0]
+            por_respaldo.setdefault(manifiesto['objetos'][hash_contenido], []).append(numero)
+
+        restauradas = []
+        for nombre, numeros_respaldo in sorted(por_respaldo.items()):
+            with zipfile.ZipFile(os.path.join(carpeta_backup, nombre)) as zf:
+                for numero in numeros_respaldo:
+                    hash_contenido, mtime_ns, _ = facturas[numero]
+                    contenido = zf.read(f"objetos/{hash_contenido}")
+                    if hashlib.sha256(contenido).hexdigest() != hash_contenido:
+                        raise ValueError(f"Contenido dañado de la factura {numero:03d} en {nombre}")
+
+                    with bloquear_factura(numero):
+                        with bitacora.operacion("restaurar", numero, contenido.decode("utf-8")):
+                            # Sobre el archivo suelto que ya tenga (aunque tenga lápida), para
+                            # no dejar dos copias de la misma factura
+                            ruta = buscar_ruta_factura(numero, incluir_eliminadas=True)
+                            if ruta is None or es_ruta_archivada(ruta):
+                                ruta = ruta_factura(numero, crear_carpeta=True)
+                            escribir_atomico(ruta, contenido)
+                            os.utime(ruta, ns=(mtime_ns, mtime_ns))
+                            quitar_lapida(numero)
+                    restauradas.append((ruta, None, None, None, None, None))
+
+        registrar_facturas(restauradas)
+        if elegidas:
+            ajustar_secuencia(elegidas[-1])
+
+        if numeros is None:
+            for numero in sorted(set(actuales) - set(facturas)):
+                eliminar_factura(numero)
+
+        print(f"✅ Backup restaurado: {ruta_backup} ({len(restauradas)} facturas)")
+        return len(restauradas)
+
+    except Exception as e:
+        print(f"❌ Error al restaurar el backup {ruta_backup}: {e}")
+        return None
+
+
+def _respaldar_en_segundo_plano(carpeta_backup):
+    try:
+        resultado = crear_backup(carpeta_backup)
+        error = None if resultado else "No se pudo crear el backup"
+    except Exception as e:
+        resultado, error = None, str(e)
+    with _lock_segundo_plano:
+        _segundo_plano.update({'resultado': resultado, 'error': error})
+
+
+def iniciar_backup(carpeta_backup=CARPETA_BACKUP):
+    """
+    Crea un respaldo en un hilo aparte, sin bloquear la página.
+
+    Returns:
+        bool: True si se inició, False si ya había uno en curso
+    """
+    with _lock_segundo_plano:
+        if _segundo_plano['hilo'] is not None and _segundo_plano['hilo'].is_alive():
+            return False
+        hilo = threading.Thread(target=_respaldar_en_segundo_plano, args=(carpeta_backup,),
+                                name="backup-facturas", daemon=True)
+        _segundo_plano.update({'hilo': hilo, 'resultado': None, 'error': None})
+        hilo.start()
+        return True
+
+
+def estado_backup():
+    """
+    Estado del respaldo en segundo plano.
+
+    Returns:
+        dict: en_curso (bool), resultado (ruta del último respaldo creado o
+            None) y error (mensaje o None)
+    """
+    with _lock_segundo_plano:
+        hilo = _segundo_plano['hilo']
+        return {
+            'en_curso': hilo is not None and hilo.is_alive(),
+            'resultado': _segundo_plano['resultado'],
+            'error': _segundo_plano['error']
+        }
+
+
+if __name__ == "__main__":
+    # Uso: python -m utils.backup [--restaurar backups/backup_AAAAMMDD_HHMMSS.zip]
+    import sys
+
+    if "--restaurar" in sys.argv:
+        restaurar_backup(sys.argv[sys.argv.index("--restaurar") + 1])
+    else:
+        crear_backup()
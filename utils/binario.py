@@ -0,0 +1,502 @@
+import bisect
+import contextlib
+import os
+import struct
+import threading
+import time
+
+from utils.archivo import FacturaModificada
+from utils.bloqueo import bloquear_archivo
+from utils.dinero import a_centimos
+from utils.escritura import escribir_atomico, sincronizar_directorio
+from utils.rutas import CARPETA, FACTURAS_POR_CARPETA
+
+# Formato binario de las facturas: un archivo por cada bloque de 1000
+# facturas (cache/binario/0000.bin, 0001.bin, ...) con registros de solo
+# anexado. Cada registro es su longitud (4 bytes), una cabecera de tamaño fijo
+# con los montos en céntimos y luego los productos. La cabecera va primero, así
+# que listar o sumar montos no decodifica ningún producto ni texto.
+CARPETA_BINARIO = os.path.join(CARPETA, "binario")
+ARCHIVO_SECUENCIA = os.path.join(CARPETA_BINARIO, "secuencia.txt")
+ARCHIVO_LOCK_SECUENCIA = os.path.join(CARPETA_BINARIO, "secuencia.lock")
+
+_LONGITUD = struct.Struct("<I")
+# tipo, numero, fecha, version, subtotal, igv, total, num_items
+_CABECERA = struct.Struct("<BqdIqqqH")
+# precio en céntimos, cantidad, largo del nombre en bytes
+_PRODUCTO = struct.Struct("<qIH")
+
+TIPO_FACTURA = 1
+TIPO_BAJA = 2
+
+# Columnas de la cabecera, en orden
+COLUMNAS = ('tipo', 'numero', 'fecha', 'version', 'subtotal_centimos', 'igv_centimos', 'total_centimos',
+            'num_items')
+
+# Compactar un bloque cuando tenga más registros reemplazados que vigentes
+REGISTROS_SOBRANTES_MIN = 100
+
+_lock = threading.RLock()
+_bloques = {}
+
+
+def _ruta_bloque(numero):
+    return os.path.join(CARPETA_BINARIO, f"{numero // FACTURAS_POR_CARPETA:04d}.bin")
+
+
+def _ruta_lock(ruta_bloque):
+    return ruta_bloque[:-len(".bin")] + ".lock"
+
+
+def _rutas_bloques():
+    if not os.path.isdir(CARPETA_BINARIO):
+        return []
+    with os.scandir(CARPETA_BINARIO) as entradas:
+        return sorted(entrada.path for entrada in entradas if entrada.name.endswith(".bin"))
+
+
+def codificar_factura(numero, fecha, version, productos, subtotal, igv, total):
+    """
+    Codifica una factura como registro binario.
+
+    Args:
+        numero: Número de la factura
+        fecha: Fecha de emisión (timestamp)
+        version: Versión del registro
+        productos: Lista de tuplas (nombre, precio, cantidad[, total_item]) con
+            montos en soles
+        subtotal, igv, total: Montos en soles
+
+    Returns:
+        bytes: Registro listo para anexar
+    """
+    partes = [_CABECERA.pack(TIPO_FACTURA, numero, fecha, version, a_centimos(subtotal), a_centimos(igv),
+                             a_centimos(total), len(productos))]
+    for nombre, precio, cantidad, *_ in productos:
+        nombre_bytes = nombre.encode("utf-8")
+        partes.append(_PRODUCTO.pack(a_centimos(precio), cantidad, len(nombre_bytes)))
+        partes.append(nombre_bytes)
+
+    cuerpo = b"".join(partes)
+    return _LONGITUD.pack(len(cuerpo)) + cuerpo
+
+
+def _codificar_baja(numero, version):
+    cuerpo = _CABECERA.pack(TIPO_BAJA, numero, time.time(), version, 0, 0, 0, 0)
+    return _LONGITUD.pack(len(cuerpo)) + cuerpo
+
+
+def decodificar_productos(registro):
+    """
+    Obtiene los productos de un registro (sin el prefijo de longitud).
+
+    Returns:
+        list: Tuplas (nombre, precio_centimos, cantidad)
+    """
+    num_items = _CABECERA.unpack_from(registro)[-1]
+    productos = []
+    posicion = _CABECERA.size
+    for _ in range(num_items):
+        precio, cantidad, largo = _PRODUCTO.unpack_from(registro, posicion)
+        posicion += _PRODUCTO.size
+        productos.append((registro[posicion:posicion + largo].decode("utf-8"), precio, cantidad))
+        posicion += largo
+    return productos
+
+
+def _cargar_bloque(ruta, abierto=None):
+    # Igual que el índice de texto: solo se leen los registros nuevos. Con
+    # abierto (el bloque ya abierto por quien llama) las posiciones quedan
+    # como las de ese archivo aunque otro proceso lo haya reemplazado después
+    with _lock:
+        estado = _bloques.get(ruta)
+        if abierto is not None:
+            contexto = contextlib.nullcontext(abierto)
+        else:
+            try:
+                contexto = open(ruta, "rb")
+            except FileNotFoundError:
+                _bloques.pop(ruta, None)
+                return {'inodo': None, 'offset': 0, 'registros': 0, 'facturas': {}, 'posiciones': [], 'numeros': []}
+
+        with contexto as f:
+            stat = os.fstat(f.fileno())
+            if estado is None or stat.st_ino != estado['inodo'] or stat.st_size < estado['offset']:
+                estado = {'inodo': stat.st_ino, 'offset': 0, 'registros': 0, 'facturas': {},
+                          'posiciones': [], 'numeros': []}
+                _bloques[ruta] = estado
+
+            if stat.st_size == estado['offset']:
+                return estado
+
+            f.seek(estado['offset'])
+            datos = f.read()
+
+        posicion = 0
+        # Un registro incompleto al final (escritura en curso o interrumpida) se ignora
+        while posicion + _LONGITUD.size + _CABECERA.size <= len(datos):
+            (longitud,) = _LONGITUD.unpack_from(datos, posicion)
+            if posicion + _LONGITUD.size + longitud > len(datos):
+                break
+
+            cabecera = _CABECERA.unpack_from(datos, posicion + _LONGITUD.size)
+            numero = cabecera[1]
+            inicio = estado['offset'] + posicion
+            if cabecera[0] == TIPO_BAJA:
+                estado['facturas'].pop(numero, None)
+            else:
+                estado['facturas'][numero] = (inicio, longitud, cabecera)
+            estado['posiciones'].append(inicio)
+            estado['numeros'].append(numero)
+            estado['registros'] += 1
+            posicion += _LONGITUD.size + longitud
+
+        estado['offset'] += posicion
+        return estado
+
+
+def _anexar(ruta, datos):
+    # Debe llamarse con el bloqueo del bloque tomado
+    nuevo = not os.path.exists(ruta)
+    estado = _cargar_bloque(ruta)
+
+    with open(ruta, "r+b" if not nuevo else "wb") as f:
+        # Descartar un registro a medio escribir de una escritura interrumpida
+        f.truncate(estado['offset'])
+        f.seek(estado['offset'])
+        f.write(datos)
+        f.flush()
+        os.fsync(f.fileno())
+
+    if nuevo:
+        sincronizar_directorio(CARPETA_BINARIO)
+
+    estado = _cargar_bloque(ruta)
+    if estado['registros'] - len(estado['facturas']) > max(REGISTROS_SOBRANTES_MIN, len(estado['facturas'])):
+        _compactar(ruta, estado)
+
+
+def _compactar(ruta, estado):
+    with open(ruta, "rb") as f:
+        partes = []
+        for numero in sorted(estado['facturas']):
+            inicio, longitud, _ = estado['facturas'][numero]
+            f.seek(inicio)
+            partes.append(f.read(_LONGITUD.size + longitud))
+    escribir_atomico(ruta, b"".join(partes))
+    _cargar_bloque(ruta)
+
+
+def _siguiente_numero():
+    try:
+        with open(ARCHIVO_SECUENCIA, "r", encoding="utf-8") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        mayor = max((max(_cargar_bloque(ruta)['numeros'], default=0) for ruta in _rutas_bloques()), default=0)
+        return mayor + 1
+
+
+def reservar_numeros(cantidad=1):
+    """
+    Reserva un bloque de números de factura consecutivos para el formato binario.
+
+    Returns:
+        range: Números reservados
+    """
+    if cantidad < 1:
+        raise ValueError("La cantidad a reservar debe ser mayor que 0")
+
+    os.makedirs(CARPETA_BINARIO, exist_ok=True)
+    with bloquear_archivo(ARCHIVO_LOCK_SECUENCIA):
+        inicio = _siguiente_numero()
+        escribir_atomico(ARCHIVO_SECUENCIA, f"{inicio + cantidad}\n")
+    return range(inicio, inicio + cantidad)
+
+
+def _ajustar_secuencia(mayor):
+    with bloquear_archivo(ARCHIVO_LOCK_SECUENCIA):
+        if _siguiente_numero() <= mayor:
+            escribir_atomico(ARCHIVO_SECUENCIA, f"{mayor + 1}\n")
+
+
+def guardar_facturas(facturas, fechas=None):
+    """
+    Guarda facturas nuevas con números ya reservados.
+
+    Las facturas de un mismo bloque se anexan con una sola escritura y un solo
+    fsync.
+
+    Args:
+        facturas: Lista de tuplas (numero, productos, subtotal, igv, total)
+        fechas: Diccionario numero -> fecha de emisión (timestamp) de las
+            facturas que conservan la de otra copia; las demás llevan la
+            fecha actual
+
+    Returns:
+        list: Números de las facturas guardadas
+    """
+    os.makedirs(CARPETA_BINARIO, exist_ok=True)
+
+    por_bloque = {}
+    for factura in facturas:
+        por_bloque.setdefault(_ruta_bloque(factura[0]), []).append(factura)
+
+    guardadas = []
+    for ruta, facturas_bloque in por_bloque.items():
+        with bloquear_archivo(_ruta_lock(ruta)):
+            existentes = _cargar_bloque(ruta)['facturas']
+            ahora = time.time()
+            registros = []
+            for numero, productos, subtotal, igv, total in facturas_bloque:
+                if numero in existentes:
+                    print(f"❌ Ya existe la factura {numero:03d}")
+                    continue
+                fecha = fechas[numero] if fechas and numero in fechas else ahora
+                registros.append(codificar_factura(numero, fecha, 1, productos, subtotal, igv, total))
+                guardadas.append(numero)
+
+            if registros:
+                _anexar(ruta, b"".join(registros))
+
+    if guardadas:
+        _ajustar_secuencia(max(guardadas))
+    return sorted(guardadas)
+
+
+def actualizar_factura(numero, productos, subtotal, igv, total, version=None):
+    """
+    Reemplaza una factura existente anexando un registro nuevo.
+
+    Args:
+        numero: Número de la factura
+        productos: Lista de tuplas (nombre, precio, cantidad, total_item)
+        subtotal, igv, total: Montos en soles
+        version: Versión leída al cargar la factura (opcional)
+
+    Returns:
+        bool: True si se actualizó, False si no existe
+    """
+    ruta = _ruta_bloque(numero)
+    with bloquear_archivo(_ruta_lock(ruta)):
+        actual = _cargar_bloque(ruta)['facturas'].get(numero)
+        if version is not None and (actual is None or actual[2][3] != version):
+            raise FacturaModificada(f"La factura {numero:03d} fue modificada por otra sesión")
+        if actual is None:
+            return False
+
+        # Se conserva la fecha de emisión y se sube la versión
+        cabecera = actual[2]
+        _anexar(ruta, codificar_factura(numero, cabecera[2], cabecera[3] + 1, productos, subtotal, igv, total))
+        return True
+
+
+def eliminar_factura(numero, version=None):
+    """
+    Elimina una factura anexando un registro de baja.
+
+    Returns:
+        bool: True si se eliminó, False si no existe
+    """
+    ruta = _ruta_bloque(numero)
+    with bloquear_archivo(_ruta_lock(ruta)):
+        actual = _cargar_bloque(ruta)['facturas'].get(numero)
+        if version is not None and (actual is None or actual[2][3] != version):
+            raise FacturaModificada(f"La factura {numero:03d} fue modificada por otra sesión")
+        if actual is None:
+            return False
+
+        _anexar(ruta, _codificar_baja(numero, actual[2][3] + 1))
+        return True
+
+
+def actualizar_facturas(cambios):
+    """
+    Reemplaza varias facturas existentes; las de un mismo bloque se anexan
+    con una sola escritura y un solo fsync.
+
+    Args:
+        cambios: Lista de tuplas (numero, productos, subtotal, igv, total,
+            version); las facturas que no existen o ya no están en esa
+            versión (si no es None) no se escriben
+
+    Returns:
+        list: Números de las facturas actualizadas
+    """
+    por_bloque = {}
+    for cambio in cambios:
+        por_bloque.setdefault(_ruta_bloque(cambio[0]), []).append(cambio)
+
+    actualizadas = []
+    for ruta, cambios_bloque in por_bloque.items():
+        with bloquear_archivo(_ruta_lock(ruta)):
+            existentes = _cargar_bloque(ruta)['facturas']
+            registros = []
+            for numero, productos, subtotal, igv, total, version in cambios_bloque:
+                actual = existentes.get(numero)
+                if actual is None or (version is not None and actual[2][3] != version):
+                    print(f"❌ La factura {numero:03d} fue modificada o eliminada por otra sesión")
+                    continue
+                cabecera = actual[2]
+                registros.append(codificar_factura(numero, cabecera[2], cabecera[3] + 1,
+                                                   productos, subtotal, igv, total))
+                actualizadas.append(numero)
+
+            if registros:
+                _anexar(ruta, b"".join(registros))
+
+    return sorted(actualizadas)
+
+
+def eliminar_facturas(numeros, versiones=None):
+    """
+    Elimina varias facturas; las bajas de un mismo bloque se anexan con una
+    sola escritura y un solo fsync.
+
+    Args:
+        numeros: Números de las facturas
+        versiones: Diccionario numero -> versión leída (opcional); las
+            facturas que ya no están en esa versión no se eliminan
+
+    Returns:
+        list: Números de las facturas eliminadas
+    """
+    por_bloque = {}
+    for numero in set(numeros):
+        por_bloque.setdefault(_ruta_bloque(numero), []).append(numero)
+
+    eliminadas = []
+    for ruta, numeros_bloque in por_bloque.items():
+        with bloquear_archivo(_ruta_lock(ruta)):
+            existentes = _cargar_bloque(ruta)['facturas']
+            registros = []
+            for numero in sorted(numeros_bloque):
+                actual = existentes.get(numero)
+                version = versiones.get(numero) if versiones else None
+                if actual is None or (version is not None and actual[2][3] != version):
+                    print(f"❌ La factura {numero:03d} fue modificada o eliminada por otra sesión")
+                    continue
+                registros.append(_codificar_baja(numero, actual[2][3] + 1))
+                eliminadas.append(numero)
+
+            if registros:
+                _anexar(ruta, b"".join(registros))
+
+    return sorted(eliminadas)
+
+
+def leer_cabecera(numero):
+    """
+    Devuelve la cabecera de una factura como diccionario con las COLUMNAS,
+    más tamaño_bytes, o None si no existe.
+    """
+    actual = _cargar_bloque(_ruta_bloque(numero))['facturas'].get(numero)
+    if actual is None:
+        return None
+    _, longitud, cabecera = actual
+    return dict(zip(COLUMNAS, cabecera), tamaño_bytes=_LONGITUD.size + longitud)
+
+
+def leer_factura(numero):
+    """
+    Lee una factura completa.
+
+    Returns:
+        tuple: (cabecera, productos) con productos como tuplas
+            (nombre, precio_centimos, cantidad), o None si no existe
+    """
+    ruta = _ruta_bloque(numero)
+    try:
+        f = open(ruta, "rb")
+    except FileNotFoundError:
+        return None
+
+    # Las posiciones se toman del mismo archivo abierto: si otro proceso
+    # compacta el bloque y lo reemplaza mientras tanto, se sigue leyendo el
+    # archivo anterior completo
+    with f:
+        with _lock:
+            actual = _cargar_bloque(ruta, f)['facturas'].get(numero)
+        if actual is None:
+            return None
+
+        inicio, longitud, cabecera = actual
+        f.seek(inicio + _LONGITUD.size)
+        registro = f.read(longitud)
+    return dict(zip(COLUMNAS, cabecera), tamaño_bytes=_LONGITUD.size + longitud), decodificar_productos(registro)
+
+
+def recorrer_cabeceras():
+    """
+    Recorre las cabeceras de todas las facturas vigentes, ordenadas por número.
+
+    Yields:
+        dict: Cabecera de cada factura (COLUMNAS más tamaño_bytes)
+    """
+    for ruta in _rutas_bloques():
+        # Copia tomada con el lock: otro hilo puede guardar o eliminar mientras se recorre
+        with _lock:
+            facturas = sorted(_cargar_bloque(ruta)['facturas'].items())
+        for _, (_, longitud, cabecera) in facturas:
+            yield dict(zip(COLUMNAS, cabecera), tamaño_bytes=_LONGITUD.size + longitud)
+
+
+def columnas(*nombres):
+    """
+    Obtiene columnas de la cabecera de todas las facturas vigentes como
+    arreglos de NumPy, sin decodificar productos.
+
+    Args:
+        nombres: Columnas a obtener (ver COLUMNAS)
+
+    Returns:
+        dict: Arreglo por cada columna pedida
+    """
+    import numpy as np
+
+    indices = [COLUMNAS.index(nombre) for nombre in nombres]
+    valores = {nombre: [] for nombre in nombres}
+    for ruta in _rutas_bloques():
+        with _lock:
+            cabeceras = [cabecera for _, _, cabecera in _cargar_bloque(ruta)['facturas'].values()]
+        for cabecera in cabeceras:
+            for nombre, indice in zip(nombres, indices):
+                valores[nombre].append(cabecera[indice])
+
+    return {nombre: np.asarray(valores[nombre], dtype=np.float64 if nombre == 'fecha' else np.int64)
+            for nombre in nombres}
+
+
+def cambios_desde(token):
+    """
+    Indica qué facturas cambiaron desde un momento dado.
+
+    Args:
+        token: Valor devuelto por una llamada anterior, o None
+
+    Returns:
+        tuple: (token_actual, numeros), con numeros None si hay que recargar todo
+    """
+    actual = {}
+    numeros = set()
+    reiniciar = token is None
+
+    for ruta in _rutas_bloques():
+        with _lock:
+            estado = _cargar_bloque(ruta)
+            actual[ruta] = (estado['inodo'], estado['offset'])
+            if reiniciar:
+                continue
+
+            anterior = token.get(ruta)
+            if anterior is None:
+                numeros.update(estado['numeros'])
+            elif anterior[0] != estado['inodo'] or anterior[1] > estado['offset']:
+                # El bloque fue compactado
+                reiniciar = True
+            else:
+                desde = bisect.bisect_left(estado['posiciones'], anterior[1])
+                numeros.update(estado['numeros'][desde:])
+
+    if reiniciar or any(ruta not in actual for ruta in token):
+        return actual, None
+    return actual, numeros
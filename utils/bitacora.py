@@ -0,0 +1,349 @@
+import json
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from utils.bloqueo import bloquear_archivo
+from utils.escritura import escribir_atomico
+
+# Bitácora de escritura anticipada de las facturas de texto: antes de crear,
+# editar o eliminar una factura (o de dejarle o quitarle la lápida) se anexa
+# (y se fuerza a disco) un registro con el contenido completo que va a
+# quedar; al terminar se anexa un registro "hecho" que lo confirma o lo
+# cancela. Si el proceso se corta a mitad de la operación,
+# recuperar_bitacora (utils.archivo) la vuelve a aplicar.
+#
+# Cada línea es "<crc32> <json>"; una línea con el CRC incorrecto o sin salto
+# de línea final es una escritura interrumpida y marca el fin de la bitácora.
+# Los registros se numeran (seq) en orden creciente, así que una réplica
+# solo necesita recordar el último seq que aplicó.
+CARPETA = "cache"
+ARCHIVO_BITACORA = os.path.join(CARPETA, "bitacora_facturas.log")
+ARCHIVO_PUNTO = os.path.join(CARPETA, "bitacora_facturas.punto")
+ARCHIVO_LOCK = os.path.join(CARPETA, "bitacora_facturas.lock")
+
+HECHO = "hecho"
+
+# Último seq conocido y hasta dónde se leyó el archivo, por proceso
+_lock_estado = threading.Lock()
+_estado = {
+    'inodo': None,
+    'offset': 0,
+    'seq': 0
+}
+
+
+def _codificar(registro):
+    datos = json.dumps(registro, ensure_ascii=False).encode("utf-8")
+    return b"%08x " % zlib.crc32(datos) + datos + b"\n"
+
+
+def _decodificar(linea):
+    # None si la línea está incompleta o dañada
+    if not linea.endswith(b"\n") or len(linea) < 10 or linea[8:9] != b" ":
+        return None
+    datos = linea[9:-1]
+    try:
+        if int(linea[:8], 16) != zlib.crc32(datos):
+            return None
+        return json.loads(datos)
+    except ValueError:
+        return None
+
+
+def _ultimo_seq(f, desde):
+    # Lee las líneas nuevas desde `desde` y devuelve (último seq, offset final válido)
+    f.seek(desde)
+    seq, offset = None, desde
+    for linea in f:
+        registro = _decodificar(linea)
+        if registro is None:
+            break
+        seq, offset = registro['seq'], offset + len(linea)
+    return seq, offset
+
+
+def _anexar(registros, sincronizar):
+    # Asigna los seq y anexa los registros; devuelve los seq asignados
+    os.makedirs(CARPETA, exist_ok=True)
+    with bloquear_archivo(ARCHIVO_LOCK), _lock_estado:
+        with open(ARCHIVO_BITACORA, "ab+") as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != _estado['inodo'] or stat.st_size < _estado['offset']:
+                _estado.update({'inodo': stat.st_ino, 'offset': 0, 'seq': 0})
+
+            if stat.st_size != _estado['offset']:
+                # Otros procesos anexaron registros
+                seq, offset = _ultimo_seq(f, _estado['offset'])
+                if offset != stat.st_size:
+                    # Cola de una escritura interrumpida: se descarta
+                    f.truncate(offset)
+                _estado['offset'] = offset
+                if seq is not None:
+                    _estado['seq'] = seq
+
+            seqs = []
+            lineas = []
+            for registro in registros:
+                _estado['seq'] += 1
+                seqs.append(_estado['seq'])
+                lineas.append(_codificar({'seq': _estado['seq'], **registro}))
+
+            contenido = b"".join(lineas)
+            f.write(contenido)
+            f.flush()
+            if sincronizar:
+                os.fsync(f.fileno())
+            _estado['offset'] += len(contenido)
+    return seqs
+
+
+def registrar(operaciones):
+    """
+    Anexa a la bitácora las operaciones que se van a aplicar, con un solo
+    fsync para todas.
+
+    Args:
+        operaciones: Lista de diccionarios con 'op' ("guardar", "editar",
+            "restaurar", "eliminar", "marcar" o "deshacer"), 'numero' y, salvo
+            al eliminar o deshacer, 'contenido' (el texto completo que va a
+            quedar en la factura, o en su lápida al marcarla como eliminada)
+
+    Returns:
+        list: seq de cada operación, en el mismo orden
+    """
+    ahora = time.time()
+    return _anexar([{**operacion, 'ts': ahora} for operacion in operaciones], sincronizar=True)
+
+
+def confirmar(seqs, ok=True):
+    """
+    Marca operaciones como terminadas (ok=True) o canceladas (ok=False).
+
+    No se fuerza a disco: si se pierde, la recuperación vuelve a aplicar la
+    operación, lo que deja la factura igual.
+    """
+    if seqs:
+        _anexar([{'op': HECHO, 'ref': seq, 'ok': ok} for seq in seqs], sincronizar=False)
+
+
+@contextmanager
+def operacion(op, numero, contenido=None):
+    """
+    Registra una operación antes de aplicarla y la confirma al salir del
+    bloque `with` (o la cancela si el bloque lanza una excepción).
+
+    Args:
+        op: "guardar", "editar", "restaurar", "eliminar", "marcar" o "deshacer"
+        numero: Número de la factura
+        contenido: Texto completo que va a quedar en la factura (o en su lápida)
+    """
+    registro = {'op': op, 'numero': numero}
+    if contenido is not None:
+        registro['contenido'] = contenido
+    seq = registrar([registro])[0]
+    try:
+        yield seq
+    except BaseException:
+        confirmar([seq], ok=False)
+        raise
+    confirmar([seq])
+
+
+def _seq_de_posicion(f, posicion, tamaño):
+    # seq de la primera línea que empieza en `posicion` o después
+    if posicion > 0:
+        f.seek(posicion - 1)
+        f.readline()
+    else:
+        f.seek(0)
+    if f.tell() >= tamaño:
+        return None, f.tell()
+    inicio = f.tell()
+    registro = _decodificar(f.readline())
+    return (registro['seq'] if registro is not None else None), inicio
+
+
+def _posicion_de_seq(f, seq):
+    # Búsqueda binaria de la primera línea con seq mayor o igual
+    tamaño = os.fstat(f.fileno()).st_size
+    bajo, alto = 0, tamaño
+    while bajo < alto:
+        medio = (bajo + alto) // 2
+        encontrado, _ = _seq_de_posicion(f, medio, tamaño)
+        if encontrado is None or encontrado >= seq:
+            alto = medio
+        else:
+            bajo = medio + 1
+    return _seq_de_posicion(f, bajo, tamaño)[1]
+
+
+def registros(desde_seq=0):
+    """
+    Recorre los registros de la bitácora desde un seq dado.
+
+    Args:
+        desde_seq: Primer seq a entregar
+
+    Yields:
+        tuple: (linea, registro) con la línea tal como está en el archivo
+    """
+    try:
+        f = open(ARCHIVO_BITACORA, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        f.seek(_posicion_de_seq(f, desde_seq) if desde_seq > 0 else 0)
+        for linea in f:
+            registro = _decodificar(linea)
+            if registro is None:
+                break
+            yield linea, registro
+
+
+def leer_punto():
+    """Seq hasta el cual todas las operaciones están terminadas."""
+    try:
+        with open(ARCHIVO_PUNTO, "r", encoding="utf-8") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return 0
+
+
+def guardar_punto(seq):
+    """Guarda el punto de control (ver leer_punto)."""
+    escribir_atomico(ARCHIVO_PUNTO, f"{seq}\n")
+
+
+def operaciones_desde(desde_seq=0):
+    """
+    Operaciones registradas desde un seq, con su estado.
+
+    Args:
+        desde_seq: Primer seq a considerar
+
+    Returns:
+        tuple: (operaciones, ultimo_seq) con operaciones como lista de
+            (registro, ok) en orden, donde ok es None si la operación todavía
+            no terminó
+    """
+    operaciones = {}
+    ultimo = desde_seq - 1
+    for _, registro in registros(desde_seq):
+        ultimo = registro['seq']
+        if registro['op'] == HECHO:
+            if registro['ref'] in operaciones:
+                operaciones[registro['ref']][1] = registro['ok']
+        else:
+            operaciones[registro['seq']] = [registro, None]
+    return [tuple(operacion) for operacion in operaciones.values()], ultimo
+
+
+def facturas_modificadas(desde_seq=0):
+    """Números de las facturas creadas, editadas o eliminadas desde un seq."""
+    return {registro['numero'] for registro, ok in operaciones_desde(desde_seq)[0] if ok is not False}
+
+
+def exportar(desde_seq=0):
+    """
+    Líneas de la bitácora para enviar a una réplica.
+
+    Solo se entregan operaciones terminadas, y se corta en la primera que
+    todavía esté en curso para que la réplica no se salte ninguna.
+
+    Args:
+        desde_seq: Primer seq que le falta a la réplica
+
+    Yields:
+        bytes: Líneas de la bitácora (con su CRC)
+    """
+    confirmadas = {}
+    lineas = []
+    for linea, registro in registros(desde_seq):
+        if registro['op'] == HECHO:
+            confirmadas[registro['ref']] = registro['ok']
+        else:
+            lineas.append((registro['seq'], linea))
+
+    for seq, linea in lineas:
+        if seq not in confirmadas:
+            break
+        if confirmadas[seq]:
+            yield linea
+
+
+def leer_lineas(lineas):
+    """
+    Decodifica líneas recibidas de exportar, verificando su CRC.
+
+    Raises:
+        ValueError: Si una línea está dañada
+    """
+    for linea in lineas:
+        registro = _decodificar(linea)
+        if registro is None:
+            raise ValueError(f"Línea de bitácora dañada: {linea[:60]!r}")
+        yield registro
+
+
+def recortar_bitacora(hasta_seq):
+    """
+    Quita de la bitácora las operaciones ya terminadas hasta un seq (por
+    ejemplo, cuando todas las réplicas ya las aplicaron).
+
+    Args:
+        hasta_seq: Último seq que se puede quitar; se limita al punto de control
+
+    Returns:
+        int: Cantidad de líneas quitadas
+    """
+    limite = min(hasta_seq, leer_punto())
+    with bloquear_archivo(ARCHIVO_LOCK):
+        lineas = list(registros())
+        conservadas = [linea for linea, registro in lineas
+                       if registro['seq'] > limite and registro.get('ref', limite + 1) > limite]
+        # La última línea se conserva siempre para que los seq sigan desde ahí
+        if lineas and (not conservadas or conservadas[-1] is not lineas[-1][0]):
+            conservadas.append(lineas[-1][0])
+        escribir_atomico(ARCHIVO_BITACORA, b"".join(conservadas))
+
+    quitadas = len(lineas) - len(conservadas)
+    return quitadas
+
+
+if __name__ == "__main__":
+    # Uso:
+    #   python -m utils.bitacora --recuperar
+    #   python -m utils.bitacora --reindexar SEQ
+    #   python -m utils.bitacora --exportar SEQ > cambios.log        (en el servidor principal)
+    #   python -m utils.bitacora --aplicar cambios.log               (en la réplica; "-" lee stdin)
+    #   python -m utils.bitacora --posicion-replica
+    #   python -m utils.bitacora --recortar SEQ
+    import sys
+
+    from utils import archivo
+
+    def _valor(opcion):
+        return sys.argv[sys.argv.index(opcion) + 1]
+
+    if "--recuperar" in sys.argv:
+        archivo.recuperar_bitacora()
+    elif "--reindexar" in sys.argv:
+        archivo.reindexar_desde(int(_valor("--reindexar")))
+    elif "--exportar" in sys.argv:
+        for linea in exportar(int(_valor("--exportar"))):
+            sys.stdout.buffer.write(linea)
+    elif "--aplicar" in sys.argv:
+        origen = _valor("--aplicar")
+        if origen == "-":
+            archivo.aplicar_replica(sys.stdin.buffer)
+        else:
+            with open(origen, "rb") as f:
+                archivo.aplicar_replica(f)
+    elif "--posicion-replica" in sys.argv:
+        print(archivo.posicion_replica())
+    elif "--recortar" in sys.argv:
+        quitadas = recortar_bitacora(int(_valor("--recortar")))
+        print(f"✅ Bitácora recortada: {quitadas} líneas quitadas")
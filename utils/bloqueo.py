@@ -0,0 +1,41 @@
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows no tiene fcntl; se usa msvcrt para bloquear el primer byte
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def bloquear_archivo(ruta_lock):
+    """
+    Bloqueo exclusivo entre procesos basado en un archivo de lock.
+
+    Mientras dure el bloque `with`, ningún otro proceso (ni hilo) que use el
+    mismo archivo de lock podrá entrar.
+
+    Args:
+        ruta_lock: Ruta del archivo de lock (se crea si no existe)
+    """
+    carpeta = os.path.dirname(ruta_lock)
+    if carpeta and not os.path.exists(carpeta):
+        os.makedirs(carpeta, exist_ok=True)
+
+    with open(ruta_lock, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
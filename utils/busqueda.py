@@ -0,0 +1,127 @@
+import bisect
+import re
+import unicodedata
+
+from utils.validaciones import limpiar_y_validar_entrada
+
+# Índice invertido de nombres de productos: cada palabra normalizada apunta a
+# las facturas donde aparece y a las líneas (posición del producto dentro de
+# la factura, desde 0). Las palabras se guardan además en una lista ordenada
+# para buscar por prefijo con búsqueda binaria.
+_SEPARADORES = re.compile(r"\W+")
+
+
+def normalizar(texto):
+    """
+    Normaliza un texto para buscarlo: lo limpia como limpiar_y_validar_entrada,
+    quita las tildes y lo pasa a minúsculas ("Café Ñandú" -> "cafe nandu").
+
+    Args:
+        texto (str): Texto a normalizar
+
+    Returns:
+        str: Texto normalizado
+    """
+    texto = unicodedata.normalize("NFKD", limpiar_y_validar_entrada(texto))
+    return "".join(c for c in texto if not unicodedata.combining(c)).casefold()
+
+
+def palabras(texto):
+    """Palabras normalizadas de un texto, en orden."""
+    return [palabra for palabra in _SEPARADORES.split(normalizar(texto)) if palabra]
+
+
+def crear_indice():
+    """Crea un índice de productos vacío."""
+    return {
+        # palabra -> {numero: [posiciones]}
+        'palabras': {},
+        # Palabras ordenadas, para la búsqueda por prefijo
+        'vocabulario': [],
+        # numero -> nombres de sus productos, en orden
+        'facturas': {}
+    }
+
+
+def quitar_factura(indice, numero):
+    """Quita una factura del índice, si estaba."""
+    nombres = indice['facturas'].pop(numero, None)
+    if not nombres:
+        return
+
+    for palabra in {palabra for nombre in nombres for palabra in palabras(nombre)}:
+        apariciones = indice['palabras'].get(palabra)
+        if apariciones is None:
+            continue
+        apariciones.pop(numero, None)
+        if not apariciones:
+            del indice['palabras'][palabra]
+            vocabulario = indice['vocabulario']
+            posicion = bisect.bisect_left(vocabulario, palabra)
+            if posicion < len(vocabulario) and vocabulario[posicion] == palabra:
+                del vocabulario[posicion]
+
+
+def agregar_factura(indice, numero, nombres):
+    """
+    Agrega (o reemplaza) los productos de una factura en el índice.
+
+    Args:
+        indice: Índice creado con crear_indice
+        numero: Número de la factura
+        nombres: Nombres de sus productos, en el orden de la factura
+    """
+    quitar_factura(indice, numero)
+    indice['facturas'][numero] = list(nombres)
+
+    for posicion, nombre in enumerate(nombres):
+        for palabra in set(palabras(nombre)):
+            apariciones = indice['palabras'].get(palabra)
+            if apariciones is None:
+                apariciones = indice['palabras'][palabra] = {}
+                bisect.insort(indice['vocabulario'], palabra)
+            apariciones.setdefault(numero, []).append(posicion)
+
+
+def _por_prefijo(indice, prefijo):
+    vocabulario = indice['vocabulario']
+    encontradas = {}
+    posicion = bisect.bisect_left(vocabulario, prefijo)
+    while posicion < len(vocabulario) and vocabulario[posicion].startswith(prefijo):
+        for numero, posiciones in indice['palabras'][vocabulario[posicion]].items():
+            encontradas.setdefault(numero, set()).update(posiciones)
+        posicion += 1
+    return encontradas
+
+
+def buscar(indice, texto):
+    """
+    Busca las facturas que tienen un producto con todas las palabras del
+    texto; cada palabra puede ser el comienzo de una palabra del producto
+    ("piz marg" encuentra "Pizza Margarita").
+
+    Args:
+        indice: Índice creado con crear_indice
+        texto (str): Texto a buscar
+
+    Returns:
+        dict: numero -> lista de tuplas (posicion, nombre) con los productos
+            que coinciden; vacío si el texto no tiene palabras
+    """
+    consulta = palabras(texto)
+    if not consulta:
+        return {}
+
+    # Se empieza por la palabra con menos facturas para achicar la intersección
+    candidatas = sorted((_por_prefijo(indice, prefijo) for prefijo in set(consulta)), key=len)
+    resultado = {}
+    for numero, posiciones in candidatas[0].items():
+        comunes = set(posiciones)
+        for otras in candidatas[1:]:
+            comunes &= otras.get(numero, set())
+            if not comunes:
+                break
+        if comunes:
+            nombres = indice['facturas'][numero]
+            resultado[numero] = [(posicion, nombres[posicion]) for posicion in sorted(comunes)]
+    return resultado
@@ -0,0 +1,369 @@
+import bisect
+import json
+import os
+import threading
+
+from utils import busqueda
+from utils.dinero import a_centimos
+from utils.escritura import escribir_atomico
+from utils.paralelo import mapear_ordenado
+from utils.rangos import crear_orden, en_rango, insertar, quitar
+from utils.rutas import CARPETA
+
+# Catálogo de facturas compartido por todas las páginas y sesiones del
+# proceso, uno por repositorio. Se refresca solo con las facturas que
+# cambiaron, según el token de cambios del repositorio.
+_lock = threading.Lock()
+_catalogos = {}
+
+# El índice de productos se arma fuera de _lock (leerlo desde cero recorre
+# todas las facturas) y se guarda en disco junto con el token de cambios del
+# repositorio, así que otro proceso solo relee las facturas que cambiaron
+_lock_productos = threading.Lock()
+ARCHIVO_PRODUCTOS = os.path.join(CARPETA, "productos_{}.json")
+
+
+# Criterios de orden del listado además del número: campo de cada factura
+# usado como clave de su índice ordenado (utils.rangos)
+ORDENES = {
+    'total': 'total_centimos',
+    'fecha': 'fecha_emision'
+}
+
+
+def _orden(catalogo, criterio):
+    # Debe llamarse con _lock tomado
+    orden = catalogo['ordenes'].get(criterio)
+    if orden is None:
+        campo = ORDENES[criterio]
+        orden = crear_orden((info[campo], numero) for numero, info in catalogo['facturas'].items())
+        catalogo['ordenes'][criterio] = orden
+    return orden
+
+
+def _actualizar(repositorio, catalogo, numero):
+    info = repositorio.obtener_info(numero)
+    anterior = catalogo['facturas'].get(numero)
+    for criterio, orden in catalogo['ordenes'].items():
+        if anterior is not None:
+            quitar(orden, anterior[ORDENES[criterio]], numero)
+        if info is not None:
+            insertar(orden, info[ORDENES[criterio]], numero)
+
+    numeros = catalogo['numeros']
+    posicion = bisect.bisect_left(numeros, numero)
+    existe = posicion < len(numeros) and numeros[posicion] == numero
+
+    if info is None:
+        catalogo['facturas'].pop(numero, None)
+        if existe:
+            del numeros[posicion]
+    else:
+        catalogo['facturas'][numero] = info
+        if not existe:
+            numeros.insert(posicion, numero)
+
+    catalogo['ultima_busqueda'] = None
+    if catalogo['productos'] is not None:
+        if info is None:
+            busqueda.quitar_factura(catalogo['productos'], numero)
+        else:
+            busqueda.agregar_factura(catalogo['productos'], numero, _nombres(repositorio, numero))
+
+
+def _refrescar(repositorio):
+    # Debe llamarse con _lock tomado
+    catalogo = _catalogos.get(repositorio)
+    token, numeros = repositorio.cambios_desde(catalogo['token'] if catalogo else None)
+
+    if catalogo is None or numeros is None:
+        facturas = repositorio.listar()
+        catalogo = {
+            'token': token,
+            'facturas': {info['numero']: info for info in facturas},
+            'numeros': [info['numero'] for info in facturas],
+            # Índice de productos (utils.busqueda); se arma con la primera búsqueda
+            'productos': None,
+            'ultima_busqueda': None,
+            # Índice ordenado de cada criterio de ORDENES; se arma al usarlo
+            'ordenes': {}
+        }
+        _catalogos[repositorio] = catalogo
+    else:
+        for numero in numeros:
+            _actualizar(repositorio, catalogo, numero)
+        catalogo['token'] = token
+
+    return catalogo
+
+
+def obtener_catalogo(repositorio):
+    """
+    Obtiene la información de todas las facturas, ordenadas por número.
+
+    La primera llamada lista todo el repositorio; las siguientes solo vuelven
+    a consultar las facturas que cambiaron desde entonces (en cualquier sesión
+    o proceso), así que un cambio no obliga a releer todas las facturas.
+
+    Args:
+        repositorio: Repositorio de facturas
+
+    Returns:
+        list: Diccionarios de información de cada factura (no modificarlos)
+    """
+    with _lock:
+        catalogo = _refrescar(repositorio)
+        return [catalogo['facturas'][numero] for numero in catalogo['numeros']]
+
+
+def _nombres(repositorio, numero):
+    return [nombre for nombre, _, _ in repositorio.cargar(numero)]
+
+
+def _origen(repositorio):
+    # Identifica los datos del repositorio, para no usar el índice guardado de otra base
+    return getattr(repositorio, 'ruta_bd', None) or repositorio.nombre
+
+
+def _token_desde_json(token):
+    # JSON convierte las tuplas de los tokens en listas
+    if isinstance(token, list):
+        return tuple(_token_desde_json(valor) for valor in token)
+    if isinstance(token, dict):
+        return {clave: _token_desde_json(valor) for clave, valor in token.items()}
+    return token
+
+
+def _leer_productos_guardados(repositorio):
+    try:
+        with open(ARCHIVO_PRODUCTOS.format(repositorio.nombre), "r", encoding="utf-8") as f:
+            datos = json.load(f)
+        if datos['origen'] != _origen(repositorio):
+            return None
+        nombres = {int(numero): lista for numero, lista in datos['facturas'].items()}
+        return _token_desde_json(datos['token']), nombres
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def _guardar_productos(repositorio, token, nombres):
+    try:
+        escribir_atomico(ARCHIVO_PRODUCTOS.format(repositorio.nombre), json.dumps({
+            'origen': _origen(repositorio),
+            'token': token,
+            'facturas': {str(numero): lista for numero, lista in nombres.items()}
+        }, ensure_ascii=False))
+    except (OSError, TypeError, ValueError) as e:
+        print(f"❌ No se pudo guardar el índice de productos: {e}")
+
+
+def _poner_al_dia(repositorio, indice, numeros):
+    # Vuelve a leer en el índice de productos las facturas que cambiaron
+    for numero in sorted(numeros):
+        if repositorio.obtener_info(numero) is None:
+            busqueda.quitar_factura(indice, numero)
+        else:
+            busqueda.agregar_factura(indice, numero, _nombres(repositorio, numero))
+
+
+def _armar_productos(repositorio):
+    # Se llama sin _lock. Parte del índice guardado en disco y relee solo las
+    # facturas que cambiaron desde su token; sin índice guardado (o si el
+    # repositorio ya no puede decir qué cambió) lee todas las facturas.
+    guardado = _leer_productos_guardados(repositorio)
+    numeros = None
+    if guardado is not None:
+        token, nombres = guardado
+        token, numeros = repositorio.cambios_desde(token)
+
+    indice = busqueda.crear_indice()
+    if numeros is None:
+        # El token se toma antes de leer: lo que cambie mientras tanto se
+        # repasa al poner el índice en el catálogo
+        token, _ = repositorio.cambios_desde(None)
+        todos = [info['numero'] for info in repositorio.listar()]
+        # Con hilos siempre: el repositorio no se puede enviar a otro proceso
+        nombres = dict(zip(todos, mapear_ordenado(lambda n: _nombres(repositorio, n), todos, procesos=False)))
+
+    for numero, lista in nombres.items():
+        busqueda.agregar_factura(indice, numero, lista)
+    if numeros:
+        _poner_al_dia(repositorio, indice, numeros)
+
+    if token is not None and (numeros is None or numeros):
+        _guardar_productos(repositorio, token, indice['facturas'])
+    return token, indice
+
+
+def _preparar_productos(repositorio):
+    # Deja el índice de productos en el catálogo; _lock solo se toma para
+    # mirar y, al final, para ponerlo al día con lo que cambió mientras se
+    # armaba, así que las demás páginas no esperan a que termine
+    with _lock:
+        if _refrescar(repositorio)['productos'] is not None:
+            return
+
+    with _lock_productos:
+        with _lock:
+            if _refrescar(repositorio)['productos'] is not None:
+                # Lo armó otro hilo mientras se esperaba
+                return
+
+        token, indice = _armar_productos(repositorio)
+        with _lock:
+            catalogo = _refrescar(repositorio)
+            _, numeros = repositorio.cambios_desde(token)
+            if numeros is None:
+                # El repositorio se compactó mientras se armaba; en la próxima
+                # búsqueda se vuelve a intentar
+                return
+            _poner_al_dia(repositorio, indice, numeros)
+            catalogo['productos'] = indice
+            catalogo['ultima_busqueda'] = None
+
+
+def _buscar(catalogo, texto):
+    # Debe llamarse con _lock tomado y el índice de productos ya armado. Al
+    # pasar de página se repite la misma búsqueda
+    if catalogo['ultima_busqueda'] is None or catalogo['ultima_busqueda'][0] != texto:
+        catalogo['ultima_busqueda'] = (texto, busqueda.buscar(catalogo['productos'], texto))
+    return catalogo['ultima_busqueda'][1]
+
+
+def buscar_productos(repositorio, texto):
+    """
+    Busca las facturas que tienen un producto con el texto indicado, sin
+    distinguir mayúsculas ni tildes y aceptando el comienzo de las palabras.
+
+    El índice de productos se guarda en disco: al abrirlo solo se releen las
+    facturas que cambiaron desde que se guardó (la primera vez, todas, sin
+    frenar a las demás páginas). Después se mantiene al día con cada factura
+    que se guarda, edita o elimina, y cada búsqueda toma milisegundos.
+
+    Args:
+        repositorio: Repositorio de facturas
+        texto: Texto a buscar
+
+    Returns:
+        dict: numero -> lista de tuplas (posicion, nombre) con los productos
+            que coinciden (no modificarlo)
+    """
+    while True:
+        _preparar_productos(repositorio)
+        with _lock:
+            catalogo = _refrescar(repositorio)
+            if catalogo['productos'] is not None:
+                return _buscar(catalogo, texto)
+
+
+def consultar_catalogo(repositorio, pagina=1, por_pagina=25, orden='numero', descendente=False,
+                       numero_desde=None, numero_hasta=None, total_min=None, total_max=None,
+                       fecha_desde=None, fecha_hasta=None, producto=None):
+    """
+    Obtiene una página del listado de facturas, filtrado y ordenado.
+
+    Solo se arma la información de las facturas de la página pedida. Los
+    rangos de número, fecha de emisión y total se resuelven con búsqueda
+    binaria sobre índices ordenados y el filtro por producto con el índice
+    de buscar_productos.
+
+    Args:
+        repositorio: Repositorio de facturas
+        pagina: Número de página, desde 1
+        por_pagina: Facturas por página
+        orden: Criterio de orden: 'numero' o una clave de ORDENES
+        descendente: Si es True se ordena de mayor a menor
+        numero_desde, numero_hasta: Rango de números (inclusivo)
+        total_min, total_max: Rango del total en soles (inclusivo)
+        fecha_desde, fecha_hasta: Rango de fecha de emisión como timestamp
+            (inclusivo)
+        producto: Texto a buscar en los nombres de los productos (ver
+            buscar_productos)
+
+    Returns:
+        tuple: (facturas, cantidad, hay_mas) con las facturas de la página,
+            la cantidad total de facturas que cumplen los filtros y si existe
+            una página siguiente
+    """
+    inicio = (max(pagina, 1) - 1) * por_pagina
+    minimo = a_centimos(total_min) if total_min is not None else None
+    maximo = a_centimos(total_max) if total_max is not None else None
+
+    while True:
+        if producto:
+            _preparar_productos(repositorio)
+
+        with _lock:
+            catalogo = _refrescar(repositorio)
+            if producto and catalogo['productos'] is None:
+                # El catálogo se recargó desde cero después de armar el índice
+                continue
+
+            facturas = catalogo['facturas']
+
+            rangos = {}
+            if fecha_desde is not None or fecha_hasta is not None:
+                rangos['fecha'] = (fecha_desde, fecha_hasta)
+            if minimo is not None or maximo is not None:
+                rangos['total'] = (minimo, maximo)
+
+            if orden in rangos:
+                # El rango del criterio de orden ya sale ordenado del índice
+                candidatos = en_rango(_orden(catalogo, orden), *rangos.pop(orden))
+            elif orden in ORDENES:
+                candidatos = en_rango(_orden(catalogo, orden))
+            else:
+                candidatos = catalogo['numeros']
+
+            if orden in ORDENES:
+                if numero_desde is not None or numero_hasta is not None:
+                    candidatos = [numero for numero in candidatos
+                                  if (numero_desde is None or numero >= numero_desde)
+                                  and (numero_hasta is None or numero <= numero_hasta)]
+            else:
+                desde = bisect.bisect_left(candidatos, numero_desde) if numero_desde is not None else 0
+                hasta = bisect.bisect_right(candidatos, numero_hasta) if numero_hasta is not None else len(candidatos)
+                candidatos = candidatos[desde:hasta]
+
+            for criterio, (desde, hasta) in rangos.items():
+                permitidos = set(en_rango(_orden(catalogo, criterio), desde, hasta))
+                candidatos = [numero for numero in candidatos if numero in permitidos]
+
+            if producto:
+                coincidencias = _buscar(catalogo, producto)
+                candidatos = [numero for numero in candidatos if numero in coincidencias]
+
+            if descendente:
+                candidatos = candidatos[::-1]
+
+            pagina_actual = [facturas[numero] for numero in candidatos[inicio:inicio + por_pagina]]
+            return pagina_actual, len(candidatos), inicio + por_pagina < len(candidatos)
+
+
+def invalidar_factura(repositorio, numero):
+    """
+    Actualiza en el catálogo una factura recién guardada, editada o eliminada.
+
+    Solo se vuelve a consultar esa factura; el resto del catálogo se conserva.
+
+    Args:
+        repositorio: Repositorio de facturas
+        numero: Número de la factura que cambió
+    """
+    invalidar_facturas(repositorio, [numero])
+
+
+def invalidar_facturas(repositorio, numeros):
+    """
+    Actualiza en el catálogo varias facturas que cambiaron juntas (por
+    ejemplo, las de una eliminación o una edición en lote).
+
+    Args:
+        repositorio: Repositorio de facturas
+        numeros: Números de las facturas que cambiaron
+    """
+    with _lock:
+        catalogo = _catalogos.get(repositorio)
+        if catalogo is not None:
+            for numero in numeros:
+                _actualizar(repositorio, catalogo, numero)
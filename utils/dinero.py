@@ -0,0 +1,127 @@
+from decimal import ROUND_HALF_EVEN, Decimal, InvalidOperation
+
+import numpy as np
+
+# IGV en puntos básicos (18% = 1800) para calcular solo con enteros
+IGV_PUNTOS_BASICOS = 1800
+
+
+def a_centimos(monto):
+    """
+    Convierte un monto en soles a céntimos enteros.
+
+    Los float se redondean con round(monto * 100), la misma regla que usa
+    calcular_facturas_lote con NumPy; los textos y Decimal se convierten
+    de forma exacta.
+
+    Args:
+        monto: Monto en soles (float, int, str o Decimal)
+
+    Returns:
+        int: Monto en céntimos
+    """
+    if isinstance(monto, (str, Decimal)):
+        try:
+            return int((Decimal(str(monto).strip()) * 100).to_integral_value(ROUND_HALF_EVEN))
+        except InvalidOperation:
+            raise ValueError(f"Monto inválido: {monto!r}")
+    return int(round(float(monto) * 100))
+
+
+def a_soles(centimos):
+    """
+    Convierte céntimos a soles (float) para mostrar o para las funciones que
+    reciben montos en soles.
+    """
+    return centimos / 100
+
+
+def formatear_centimos(centimos):
+    """
+    Formatea céntimos como texto con 2 decimales exactos, sin pasar por float.
+
+    Args:
+        centimos (int): Monto en céntimos
+
+    Returns:
+        str: Monto como "1234.56"
+    """
+    signo = "-" if centimos < 0 else ""
+    centimos = abs(int(centimos))
+    return f"{signo}{centimos // 100}.{centimos % 100:02d}"
+
+
+def puntos_basicos(porcentaje):
+    """Convierte una tasa como 0.18 a puntos básicos (1800)."""
+    return int(round(float(porcentaje) * 10000))
+
+
+def calcular_igv_centimos(subtotal_centimos, tasa_puntos_basicos=IGV_PUNTOS_BASICOS):
+    """
+    Calcula el IGV en céntimos, redondeando la mitad hacia arriba.
+
+    Args:
+        subtotal_centimos (int): Subtotal en céntimos
+        tasa_puntos_basicos (int): Tasa del IGV en puntos básicos
+
+    Returns:
+        int: IGV en céntimos
+    """
+    return (subtotal_centimos * tasa_puntos_basicos + 5000) // 10000
+
+
+def calcular_factura(productos, tasa_puntos_basicos=IGV_PUNTOS_BASICOS):
+    """
+    Calcula el total de cada producto, el subtotal, el IGV y el total de una
+    factura con aritmética entera.
+
+    Args:
+        productos: Lista de tuplas (nombre, precio, cantidad)
+        tasa_puntos_basicos (int): Tasa del IGV en puntos básicos
+
+    Returns:
+        tuple: (productos_con_total, subtotal, igv, total) con los montos en
+            soles; productos_con_total son tuplas (nombre, precio, cantidad, total_item)
+    """
+    productos_con_total = []
+    subtotal = 0
+    for nombre, precio, cantidad in productos:
+        total_item = a_centimos(precio) * int(cantidad)
+        subtotal += total_item
+        productos_con_total.append((nombre, precio, cantidad, a_soles(total_item)))
+
+    igv = calcular_igv_centimos(subtotal, tasa_puntos_basicos)
+    return productos_con_total, a_soles(subtotal), a_soles(igv), a_soles(subtotal + igv)
+
+
+def calcular_facturas_lote(precios, cantidades, grupos, tasa_puntos_basicos=IGV_PUNTOS_BASICOS):
+    """
+    Calcula los montos de muchas facturas a la vez con NumPy.
+
+    Cada fila es un producto; grupos indica a qué factura pertenece y debe
+    estar ordenado (las filas de una factura van seguidas), como en un lote
+    de pedidos.
+
+    Args:
+        precios: Precios en soles por fila
+        cantidades: Cantidades por fila
+        grupos: Índice de factura por fila (0, 0, 1, 2, 2, ...)
+        tasa_puntos_basicos (int): Tasa del IGV en puntos básicos
+
+    Returns:
+        tuple: (totales_item, subtotales, igv, totales) como arreglos int64 en
+            céntimos; totales_item tiene una fila por producto y el resto una
+            fila por factura
+    """
+    precios_c = np.round(np.asarray(precios, dtype=np.float64) * 100).astype(np.int64)
+    totales_item = precios_c * np.asarray(cantidades, dtype=np.int64)
+
+    grupos = np.asarray(grupos)
+    if len(grupos) == 0:
+        vacio = np.zeros(0, dtype=np.int64)
+        return totales_item, vacio, vacio, vacio
+
+    inicios = np.flatnonzero(np.r_[True, grupos[1:] != grupos[:-1]])
+    subtotales = np.add.reduceat(totales_item, inicios)
+    igv = (subtotales * tasa_puntos_basicos + 5000) // 10000
+    return totales_item, subtotales, igv, subtotales + igv
@@ -0,0 +1,128 @@
+import os
+import tempfile
+
+
+def sincronizar_directorio(carpeta):
+    """
+    Fuerza a disco la entrada de directorio de los archivos recién creados o
+    renombrados en la carpeta, para que el cambio sobreviva a un corte de luz.
+
+    En Windows no se pueden abrir carpetas, así que no hace nada.
+
+    Args:
+        carpeta: Ruta de la carpeta
+    """
+    if os.name == "nt":
+        return
+
+    fd = os.open(carpeta or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _escribir_temporal(ruta, contenido, sincronizar):
+    # El temporal va en la misma carpeta para que el renombrado sea atómico;
+    # su nombre no tiene el formato factura_XXX.txt, así que nadie lo lista
+    carpeta = os.path.dirname(ruta) or "."
+    fd, temporal = tempfile.mkstemp(prefix=f".{os.path.basename(ruta)}.", suffix=".tmp", dir=carpeta)
+    try:
+        if isinstance(contenido, bytes):
+            f = os.fdopen(fd, "wb")
+        else:
+            f = os.fdopen(fd, "w", encoding="utf-8")
+        with f:
+            f.write(contenido)
+            if sincronizar:
+                f.flush()
+                os.fsync(f.fileno())
+    except BaseException:
+        os.unlink(temporal)
+        raise
+    return temporal
+
+
+def _publicar(temporal, ruta, exclusivo):
+    if not exclusivo:
+        os.replace(temporal, ruta)
+        return
+
+    # os.link falla si el destino ya existe, igual que abrir con modo "x"
+    try:
+        os.link(temporal, ruta)
+    except FileExistsError:
+        os.unlink(temporal)
+        raise
+    except OSError:
+        # Sistemas de archivos sin enlaces duros
+        if os.path.exists(ruta):
+            os.unlink(temporal)
+            raise FileExistsError(ruta)
+        os.replace(temporal, ruta)
+        return
+    os.unlink(temporal)
+
+
+def escribir_atomico(ruta, contenido, exclusivo=False):
+    """
+    Escribe un archivo de texto (o binario, si contenido es bytes) de forma
+    atómica.
+
+    El contenido se escribe en un temporal de la misma carpeta, se fuerza a
+    disco con fsync y recién entonces se renombra al destino con os.replace.
+    Quien lea el archivo ve la versión anterior o la nueva completa, nunca una
+    a medio escribir.
+
+    Args:
+        ruta: Ruta del archivo
+        contenido: Texto (str) o datos binarios (bytes) a escribir
+        exclusivo: Si es True falla con FileExistsError cuando el archivo ya
+            existe (como abrir con modo "x")
+    """
+    temporal = _escribir_temporal(ruta, contenido, sincronizar=True)
+    _publicar(temporal, ruta, exclusivo)
+    sincronizar_directorio(os.path.dirname(ruta))
+
+
+def escribir_atomico_lote(archivos, exclusivo=False):
+    """
+    Escribe muchos archivos de forma atómica en una sola pasada (commit
+    agrupado).
+
+    Primero se escriben todos los temporales, cada uno forzado a disco con
+    fsync sobre su propio descriptor (así un error de disco se reporta en el
+    archivo que lo tuvo); luego se renombran todos y se sincroniza cada
+    carpeta una sola vez. Cada archivo sigue apareciendo completo o no
+    aparece.
+
+    Args:
+        archivos: Lista de tuplas (ruta, contenido)
+        exclusivo: Si es True no se reemplazan archivos que ya existan
+
+    Returns:
+        list: Tuplas (ruta, error) con error None si el archivo se escribió
+    """
+    resultados = []
+    temporales = []
+    for ruta, contenido in archivos:
+        try:
+            temporales.append((ruta, _escribir_temporal(ruta, contenido, sincronizar=True)))
+        except OSError as e:
+            resultados.append((ruta, e))
+
+    carpetas = set()
+    for ruta, temporal in temporales:
+        try:
+            _publicar(temporal, ruta, exclusivo)
+            carpetas.add(os.path.dirname(ruta))
+            resultados.append((ruta, None))
+        except OSError as e:
+            if os.path.exists(temporal):
+                os.unlink(temporal)
+            resultados.append((ruta, e))
+
+    for carpeta in carpetas:
+        sincronizar_directorio(carpeta)
+
+    return resultados
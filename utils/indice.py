@@ -0,0 +1,401 @@
+import json
+import os
+import threading
+
+from utils.agregados import aplicar_cambios
+from utils.archivado import estado_factura
+from utils.bloqueo import bloquear_archivo
+from utils.dinero import a_centimos
+from utils.escritura import escribir_atomico
+from utils.lector import leer_factura_texto
+from utils.paralelo import mapear_ordenado
+from utils.rangos import crear_orden, en_rango, insertar, quitar
+from utils.rutas import numero_desde_archivo, recorrer_facturas
+
+CARPETA = "cache"
+ARCHIVO_INDICE = os.path.join(CARPETA, "indice_facturas.jsonl")
+ARCHIVO_LOCK = os.path.join(CARPETA, "indice_facturas.lock")
+
+# Compactar el índice cuando el registro tenga más de este número de líneas
+# sobrantes (entradas reemplazadas o eliminadas)
+LINEAS_SOBRANTES_MAX = 1000
+
+# Copia en memoria del índice para no releer el archivo en cada rerun; la
+# comparten todas las sesiones (hilos) del proceso
+_lock_estado = threading.RLock()
+_estado = {
+    'inodo': None,
+    'offset': 0,
+    'lineas': 0,
+    'facturas': {},
+    # Índices ordenados por fecha de emisión y por total (utils.rangos); se
+    # arman con la primera consulta por rango y se mantienen con cada cambio
+    'ordenes': None
+}
+
+CAMPOS_ORDENADOS = ('fecha_emision', 'total_centimos')
+
+
+def leer_resumen_factura(ruta):
+    """
+    Lee una factura y obtiene sus totales y la cantidad de productos.
+
+    Args:
+        ruta: Ruta del archivo de la factura
+
+    Returns:
+        dict: subtotal_centimos, igv_centimos, total_centimos, num_items y
+            fecha_emision (None si la factura no la tiene)
+    """
+    factura = leer_factura_texto(ruta)
+    return {
+        'subtotal_centimos': factura.subtotal_centimos,
+        'igv_centimos': factura.igv_centimos,
+        'total_centimos': factura.total_centimos,
+        'num_items': len(factura.productos),
+        'fecha_emision': factura.fecha_emision
+    }
+
+
+def _resumen_o_ninguno(ruta):
+    try:
+        return leer_resumen_factura(ruta)
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _crear_entrada(numero, ruta, stat, resumen):
+    return {
+        'numero': numero,
+        'archivo': os.path.basename(ruta),
+        'ruta': ruta,
+        'tamaño_bytes': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'fecha_modificacion': stat.st_mtime,
+        # Las facturas guardadas antes de registrar la emisión usan su mtime
+        'fecha_emision': resumen['fecha_emision'] if resumen['fecha_emision'] is not None else stat.st_mtime,
+        'subtotal_centimos': resumen['subtotal_centimos'],
+        'igv_centimos': resumen['igv_centimos'],
+        'total_centimos': resumen['total_centimos'],
+        'num_items': resumen['num_items']
+    }
+
+
+def _aplicar_registro(facturas, registro):
+    numero = registro['numero']
+    anterior = facturas.get(numero)
+    if registro.get('op') == 'del':
+        facturas.pop(numero, None)
+        entrada = None
+    else:
+        entrada = dict(registro)
+        entrada.pop('op', None)
+        facturas[numero] = entrada
+
+    if _estado['ordenes'] is not None and facturas is _estado['facturas']:
+        for campo, orden in _estado['ordenes'].items():
+            if anterior is not None:
+                quitar(orden, anterior[campo], numero)
+            if entrada is not None:
+                insertar(orden, entrada[campo], numero)
+
+
+def cargar_indice():
+    """
+    Carga el índice de facturas desde disco.
+
+    El índice es un registro de solo anexado (una línea JSON por cambio), así
+    que solo se leen las líneas añadidas desde la última carga en este proceso.
+
+    Returns:
+        dict: Entradas del índice por número de factura
+    """
+    with _lock_estado:
+        try:
+            f = open(ARCHIVO_INDICE, "rb")
+        except OSError:
+            _estado.update({'inodo': None, 'offset': 0, 'lineas': 0, 'facturas': {}, 'ordenes': None})
+            return _estado['facturas']
+
+        with f:
+            # fstat del archivo abierto: si otro proceso lo compacta justo
+            # ahora, se sigue leyendo el mismo archivo que se comprobó
+            stat = os.fstat(f.fileno())
+
+            # Si el archivo fue compactado o truncado, se relee desde el inicio
+            if stat.st_ino != _estado['inodo'] or stat.st_size < _estado['offset']:
+                _estado.update({'inodo': stat.st_ino, 'offset': 0, 'lineas': 0, 'facturas': {}, 'ordenes': None})
+
+            if stat.st_size == _estado['offset']:
+                return _estado['facturas']
+
+            f.seek(_estado['offset'])
+            datos = f.read()
+
+        # Ignorar una última línea incompleta (escritura en curso)
+        fin = datos.rfind(b"\n") + 1
+        for linea in datos[:fin].splitlines():
+            if not linea.strip():
+                continue
+            try:
+                _aplicar_registro(_estado['facturas'], json.loads(linea))
+                _estado['lineas'] += 1
+            except (ValueError, KeyError):
+                continue
+
+        _estado['offset'] += fin
+        return _estado['facturas']
+
+
+def cambios_desde(token):
+    """
+    Indica qué facturas cambiaron desde un momento dado.
+
+    Como el índice es un registro de solo anexado, basta leer las líneas
+    escritas después de la posición guardada en el token.
+
+    Args:
+        token: Valor devuelto por una llamada anterior, o None
+
+    Returns:
+        tuple: (token_actual, numeros) con el conjunto de números de factura
+            modificados, agregados o eliminados; numeros es None si no se
+            pueden saber (primera llamada o índice compactado) y hay que
+            recargar todo
+    """
+    with _lock_estado:
+        cargar_indice()
+        actual = (_estado['inodo'], _estado['offset'])
+
+    if token is None or token[0] != actual[0] or token[1] > actual[1]:
+        return actual, None
+    if token == actual:
+        return actual, set()
+
+    numeros = set()
+    try:
+        with open(ARCHIVO_INDICE, "rb") as f:
+            if os.fstat(f.fileno()).st_ino != actual[0]:
+                return actual, None
+            f.seek(token[1])
+            datos = f.read(actual[1] - token[1])
+    except OSError:
+        return actual, None
+
+    for linea in datos.splitlines():
+        try:
+            numeros.add(json.loads(linea)['numero'])
+        except (ValueError, KeyError):
+            continue
+    return actual, numeros
+
+
+def consultar_rango(fecha_desde=None, fecha_hasta=None, total_min=None, total_max=None):
+    """
+    Busca facturas por rango de fecha de emisión y de total con los índices
+    ordenados, sin recorrer todas las entradas.
+
+    Args:
+        fecha_desde, fecha_hasta: Rango de fecha de emisión como timestamp
+        total_min, total_max: Rango del total en céntimos
+
+    Returns:
+        list: Números de las facturas que cumplen todos los límites (los
+            límites son inclusivos y los que son None no filtran), en orden
+    """
+    with _lock_estado:
+        facturas = cargar_indice()
+        if _estado['ordenes'] is None:
+            _estado['ordenes'] = {
+                campo: crear_orden((entrada[campo], numero) for numero, entrada in facturas.items())
+                for campo in CAMPOS_ORDENADOS
+            }
+
+        encontrados = None
+        for campo, desde, hasta in (('fecha_emision', fecha_desde, fecha_hasta),
+                                    ('total_centimos', total_min, total_max)):
+            if desde is None and hasta is None:
+                continue
+            numeros = en_rango(_estado['ordenes'][campo], desde, hasta)
+            encontrados = set(numeros) if encontrados is None else encontrados.intersection(numeros)
+
+        return sorted(facturas if encontrados is None else encontrados)
+
+
+def _anexar_registros(registros):
+    if not registros:
+        return
+
+    if not os.path.exists(CARPETA):
+        os.makedirs(CARPETA)
+
+    # Con el bloqueo, ningún otro proceso anexa ni compacta mientras tanto
+    with bloquear_archivo(ARCHIVO_LOCK):
+        # Guardar cómo estaba cada factura antes del cambio para los agregados
+        facturas = cargar_indice()
+        vigentes = {}
+        cambios = []
+        for registro in registros:
+            numero = registro['numero']
+            anterior = vigentes[numero] if numero in vigentes else facturas.get(numero)
+            nueva = None if registro.get('op') == 'del' else registro
+            if anterior is not None or nueva is not None:
+                cambios.append((anterior, nueva))
+            vigentes[numero] = nueva
+
+        contenido = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in registros)
+        with open(ARCHIVO_INDICE, "a", encoding="utf-8") as f:
+            f.write(contenido)
+
+        # Incorporar los registros recién escritos a la copia en memoria
+        facturas = cargar_indice()
+        aplicar_cambios(cambios, lambda: cargar_indice().values())
+
+        if _estado['lineas'] - len(facturas) > LINEAS_SOBRANTES_MAX:
+            _compactar()
+
+
+def _compactar():
+    facturas = cargar_indice()
+    escribir_atomico(ARCHIVO_INDICE, "".join(json.dumps(facturas[numero], ensure_ascii=False) + "\n"
+                                             for numero in sorted(facturas)))
+    cargar_indice()
+
+
+def compactar_indice():
+    """
+    Reescribe el índice con una sola línea por factura vigente.
+    """
+    with bloquear_archivo(ARCHIVO_LOCK):
+        _compactar()
+
+
+def registrar_factura(ruta, subtotal=None, igv=None, total=None, num_items=None, fecha_emision=None):
+    """
+    Agrega o actualiza una factura en el índice.
+
+    Args:
+        ruta: Ruta del archivo de la factura
+        subtotal, igv, total, num_items, fecha_emision: Datos ya conocidos por
+            quien escribió la factura; si falta alguno se leen del archivo
+
+    Returns:
+        dict: Entrada registrada o None si no se pudo registrar
+    """
+    entradas = registrar_facturas([(ruta, subtotal, igv, total, num_items, fecha_emision)])
+    return entradas[0] if entradas else None
+
+
+def registrar_facturas(facturas):
+    """
+    Agrega o actualiza varias facturas en el índice con una sola escritura.
+
+    Args:
+        facturas: Lista de tuplas (ruta, subtotal, igv, total, num_items,
+            fecha_emision); los datos que sean None se leen del archivo
+
+    Returns:
+        list: Entradas registradas
+    """
+    entradas = []
+    for ruta, subtotal, igv, total, num_items, fecha_emision in facturas:
+        numero = numero_desde_archivo(ruta)
+        if numero is None:
+            continue
+
+        try:
+            stat = estado_factura(ruta)
+            if None in (subtotal, igv, total, num_items, fecha_emision):
+                resumen = leer_resumen_factura(ruta)
+            else:
+                # Los mismos céntimos que quedan escritos en la factura
+                resumen = {'subtotal_centimos': a_centimos(subtotal), 'igv_centimos': a_centimos(igv),
+                           'total_centimos': a_centimos(total), 'num_items': num_items,
+                           'fecha_emision': fecha_emision}
+            entradas.append(_crear_entrada(numero, ruta, stat, resumen))
+
+        except Exception as e:
+            print(f"Error al registrar factura {numero} en el índice: {e}")
+
+    try:
+        _anexar_registros(entradas)
+    except Exception as e:
+        print(f"Error al actualizar el índice de facturas: {e}")
+        return []
+
+    return entradas
+
+
+def quitar_factura(numero_factura):
+    """
+    Elimina una factura del índice.
+
+    Args:
+        numero_factura: Número de la factura eliminada
+    """
+    quitar_facturas([numero_factura])
+
+
+def quitar_facturas(numeros):
+    """
+    Elimina varias facturas del índice con una sola escritura.
+
+    Args:
+        numeros: Números de las facturas eliminadas
+    """
+    try:
+        _anexar_registros([{'op': 'del', 'numero': numero} for numero in numeros])
+    except Exception as e:
+        print(f"Error al quitar facturas {sorted(numeros)} del índice: {e}")
+
+
+def reconciliar_indice(trabajadores=None):
+    """
+    Sincroniza el índice con los archivos de factura.
+
+    Recorre las carpetas de facturas con os.scandir y solo vuelve a leer las
+    facturas cuyo tamaño o fecha de modificación no coinciden con el índice,
+    de modo que los cambios hechos fuera del sistema se corrigen solos. Las
+    carpetas se recorren y las facturas se releen en paralelo.
+
+    Args:
+        trabajadores: Cantidad de hilos o procesos (por defecto
+            paralelo.TRABAJADORES)
+
+    Returns:
+        dict: Entradas del índice por número de factura
+    """
+    facturas = cargar_indice()
+    pendientes = []
+    presentes = set()
+
+    if not os.path.exists(CARPETA):
+        os.makedirs(CARPETA)
+
+    for numero, entrada in recorrer_facturas(trabajadores):
+        presentes.add(numero)
+        try:
+            stat = entrada.stat()
+        except OSError:
+            continue
+        actual = facturas.get(numero)
+        if (actual is not None
+                and actual['ruta'] == entrada.path
+                and actual['mtime_ns'] == stat.st_mtime_ns
+                and actual['tamaño_bytes'] == stat.st_size):
+            continue
+        pendientes.append((numero, entrada.path, stat))
+
+    resumenes = mapear_ordenado(_resumen_o_ninguno, [ruta for _, ruta, _ in pendientes], trabajadores)
+    registros = [
+        _crear_entrada(numero, ruta, stat, resumen)
+        for (numero, ruta, stat), resumen in zip(pendientes, resumenes)
+        if resumen is not None
+    ]
+
+    for numero in facturas:
+        if numero not in presentes:
+            registros.append({'op': 'del', 'numero': numero})
+
+    _anexar_registros(registros)
+    return cargar_indice()
@@ -0,0 +1,118 @@
+import datetime
+from collections import namedtuple
+
+from utils.archivado import leer_texto
+from utils.dinero import a_centimos
+from utils.paralelo import mapear_ordenado
+from utils.rutas import numero_desde_archivo, recorrer_facturas
+
+# Factura leída de un archivo de texto; los montos en céntimos, los productos
+# como tuplas (nombre, precio_centimos, cantidad, total_centimos) y la fecha de
+# emisión como timestamp (None en facturas guardadas antes de registrarla)
+FacturaLeida = namedtuple(
+    'FacturaLeida',
+    ['numero', 'ruta', 'titulo', 'productos', 'subtotal_centimos', 'igv_centimos', 'total_centimos',
+     'fecha_emision']
+)
+
+# Línea del encabezado con la fecha de emisión (hora local, al segundo)
+ETIQUETA_FECHA = "Fecha de emisión:"
+FORMATO_FECHA = "%d/%m/%Y %H:%M:%S"
+
+
+def _centimos(texto):
+    # Camino rápido para el formato que escribe formatear_factura ("1234.56")
+    if texto[-3:-2] == ".":
+        entero, decimales = texto[:-3], texto[-2:]
+        if decimales.isdigit() and entero.lstrip("-").isdigit():
+            return int(entero + decimales)
+    return a_centimos(texto)
+
+
+def leer_factura_texto(ruta):
+    """
+    Lee una factura de texto en una sola pasada.
+
+    El archivo tiene tres secciones separadas por líneas de guiones:
+    encabezado (con la fecha de emisión), productos y totales.
+
+    Args:
+        ruta: Ruta del archivo de la factura (suelta o archivada)
+
+    Returns:
+        FacturaLeida: Datos de la factura
+
+    Raises:
+        OSError, UnicodeDecodeError: Si no se puede leer el archivo
+    """
+    lineas = leer_texto(ruta).split("\n")
+
+    titulo = lineas[0].strip() if lineas else ""
+    productos = []
+    totales = {'Subtotal': 0, 'IGV': 0, 'TOTAL': 0}
+    fecha_emision = None
+    separadores = 0
+
+    for linea in lineas[1:]:
+        if linea[:1] == "-" and not linea.strip("-"):
+            separadores += 1
+            continue
+
+        if separadores == 0:
+            if linea.startswith(ETIQUETA_FECHA):
+                try:
+                    fecha_emision = datetime.datetime.strptime(
+                        linea[len(ETIQUETA_FECHA):].strip(), FORMATO_FECHA).timestamp()
+                except ValueError:
+                    pass
+
+        elif separadores == 1:
+            # Nombre (puede tener espacios), precio, cantidad y total
+            partes = linea.rsplit(None, 3)
+            if len(partes) < 4:
+                continue
+            try:
+                productos.append((partes[0].strip(), _centimos(partes[1]),
+                                  int(partes[2]), _centimos(partes[3])))
+            except ValueError:
+                continue
+
+        elif separadores >= 2 and "S/." in linea:
+            etiqueta = linea.split(None, 1)[0]
+            if etiqueta in totales:
+                try:
+                    totales[etiqueta] = _centimos(linea.rsplit("S/.", 1)[1].strip())
+                except ValueError:
+                    continue
+
+    return FacturaLeida(numero_desde_archivo(ruta), ruta, titulo or "", productos,
+                        totales['Subtotal'], totales['IGV'], totales['TOTAL'], fecha_emision)
+
+
+def _leer_o_ninguna(ruta):
+    try:
+        return leer_factura_texto(ruta)
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def leer_facturas_texto(trabajadores=None, procesos=None):
+    """
+    Lee todas las facturas de texto de forma perezosa y en orden de carpeta.
+
+    Los archivos se leen en paralelo con utils.paralelo, pero solo unos pocos
+    bloques a la vez, así que la memoria usada no depende de cuántas facturas
+    haya. Los archivos que no se pueden leer se saltan.
+
+    Args:
+        trabajadores: Cantidad de hilos o procesos (por defecto
+            paralelo.TRABAJADORES)
+        procesos: Si es True se usan procesos en lugar de hilos
+
+    Yields:
+        FacturaLeida: Datos de cada factura
+    """
+    rutas = (entrada.path for _, entrada in recorrer_facturas(trabajadores))
+    for factura in mapear_ordenado(_leer_o_ninguna, rutas, trabajadores, procesos):
+        if factura is not None:
+            yield factura
@@ -0,0 +1,375 @@
+import csv
+import json
+from itertools import islice
+
+from utils.dinero import a_soles, calcular_facturas_lote
+from utils.validaciones import limpiar_y_validar_entrada
+from utils.validaciones_lote import mensajes_error, validar_productos_lote
+
+# Mismo límite que el formulario de generación
+MAX_PRODUCTOS = 10
+TAMAÑO_BLOQUE = 500
+
+
+def _a_numero(valor, tipo):
+    # Solo se convierte el texto (CSV o JSON con números entre comillas); lo
+    # demás se deja como viene para que la validación rechace una cantidad
+    # 2.7 o un booleano en lugar de truncarlos. El texto que no se puede
+    # convertir también se deja como viene.
+    if not isinstance(valor, str):
+        return valor
+    try:
+        return tipo(valor)
+    except ValueError:
+        return valor
+
+
+def leer_productos(datos):
+    """
+    Convierte los productos de un pedido en formato JSON
+    ([{"nombre": ..., "precio": ..., "cantidad": ...}, ...]) a tuplas.
+
+    Los valores que no se pueden convertir se dejan como vienen para que la
+    validación los rechace.
+
+    Args:
+        datos: Lista de diccionarios
+
+    Returns:
+        list: Tuplas (nombre, precio, cantidad)
+
+    Raises:
+        AttributeError, TypeError: Si datos no es una lista de diccionarios
+    """
+    return [
+        (limpiar_y_validar_entrada(p.get('nombre')),
+         _a_numero(p.get('precio'), float),
+         _a_numero(p.get('cantidad'), int))
+        for p in datos
+    ]
+
+
+def leer_pedidos_csv(ruta):
+    """
+    Lee pedidos de un CSV con columnas pedido, nombre, precio y cantidad.
+
+    Las filas de un mismo pedido deben estar seguidas. El archivo se lee fila
+    por fila, así que el consumo de memoria no depende de su tamaño.
+
+    Args:
+        ruta: Ruta del archivo CSV (con encabezado)
+
+    Yields:
+        tuple: (pedido, productos) con productos como tuplas (nombre, precio, cantidad)
+    """
+    with open(ruta, "r", encoding="utf-8", newline="") as f:
+        pedido_actual = None
+        productos = []
+
+        for fila in csv.DictReader(f):
+            pedido = (fila.get('pedido') or "").strip()
+            if pedido != pedido_actual and productos:
+                yield pedido_actual, productos
+                productos = []
+            pedido_actual = pedido
+
+            productos.append((
+                limpiar_y_validar_entrada(fila.get('nombre')),
+                _a_numero(fila.get('precio'), float),
+                _a_numero(fila.get('cantidad'), int)
+            ))
+
+        if productos:
+            yield pedido_actual, productos
+
+
+def leer_pedidos_jsonl(ruta):
+    """
+    Lee pedidos de un archivo JSONL, un pedido por línea:
+    {"pedido": "A-1", "productos": [{"nombre": ..., "precio": ..., "cantidad": ...}]}
+
+    Args:
+        ruta: Ruta del archivo JSONL
+
+    Yields:
+        tuple: (pedido, productos) con productos como tuplas (nombre, precio, cantidad)
+    """
+    with open(ruta, "r", encoding="utf-8") as f:
+        for num_linea, linea in enumerate(f, 1):
+            if not linea.strip():
+                continue
+
+            try:
+                datos = json.loads(linea)
+                productos = leer_productos(datos.get('productos', []))
+                yield str(datos.get('pedido', num_linea)), productos
+            except (ValueError, AttributeError, TypeError):
+                # Línea ilegible: se entrega sin productos para que sea rechazada
+                yield f"línea {num_linea}", []
+
+
+def validar_pedidos(lista_productos):
+    """
+    Valida los productos de muchos pedidos con una sola validación vectorizada.
+
+    Args:
+        lista_productos: Lista con los productos de cada pedido, como tuplas
+            (nombre, precio, cantidad)
+
+    Returns:
+        list: Mensajes de error de cada pedido (lista vacía si es válido)
+    """
+    columnas = {'nombre': [], 'precio': [], 'cantidad': []}
+    for productos in lista_productos:
+        for nombre, precio, cantidad in productos:
+            columnas['nombre'].append(nombre)
+            columnas['precio'].append(precio)
+            columnas['cantidad'].append(cantidad)
+
+    _, codigos = validar_productos_lote(columnas)
+
+    errores_por_pedido = []
+    fila = 0
+    for productos in lista_productos:
+        errores = []
+        if not productos:
+            errores.append("El pedido no tiene productos")
+        elif len(productos) > MAX_PRODUCTOS:
+            errores.append(f"El pedido tiene más de {MAX_PRODUCTOS} productos")
+
+        for i, codigo in enumerate(codigos[fila:fila + len(productos)], 1):
+            if codigo:
+                errores.extend(f"Producto {i}: {mensaje}" for mensaje in mensajes_error(codigo))
+
+        fila += len(productos)
+        errores_por_pedido.append(errores)
+
+    return errores_por_pedido
+
+
+def validar_pedido(productos):
+    """
+    Valida los productos de un pedido con las reglas de utils/validaciones.
+
+    Args:
+        productos: Lista de tuplas (nombre, precio, cantidad)
+
+    Returns:
+        list: Mensajes de error (vacía si el pedido es válido)
+    """
+    return validar_pedidos([productos])[0]
+
+
+def preparar_facturas(lista_productos):
+    """
+    Calcula los totales de muchos pedidos válidos en una sola pasada
+    vectorizada, con montos exactos en céntimos.
+
+    Args:
+        lista_productos: Lista con los productos de cada pedido, como tuplas
+            (nombre, precio, cantidad)
+
+    Returns:
+        list: Tuplas (productos_con_total, subtotal, igv, total) por pedido
+    """
+    precios, cantidades, grupos = [], [], []
+    for i, productos in enumerate(lista_productos):
+        for _, precio, cantidad in productos:
+            precios.append(precio)
+            cantidades.append(cantidad)
+            grupos.append(i)
+
+    totales_item, subtotales, igv, totales = calcular_facturas_lote(precios, cantidades, grupos)
+
+    facturas = []
+    fila = 0
+    for i, productos in enumerate(lista_productos):
+        productos_con_total = [(nombre, precio, cantidad, a_soles(int(total_item)))
+                               for (nombre, precio, cantidad), total_item
+                               in zip(productos, totales_item[fila:fila + len(productos)])]
+        fila += len(productos)
+        facturas.append((productos_con_total, a_soles(int(subtotales[i])),
+                         a_soles(int(igv[i])), a_soles(int(totales[i]))))
+    return facturas
+
+
+def preparar_factura(productos):
+    """
+    Calcula los totales de un pedido válido.
+
+    Args:
+        productos: Lista de tuplas (nombre, precio, cantidad)
+
+    Returns:
+        tuple: (productos_con_total, subtotal, igv, total)
+    """
+    return preparar_facturas([productos])[0]
+
+
+def generar_facturas_lote(pedidos, repositorio=None, tamaño_bloque=TAMAÑO_BLOQUE, al_rechazar=None):
+    """
+    Genera facturas para muchos pedidos.
+
+    Los pedidos se procesan por bloques: se validan todos los del bloque, se
+    reserva de una vez un número de factura para cada pedido válido y se
+    guardan juntos. Solo un bloque está en memoria a la vez.
+
+    Args:
+        pedidos: Iterable de tuplas (pedido, productos)
+        repositorio: Repositorio donde guardar (por defecto el configurado)
+        tamaño_bloque: Cantidad de pedidos por bloque
+        al_rechazar: Función opcional llamada con (pedido, errores) por cada
+            pedido inválido
+
+    Returns:
+        dict: generadas, rechazadas, primer_numero y ultimo_numero
+    """
+    if repositorio is None:
+        from utils.almacenamiento import obtener_repositorio
+        repositorio = obtener_repositorio()
+
+    resumen = {'generadas': 0, 'rechazadas': 0, 'primer_numero': None, 'ultimo_numero': None}
+    pedidos = iter(pedidos)
+
+    while True:
+        bloque = list(islice(pedidos, tamaño_bloque))
+        if not bloque:
+            break
+
+        validos = []
+        errores_bloque = validar_pedidos([productos for _, productos in bloque])
+        for (pedido, productos), errores in zip(bloque, errores_bloque):
+            if errores:
+                resumen['rechazadas'] += 1
+                if al_rechazar is not None:
+                    al_rechazar(pedido, errores)
+            else:
+                validos.append(productos)
+
+        if not validos:
+            continue
+
+        validos = preparar_facturas(validos)
+
+        numeros = repositorio.reservar_numeros(len(validos))
+        guardadas = repositorio.guardar_lote(
+            [(numero, *factura) for numero, factura in zip(numeros, validos)]
+        )
+
+        resumen['generadas'] += len(guardadas)
+        if guardadas:
+            if resumen['primer_numero'] is None:
+                resumen['primer_numero'] = guardadas[0]
+            resumen['ultimo_numero'] = guardadas[-1]
+
+    return resumen
+
+
+def cambiar_precio_lote(repositorio, numeros, producto, precio, tamaño_bloque=TAMAÑO_BLOQUE):
+    """
+    Cambia el precio de un producto en muchas facturas y recalcula sus
+    totales.
+
+    El producto se compara sin distinguir mayúsculas ni tildes. Las facturas
+    se leen en paralelo y se reescriben por bloques con
+    repositorio.actualizar_lote, cada uno en una sola operación; una factura
+    que otra sesión modificó mientras tanto no se toca.
+
+    Args:
+        repositorio: Repositorio de facturas
+        numeros: Números de las facturas a revisar
+        producto: Nombre del producto
+        precio: Nuevo precio en soles
+        tamaño_bloque: Facturas por operación de escritura
+
+    Returns:
+        dict: revisadas, modificadas (lista de números) y conflictos
+            (facturas con el producto que no se pudieron reescribir)
+    """
+    from utils.busqueda import normalizar
+    from utils.dinero import calcular_factura
+    from utils.paralelo import mapear_ordenado
+
+    if precio <= 0:
+        raise ValueError("El precio debe ser mayor que 0")
+
+    buscado = normalizar(producto)
+
+    def leer(numero):
+        # La versión se lee antes que los productos: si cambian entre medio,
+        # la escritura se rechaza en lugar de pisar el cambio
+        return repositorio.version(numero), repositorio.cargar(numero)
+
+    resumen = {'revisadas': 0, 'modificadas': [], 'conflictos': 0}
+    numeros = iter(sorted(set(numeros)))
+
+    while True:
+        bloque = list(islice(numeros, tamaño_bloque))
+        if not bloque:
+            break
+
+        cambios = []
+        # Con hilos siempre: el repositorio no se puede enviar a otro proceso
+        for numero, (version, productos) in zip(bloque, mapear_ordenado(leer, bloque, procesos=False)):
+            resumen['revisadas'] += 1
+            if version is None or not any(normalizar(nombre) == buscado and precio_actual != precio
+                                          for nombre, precio_actual, _ in productos):
+                continue
+            nuevos = [(nombre, precio if normalizar(nombre) == buscado else precio_actual, cantidad)
+                      for nombre, precio_actual, cantidad in productos]
+            cambios.append((numero, *calcular_factura(nuevos), version))
+
+        if cambios:
+            modificadas = repositorio.actualizar_lote(cambios)
+            resumen['modificadas'].extend(modificadas)
+            resumen['conflictos'] += len(cambios) - len(modificadas)
+
+    return resumen
+
+
+def main(argumentos=None):
+    """
+    Punto de entrada de línea de comandos:
+
+        python -m utils.lote pedidos.csv [--formato jsonl] [--bloque 500]
+                             [--errores rechazados.jsonl] [--backend sqlite|binario]
+    """
+    import argparse
+
+    from utils.almacenamiento import obtener_repositorio
+
+    parser = argparse.ArgumentParser(description="Genera facturas en lote desde CSV o JSONL")
+    parser.add_argument("archivo", help="Archivo de pedidos")
+    parser.add_argument("--formato", choices=["csv", "jsonl"],
+                        help="Formato del archivo (por defecto según la extensión)")
+    parser.add_argument("--bloque", type=int, default=TAMAÑO_BLOQUE, help="Pedidos por bloque")
+    parser.add_argument("--errores", help="Archivo JSONL donde anotar los pedidos rechazados")
+    parser.add_argument("--backend", choices=["texto", "sqlite", "binario"], help="Backend de almacenamiento")
+    args = parser.parse_args(argumentos)
+
+    formato = args.formato or ("jsonl" if args.archivo.lower().endswith((".jsonl", ".json")) else "csv")
+    pedidos = leer_pedidos_jsonl(args.archivo) if formato == "jsonl" else leer_pedidos_csv(args.archivo)
+
+    archivo_errores = open(args.errores, "w", encoding="utf-8") if args.errores else None
+
+    def al_rechazar(pedido, errores):
+        if archivo_errores is not None:
+            archivo_errores.write(json.dumps({'pedido': pedido, 'errores': errores}, ensure_ascii=False) + "\n")
+
+    try:
+        resumen = generar_facturas_lote(pedidos, obtener_repositorio(args.backend),
+                                        tamaño_bloque=args.bloque, al_rechazar=al_rechazar)
+    finally:
+        if archivo_errores is not None:
+            archivo_errores.close()
+
+    print(f"✅ Facturas generadas: {resumen['generadas']}")
+    if resumen['generadas']:
+        print(f"   Números: {resumen['primer_numero']:03d} a {resumen['ultimo_numero']:03d}")
+    if resumen['rechazadas']:
+        print(f"❌ Pedidos rechazados: {resumen['rechazadas']}")
+    return resumen
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import itertools
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Cantidad de hilos (o procesos) para leer muchas facturas a la vez. Se puede
+# cambiar con la variable de entorno PERU_DELIVERY_TRABAJADORES; con 1 todo se
+# lee en el mismo hilo, como antes.
+TRABAJADORES = int(os.environ.get("PERU_DELIVERY_TRABAJADORES", "0")) or min(32, (os.cpu_count() or 1) + 4)
+
+# Si es "1" se usan procesos en lugar de hilos (útil cuando lo que pesa es
+# interpretar los archivos y no esperar al disco)
+USAR_PROCESOS = os.environ.get("PERU_DELIVERY_PROCESOS", "") == "1"
+
+# Elementos que procesa cada tarea; con procesos evita pagar el envío entre
+# procesos por cada archivo
+TAMAÑO_BLOQUE = 64
+
+
+def _aplicar(funcion, bloque):
+    return [funcion(elemento) for elemento in bloque]
+
+
+def _bloques(elementos, tamaño):
+    iterador = iter(elementos)
+    while True:
+        bloque = list(itertools.islice(iterador, tamaño))
+        if not bloque:
+            return
+        yield bloque
+
+
+def mapear_ordenado(funcion, elementos, trabajadores=None, procesos=None, tamaño_bloque=TAMAÑO_BLOQUE):
+    """
+    Aplica una función a cada elemento usando varios hilos o procesos y
+    entrega los resultados en el mismo orden que los elementos.
+
+    Los elementos se reparten en bloques y solo hay unos pocos bloques en
+    curso a la vez, así que la memoria no depende de cuántos elementos haya.
+    Si todo cabe en un bloque o trabajadores es 1, se procesa en el mismo
+    hilo sin crear el pool.
+
+    Args:
+        funcion: Función a aplicar; con procesos debe estar definida a nivel
+            de módulo para poder enviarse a otro proceso
+        elementos: Iterable con los elementos
+        trabajadores: Cantidad de hilos o procesos (por defecto TRABAJADORES)
+        procesos: Si es True usa procesos en lugar de hilos (por defecto
+            USAR_PROCESOS)
+        tamaño_bloque: Elementos por tarea
+
+    Yields:
+        Resultado de funcion para cada elemento, en orden
+    """
+    trabajadores = trabajadores or TRABAJADORES
+    procesos = USAR_PROCESOS if procesos is None else procesos
+
+    bloques = _bloques(elementos, tamaño_bloque)
+    iniciales = list(itertools.islice(bloques, 2))
+
+    if trabajadores <= 1 or len(iniciales) < 2:
+        for bloque in itertools.chain(iniciales, bloques):
+            yield from _aplicar(funcion, bloque)
+        return
+
+    tipo_pool = ProcessPoolExecutor if procesos else ThreadPoolExecutor
+    with tipo_pool(max_workers=trabajadores) as pool:
+        pendientes = deque()
+        for bloque in itertools.chain(iniciales, bloques):
+            pendientes.append(pool.submit(_aplicar, funcion, bloque))
+            # Se mantienen dos bloques por trabajador en curso como máximo
+            if len(pendientes) >= trabajadores * 2:
+                yield from pendientes.popleft().result()
+        while pendientes:
+            yield from pendientes.popleft().result()
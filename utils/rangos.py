@@ -0,0 +1,46 @@
+import bisect
+
+# Índices secundarios ordenados: listas de pares (clave, numero) ordenadas, que
+# permiten obtener con búsqueda binaria las facturas cuya clave (fecha de
+# emisión, total en céntimos, ...) cae en un rango, sin recorrer todas.
+
+
+def crear_orden(pares):
+    """
+    Crea un índice ordenado.
+
+    Args:
+        pares: Iterable de tuplas (clave, numero)
+
+    Returns:
+        list: Pares ordenados por clave y luego por número
+    """
+    return sorted(pares)
+
+
+def insertar(orden, clave, numero):
+    """Agrega una factura al índice ordenado."""
+    bisect.insort(orden, (clave, numero))
+
+
+def quitar(orden, clave, numero):
+    """Quita una factura del índice ordenado, si estaba con esa clave."""
+    posicion = bisect.bisect_left(orden, (clave, numero))
+    if posicion < len(orden) and orden[posicion] == (clave, numero):
+        del orden[posicion]
+
+
+def en_rango(orden, desde=None, hasta=None):
+    """
+    Números de las facturas con la clave dentro de un rango, ordenados por clave.
+
+    Args:
+        orden: Índice creado con crear_orden
+        desde, hasta: Límites del rango (inclusivos); None no limita
+
+    Returns:
+        list: Números de factura
+    """
+    inicio = bisect.bisect_left(orden, (desde,)) if desde is not None else 0
+    fin = bisect.bisect_right(orden, (hasta, float("inf"))) if hasta is not None else len(orden)
+    return [numero for _, numero in orden[inicio:fin]]
@@ -0,0 +1,434 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+
+from utils.busqueda import normalizar
+from utils.dinero import a_centimos, a_soles
+from utils.paralelo import mapear_ordenado
+
+CARPETA = "cache"
+
+# Totales ya sumados por día y por mes (ventas, IGV y productos) para que los
+# reportes no tengan que recorrer las facturas. Se guardan en una base SQLite
+# aparte, una por backend, junto con lo que aportó cada factura para poder
+# restarlo cuando se edita o se elimina.
+#
+# Cada escritura del repositorio suma en el momento las facturas que tocó
+# (registrar_cambios); antes de cada reporte, actualizar_reportes solo aplica
+# lo que cambió por otros caminos (un respaldo restaurado, una réplica, un
+# archivo copiado a mano) o lo que una escritura no pudo sumar porque la base
+# estaba ocupada.
+ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS estado (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        token TEXT
+    );
+    INSERT OR IGNORE INTO estado (id, token) VALUES (1, NULL);
+
+    CREATE TABLE IF NOT EXISTS aportes (
+        numero INTEGER PRIMARY KEY,
+        version TEXT NOT NULL,
+        dia TEXT NOT NULL,
+        subtotal_centimos INTEGER NOT NULL,
+        igv_centimos INTEGER NOT NULL,
+        total_centimos INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS aportes_productos (
+        numero INTEGER NOT NULL,
+        producto TEXT NOT NULL,
+        nombre TEXT NOT NULL,
+        cantidad INTEGER NOT NULL,
+        total_centimos INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_aportes_productos ON aportes_productos(numero);
+
+    CREATE TABLE IF NOT EXISTS ventas (
+        periodo TEXT PRIMARY KEY,
+        cantidad INTEGER NOT NULL,
+        subtotal_centimos INTEGER NOT NULL,
+        igv_centimos INTEGER NOT NULL,
+        total_centimos INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS productos (
+        periodo TEXT NOT NULL,
+        producto TEXT NOT NULL,
+        nombre TEXT NOT NULL,
+        cantidad INTEGER NOT NULL,
+        total_centimos INTEGER NOT NULL,
+        PRIMARY KEY (periodo, producto)
+    );
+"""
+
+# Los periodos se guardan como texto: "2025-03-14" (día) y "2025-03" (mes),
+# así que en las dos tablas se ordenan y filtran por rango directamente
+
+# Segundos que una escritura espera la base de reportes antes de dejar su
+# parte para el próximo reporte (ver registrar_cambios)
+ESPERA_AL_ESCRIBIR = 1
+
+# Conexiones de registrar_cambios: una por hilo y por base
+_local = threading.local()
+
+
+def _ruta_base(repositorio):
+    return os.path.join(CARPETA, f"reportes_{repositorio.nombre}.db")
+
+
+def _conectar(repositorio, espera=30):
+    if not os.path.exists(CARPETA):
+        os.makedirs(CARPETA)
+    conexion = sqlite3.connect(_ruta_base(repositorio), timeout=espera, isolation_level=None)
+    conexion.row_factory = sqlite3.Row
+    conexion.execute("PRAGMA journal_mode=WAL")
+    # Los totales se pueden recalcular, y el token se guarda en la misma
+    # transacción: si un corte se lleva el último commit, se vuelve a aplicar
+    conexion.execute("PRAGMA synchronous=NORMAL")
+    conexion.executescript(ESQUEMA)
+    return conexion
+
+
+def _conexion_escritura(repositorio):
+    # Se reutiliza para no abrir la base (ni repasar el esquema) en cada escritura
+    conexiones = getattr(_local, 'conexiones', None)
+    if conexiones is None:
+        conexiones = _local.conexiones = {}
+    ruta = _ruta_base(repositorio)
+    if ruta not in conexiones:
+        conexiones[ruta] = _conectar(repositorio, espera=ESPERA_AL_ESCRIBIR)
+    return conexiones[ruta]
+
+
+def _a_tuplas(valor):
+    # El token se guarda como JSON, que convierte las tuplas en listas
+    if isinstance(valor, list):
+        return tuple(_a_tuplas(elemento) for elemento in valor)
+    if isinstance(valor, dict):
+        return {clave: _a_tuplas(elemento) for clave, elemento in valor.items()}
+    return valor
+
+
+def _sumar(conexion, dia, montos, productos, signo):
+    # Suma (signo 1) o resta (signo -1) lo que aporta una factura a su día y su mes
+    subtotal, igv, total = montos
+    for periodo in (dia, dia[:7]):
+        conexion.execute(
+            "INSERT INTO ventas (periodo, cantidad, subtotal_centimos, igv_centimos, total_centimos) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT(periodo) DO UPDATE SET "
+            "cantidad = cantidad + excluded.cantidad, "
+            "subtotal_centimos = subtotal_centimos + excluded.subtotal_centimos, "
+            "igv_centimos = igv_centimos + excluded.igv_centimos, "
+            "total_centimos = total_centimos + excluded.total_centimos",
+            (periodo, signo, signo * subtotal, signo * igv, signo * total)
+        )
+        conexion.executemany(
+            "INSERT INTO productos (periodo, producto, nombre, cantidad, total_centimos) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT(periodo, producto) DO UPDATE SET "
+            "nombre = MIN(nombre, excluded.nombre), cantidad = cantidad + excluded.cantidad, "
+            "total_centimos = total_centimos + excluded.total_centimos",
+            [(periodo, producto, nombre, signo * cantidad, signo * total_item)
+             for producto, nombre, cantidad, total_item in productos]
+        )
+        if signo < 0:
+            conexion.execute("DELETE FROM ventas WHERE periodo = ? AND cantidad <= 0", (periodo,))
+            conexion.execute("DELETE FROM productos WHERE periodo = ? AND cantidad <= 0", (periodo,))
+
+
+def _quitar_aporte(conexion, numero):
+    aporte = conexion.execute("SELECT * FROM aportes WHERE numero = ?", (numero,)).fetchone()
+    if aporte is None:
+        return
+
+    productos = [tuple(fila) for fila in conexion.execute(
+        "SELECT producto, nombre, cantidad, total_centimos FROM aportes_productos WHERE numero = ?", (numero,))]
+    _sumar(conexion, aporte['dia'],
+           (aporte['subtotal_centimos'], aporte['igv_centimos'], aporte['total_centimos']), productos, -1)
+    conexion.execute("DELETE FROM aportes WHERE numero = ?", (numero,))
+    conexion.execute("DELETE FROM aportes_productos WHERE numero = ?", (numero,))
+
+
+def _agregar_aporte(conexion, info, productos):
+    numero = info['numero']
+    dia = datetime.date.fromtimestamp(info['fecha_emision']).isoformat()
+    montos = (a_centimos(info['subtotal']), a_centimos(info['igv']), info['total_centimos'])
+
+    # Los productos se agrupan por nombre normalizado (sin tildes ni mayúsculas)
+    lineas = {}
+    for nombre, precio, cantidad in productos:
+        producto = normalizar(nombre)
+        linea = lineas.setdefault(producto, [producto, nombre, 0, 0])
+        linea[2] += cantidad
+        linea[3] += a_centimos(precio) * cantidad
+    lineas = [tuple(linea) for linea in lineas.values()]
+
+    conexion.execute(
+        "INSERT INTO aportes (numero, version, dia, subtotal_centimos, igv_centimos, total_centimos) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (numero, str(info['version']), dia, *montos)
+    )
+    conexion.executemany(
+        "INSERT INTO aportes_productos (numero, producto, nombre, cantidad, total_centimos) VALUES (?, ?, ?, ?, ?)",
+        [(numero, *linea) for linea in lineas]
+    )
+    _sumar(conexion, dia, montos, lineas, 1)
+
+
+def _pendientes(repositorio, conexion, numeros):
+    # Info actual de las facturas cuyo aporte no está en su versión (None si
+    # la factura ya no existe pero todavía aporta)
+    infos = {}
+    for numero in numeros:
+        aporte = conexion.execute("SELECT version FROM aportes WHERE numero = ?", (numero,)).fetchone()
+        info = repositorio.obtener_info(numero)
+        if info is None:
+            if aporte is not None:
+                infos[numero] = None
+        elif aporte is None or aporte['version'] != str(info['version']):
+            infos[numero] = info
+    return infos
+
+
+def _aplicar(repositorio, conexion, infos):
+    # infos: numero -> info actual (None si la factura ya no existe)
+    for numero in infos:
+        _quitar_aporte(conexion, numero)
+
+    vigentes = [info for info in infos.values() if info is not None]
+    # Con hilos siempre: el repositorio no se puede enviar a otro proceso
+    productos = mapear_ordenado(lambda info: repositorio.cargar(info['numero']), vigentes, procesos=False)
+    for info, productos_factura in zip(vigentes, productos):
+        _agregar_aporte(conexion, info, productos_factura)
+
+
+def actualizar_reportes(repositorio):
+    """
+    Pone al día los totales por día y por mes con las facturas que cambiaron.
+
+    Usa el token de cambios del repositorio, así que solo se miran las
+    facturas guardadas, editadas o eliminadas desde la última vez (en
+    cualquier sesión o proceso), y de ellas solo se releen las que
+    registrar_cambios no sumó al escribirlas. Si el repositorio no puede
+    decir qué cambió, se comparan las versiones de todas las facturas y solo
+    se releen las distintas.
+
+    Args:
+        repositorio: Repositorio de facturas
+
+    Returns:
+        int: Cantidad de facturas que se actualizaron
+    """
+    conexion = _conectar(repositorio)
+    try:
+        # BEGIN IMMEDIATE: dos procesos no aplican los mismos cambios a la vez
+        conexion.execute("BEGIN IMMEDIATE")
+    except Exception:
+        conexion.close()
+        raise
+
+    try:
+        guardado = conexion.execute("SELECT token FROM estado WHERE id = 1").fetchone()['token']
+        token, numeros = repositorio.cambios_desde(_a_tuplas(json.loads(guardado)) if guardado else None)
+
+        if numeros is None:
+            versiones = {fila['numero']: fila['version']
+                         for fila in conexion.execute("SELECT numero, version FROM aportes")}
+            actuales = {info['numero']: info for info in repositorio.listar()}
+            infos = {numero: info for numero, info in actuales.items() if versiones.get(numero) != str(info['version'])}
+            infos.update({numero: None for numero in versiones if numero not in actuales})
+        else:
+            # Las que ya sumó registrar_cambios al escribirlas se saltan
+            infos = _pendientes(repositorio, conexion, numeros)
+
+        _aplicar(repositorio, conexion, infos)
+        if json.dumps(token) != guardado:
+            conexion.execute("UPDATE estado SET token = ? WHERE id = 1", (json.dumps(token),))
+        conexion.execute("COMMIT")
+        return len(infos)
+
+    except Exception:
+        conexion.execute("ROLLBACK")
+        raise
+    finally:
+        conexion.close()
+
+
+def registrar_cambios(repositorio, numeros):
+    """
+    Pone al día los totales con facturas recién guardadas, editadas o
+    eliminadas; el repositorio lo llama después de cada escritura.
+
+    No avanza el token de cambios: actualizar_reportes las vuelve a ver, pero
+    como su aporte ya está en la versión actual no las relee. Si la base de
+    reportes está ocupada más de ESPERA_AL_ESCRIBIR segundos (o falla), se
+    dejan para el próximo reporte en lugar de frenar la escritura.
+
+    Args:
+        repositorio: Repositorio de facturas
+        numeros: Números de las facturas escritas
+
+    Returns:
+        int: Cantidad de facturas que se actualizaron
+    """
+    try:
+        conexion = _conexion_escritura(repositorio)
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            infos = _pendientes(repositorio, conexion, numeros)
+            _aplicar(repositorio, conexion, infos)
+            conexion.execute("COMMIT")
+            return len(infos)
+        except Exception:
+            conexion.execute("ROLLBACK")
+            raise
+    except Exception as e:
+        print(f"❌ No se pudieron actualizar los reportes: {e}")
+        return 0
+
+
+def reconstruir_reportes(repositorio):
+    """
+    Borra los totales por periodo y los vuelve a calcular desde las facturas.
+
+    Args:
+        repositorio: Repositorio de facturas
+
+    Returns:
+        int: Cantidad de facturas procesadas
+    """
+    conexion = _conectar(repositorio)
+    try:
+        conexion.execute("BEGIN IMMEDIATE")
+        for tabla in ("aportes", "aportes_productos", "ventas", "productos"):
+            conexion.execute(f"DELETE FROM {tabla}")
+        conexion.execute("UPDATE estado SET token = NULL WHERE id = 1")
+        conexion.execute("COMMIT")
+    finally:
+        conexion.close()
+
+    cantidad = actualizar_reportes(repositorio)
+    print(f"✅ Reportes reconstruidos: {cantidad} facturas")
+    return cantidad
+
+
+def _filas_ventas(conexion, desde, hasta):
+    return conexion.execute(
+        "SELECT * FROM ventas WHERE periodo BETWEEN ? AND ? AND length(periodo) = ? ORDER BY periodo",
+        (desde, hasta, len(desde))
+    ).fetchall()
+
+
+def _en_soles(periodo, cantidad, subtotal, igv, total):
+    return {
+        'periodo': periodo,
+        'cantidad': cantidad,
+        'subtotal': a_soles(subtotal),
+        'igv': a_soles(igv),
+        'total': a_soles(total)
+    }
+
+
+def ventas_por_periodo(repositorio, desde, hasta, agrupar="dia"):
+    """
+    Ventas e IGV por día, semana o mes entre dos fechas.
+
+    Cada periodo sale de los totales ya sumados: un registro por día o por
+    mes (siete por semana), sin importar cuántas facturas tenga.
+
+    Args:
+        repositorio: Repositorio de facturas
+        desde, hasta: Fechas (datetime.date) del rango, inclusivas
+        agrupar: "dia", "semana" o "mes"
+
+    Returns:
+        list: Diccionarios con periodo, cantidad, subtotal, igv y total (en
+            soles) de cada periodo con ventas, en orden; las semanas se
+            identifican por su lunes
+    """
+    actualizar_reportes(repositorio)
+
+    conexion = _conectar(repositorio)
+    try:
+        if agrupar == "mes":
+            filas = _filas_ventas(conexion, desde.isoformat()[:7], hasta.isoformat()[:7])
+        else:
+            filas = _filas_ventas(conexion, desde.isoformat(), hasta.isoformat())
+    finally:
+        conexion.close()
+
+    if agrupar != "semana":
+        return [_en_soles(fila['periodo'], fila['cantidad'], fila['subtotal_centimos'],
+                          fila['igv_centimos'], fila['total_centimos']) for fila in filas]
+
+    semanas = {}
+    for fila in filas:
+        dia = datetime.date.fromisoformat(fila['periodo'])
+        lunes = (dia - datetime.timedelta(days=dia.weekday())).isoformat()
+        semana = semanas.setdefault(lunes, [0, 0, 0, 0])
+        semana[0] += fila['cantidad']
+        semana[1] += fila['subtotal_centimos']
+        semana[2] += fila['igv_centimos']
+        semana[3] += fila['total_centimos']
+    return [_en_soles(lunes, *valores) for lunes, valores in sorted(semanas.items())]
+
+
+def productos_mas_vendidos(repositorio, desde, hasta, limite=10):
+    """
+    Productos con más ventas (en soles) entre dos fechas.
+
+    Los meses completos del rango se leen de los totales por mes y los días
+    sueltos de los extremos, de los totales por día.
+
+    Args:
+        repositorio: Repositorio de facturas
+        desde, hasta: Fechas (datetime.date) del rango, inclusivas
+        limite: Cantidad máxima de productos
+
+    Returns:
+        list: Diccionarios con nombre, cantidad y total (en soles), de mayor
+            a menor total
+    """
+    actualizar_reportes(repositorio)
+
+    # Meses completamente dentro del rango
+    primer_mes = desde if desde.day == 1 else (desde.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    siguiente = hasta + datetime.timedelta(days=1)
+    fin_meses = siguiente.replace(day=1) if siguiente.day != 1 else siguiente
+
+    periodos = []
+    if primer_mes < fin_meses:
+        periodos.append(("BETWEEN ? AND ? AND length(periodo) = 7",
+                         (primer_mes.isoformat()[:7], (fin_meses - datetime.timedelta(days=1)).isoformat()[:7])))
+        if desde < primer_mes:
+            periodos.append(("BETWEEN ? AND ? AND length(periodo) = 10",
+                             (desde.isoformat(), (primer_mes - datetime.timedelta(days=1)).isoformat())))
+        if fin_meses <= hasta:
+            periodos.append(("BETWEEN ? AND ? AND length(periodo) = 10", (fin_meses.isoformat(), hasta.isoformat())))
+    else:
+        periodos.append(("BETWEEN ? AND ? AND length(periodo) = 10", (desde.isoformat(), hasta.isoformat())))
+
+    condicion = " OR ".join(f"(periodo {rango})" for rango, _ in periodos)
+    parametros = [valor for _, valores in periodos for valor in valores]
+
+    conexion = _conectar(repositorio)
+    try:
+        filas = conexion.execute(
+            f"SELECT producto, MIN(nombre) AS nombre, SUM(cantidad) AS cantidad, SUM(total_centimos) AS total "
+            f"FROM productos WHERE {condicion} GROUP BY producto ORDER BY total DESC, producto LIMIT ?",
+            (*parametros, limite)
+        ).fetchall()
+    finally:
+        conexion.close()
+
+    return [{'nombre': fila['nombre'], 'cantidad': fila['cantidad'], 'total': a_soles(fila['total'])}
+            for fila in filas]
+
+
+if __name__ == "__main__":
+    # Uso: python -m utils.reportes --reconstruir
+    import sys
+
+    from utils.almacenamiento import obtener_repositorio
+
+    if "--reconstruir" in sys.argv:
+        reconstruir_reportes(obtener_repositorio())
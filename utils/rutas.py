@@ -0,0 +1,229 @@
+import os
+
+from utils.archivado import recorrer_archivadas, ruta_archivada
+from utils.escritura import sincronizar_directorio
+from utils.paralelo import mapear_ordenado
+
+CARPETA = "cache"
+
+# Las facturas nuevas se reparten en subcarpetas de 1000 facturas cada una
+# (cache/facturas/0000, cache/facturas/0001, ...) para que ninguna carpeta
+# crezca sin límite. Las facturas antiguas guardadas directamente en cache/
+# se siguen leyendo donde están.
+CARPETA_FACTURAS = os.path.join(CARPETA, "facturas")
+FACTURAS_POR_CARPETA = 1000
+
+# Lápidas de las facturas eliminadas que todavía se pueden recuperar: la
+# factura sigue en disco, pero con su lápida no aparece en ningún listado
+CARPETA_ELIMINADAS = os.path.join(CARPETA, "eliminadas")
+EXTENSION_LAPIDA = ".lapida"
+
+
+def nombre_archivo_factura(numero_factura):
+    """Nombre del archivo de una factura: factura_001.txt, factura_1234.txt, ..."""
+    return f"factura_{str(numero_factura).zfill(3)}.txt"
+
+
+def numero_desde_archivo(nombre_archivo):
+    """
+    Extrae el número de factura de un nombre de archivo factura_XXX.txt.
+
+    Args:
+        nombre_archivo: Nombre (o ruta) del archivo
+
+    Returns:
+        int: Número de la factura o None si el nombre no tiene el formato esperado
+    """
+    nombre = os.path.basename(nombre_archivo)
+    if not (nombre.startswith("factura_") and nombre.endswith(".txt")):
+        return None
+    try:
+        return int(nombre[len("factura_"):-len(".txt")])
+    except ValueError:
+        return None
+
+
+def carpeta_factura(numero_factura):
+    """Subcarpeta donde se guarda una factura nueva."""
+    return os.path.join(CARPETA_FACTURAS, f"{numero_factura // FACTURAS_POR_CARPETA:04d}")
+
+
+def ruta_factura(numero_factura, crear_carpeta=False):
+    """
+    Ruta donde se guarda una factura nueva.
+
+    Args:
+        numero_factura: Número de la factura
+        crear_carpeta: Si es True se crea la subcarpeta si todavía no existe
+
+    Returns:
+        str: Ruta del archivo
+    """
+    carpeta = carpeta_factura(numero_factura)
+    if crear_carpeta and not os.path.isdir(carpeta):
+        os.makedirs(carpeta, exist_ok=True)
+        sincronizar_directorio(os.path.dirname(carpeta))
+    return os.path.join(carpeta, nombre_archivo_factura(numero_factura))
+
+
+def ruta_factura_antigua(numero_factura):
+    """Ruta de una factura guardada con la estructura anterior, directamente en cache/."""
+    return os.path.join(CARPETA, nombre_archivo_factura(numero_factura))
+
+
+def ruta_lapida(numero_factura):
+    """Ruta de la lápida de una factura eliminada."""
+    return os.path.join(CARPETA_ELIMINADAS, f"factura_{str(numero_factura).zfill(3)}{EXTENSION_LAPIDA}")
+
+
+def numeros_eliminados():
+    """
+    Números de las facturas con lápida.
+
+    Returns:
+        set: Números de factura
+    """
+    if not os.path.isdir(CARPETA_ELIMINADAS):
+        return set()
+    numeros = set()
+    with os.scandir(CARPETA_ELIMINADAS) as entradas:
+        for entrada in entradas:
+            if entrada.name.endswith(EXTENSION_LAPIDA):
+                numero = numero_desde_archivo(entrada.name[:-len(EXTENSION_LAPIDA)] + ".txt")
+                if numero is not None:
+                    numeros.add(numero)
+    return numeros
+
+
+def buscar_ruta_factura(numero_factura, incluir_eliminadas=False):
+    """
+    Busca el archivo de una factura existente, en su subcarpeta, en cache/ o
+    en su paquete del archivo de facturas antiguas (utils.archivado).
+
+    Args:
+        numero_factura: Número de la factura
+        incluir_eliminadas: Si es True también se encuentran las facturas con
+            lápida (eliminadas pero todavía recuperables)
+
+    Returns:
+        str: Ruta del archivo o None si la factura no existe
+    """
+    if not incluir_eliminadas and os.path.exists(ruta_lapida(numero_factura)):
+        return None
+    for ruta in (ruta_factura(numero_factura), ruta_factura_antigua(numero_factura)):
+        if os.path.isfile(ruta):
+            return ruta
+    return ruta_archivada(numero_factura, nombre_archivo_factura(numero_factura))
+
+
+def carpetas_de_facturas():
+    """
+    Lista las carpetas que pueden contener facturas: cache/ (estructura
+    anterior) y cada subcarpeta de cache/facturas.
+
+    Returns:
+        list: Rutas de las carpetas existentes
+    """
+    carpetas = [CARPETA] if os.path.isdir(CARPETA) else []
+    if os.path.isdir(CARPETA_FACTURAS):
+        with os.scandir(CARPETA_FACTURAS) as entradas:
+            carpetas.extend(sorted(entrada.path for entrada in entradas if entrada.is_dir()))
+    return carpetas
+
+
+def _escanear_carpeta(carpeta):
+    encontradas = []
+    with os.scandir(carpeta) as entradas:
+        for entrada in entradas:
+            numero = numero_desde_archivo(entrada.name)
+            if numero is not None and entrada.is_file():
+                encontradas.append((numero, entrada))
+    return encontradas
+
+
+def recorrer_facturas(trabajadores=None):
+    """
+    Recorre todos los archivos de factura con os.scandir.
+
+    Cada subcarpeta se lee en su propio hilo (ver utils.paralelo) y las
+    facturas se entregan carpeta por carpeta, en orden, y al final las de
+    los paquetes del archivo. Si una factura aparece en más de un lugar (por
+    ejemplo a mitad de una migración, o editada después de archivarla), solo
+    se entrega la de su subcarpeta, luego la de cache/ y por último la
+    archivada. Las facturas con lápida no se entregan.
+
+    Args:
+        trabajadores: Cantidad de hilos; 1 lee las carpetas una por una
+
+    Yields:
+        tuple: (numero, entrada) con entrada de tipo os.DirEntry (o
+            archivado.EntradaArchivada, con la misma interfaz)
+    """
+    carpetas = carpetas_de_facturas()
+    antiguas = []
+    eliminadas = numeros_eliminados()
+    vistas = set(eliminadas)
+    escaneos = mapear_ordenado(_escanear_carpeta, carpetas, trabajadores, procesos=False, tamaño_bloque=1)
+    for carpeta, encontradas in zip(carpetas, escaneos):
+        if carpeta == CARPETA:
+            antiguas = encontradas
+            continue
+        for numero, entrada in encontradas:
+            if numero in eliminadas:
+                continue
+            vistas.add(numero)
+            yield numero, entrada
+
+    for numero, entrada in antiguas:
+        if numero not in vistas:
+            vistas.add(numero)
+            yield numero, entrada
+
+    for entrada in recorrer_archivadas():
+        numero = numero_desde_archivo(entrada.name)
+        if numero is not None and numero not in vistas:
+            yield numero, entrada
+
+
+def migrar_facturas_antiguas():
+    """
+    Mueve las facturas guardadas directamente en cache/ a sus subcarpetas.
+
+    No es obligatorio: las facturas antiguas se leen igual donde están.
+
+    Returns:
+        int: Cantidad de facturas movidas
+    """
+    from utils.archivo import bloquear_factura
+    from utils.indice import registrar_factura
+
+    movidas = 0
+    if not os.path.isdir(CARPETA):
+        return movidas
+
+    with os.scandir(CARPETA) as entradas:
+        antiguas = [(numero_desde_archivo(e.name), e.path) for e in entradas if e.is_file()]
+
+    for numero, ruta in antiguas:
+        if numero is None:
+            continue
+        with bloquear_factura(numero):
+            destino = ruta_factura(numero, crear_carpeta=True)
+            if os.path.exists(destino):
+                continue
+            os.replace(ruta, destino)
+            sincronizar_directorio(os.path.dirname(destino))
+            sincronizar_directorio(CARPETA)
+            registrar_factura(destino)
+            movidas += 1
+
+    print(f"✅ Facturas movidas a {CARPETA_FACTURAS}: {movidas}")
+    return movidas
+
+
+if __name__ == "__main__":
+    # Uso: python -m utils.rutas --migrar
+    import sys
+
+    if "--migrar" in sys.argv:
+        migrar_facturas_antiguas()
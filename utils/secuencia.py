@@ -0,0 +1,64 @@
+import os
+
+from utils.bloqueo import bloquear_archivo
+from utils.escritura import escribir_atomico
+from utils.rutas import recorrer_facturas
+
+CARPETA = "cache"
+ARCHIVO_SECUENCIA = os.path.join(CARPETA, "secuencia_facturas.txt")
+ARCHIVO_LOCK = os.path.join(CARPETA, "secuencia_facturas.lock")
+
+
+def _numero_mas_alto_en_carpeta():
+    # Solo se usa una vez, cuando todavía no existe el archivo de secuencia
+    return max((numero for numero, _ in recorrer_facturas()), default=0)
+
+
+def _leer_siguiente():
+    try:
+        with open(ARCHIVO_SECUENCIA, "r", encoding="utf-8") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return _numero_mas_alto_en_carpeta() + 1
+
+
+def _escribir_siguiente(siguiente):
+    escribir_atomico(ARCHIVO_SECUENCIA, f"{siguiente}\n")
+
+
+def reservar_numeros(cantidad=1):
+    """
+    Reserva un bloque de números de factura consecutivos.
+
+    El contador se guarda en disco y se actualiza bajo un bloqueo entre
+    procesos, así que dos sesiones nunca reciben el mismo número. Los números
+    reservados que no lleguen a usarse quedan como huecos en la numeración.
+
+    Args:
+        cantidad: Cantidad de números a reservar
+
+    Returns:
+        range: Números reservados
+    """
+    if cantidad < 1:
+        raise ValueError("La cantidad a reservar debe ser mayor que 0")
+
+    with bloquear_archivo(ARCHIVO_LOCK):
+        inicio = _leer_siguiente()
+        _escribir_siguiente(inicio + cantidad)
+
+    return range(inicio, inicio + cantidad)
+
+
+def ajustar_secuencia(numero_usado):
+    """
+    Asegura que la secuencia no vuelva a entregar un número ya usado.
+
+    Útil cuando se agregan facturas a la carpeta por fuera del sistema.
+
+    Args:
+        numero_usado: Número de factura que ya existe
+    """
+    with bloquear_archivo(ARCHIVO_LOCK):
+        if _leer_siguiente() <= numero_usado:
+            _escribir_siguiente(numero_usado + 1)
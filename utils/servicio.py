@@ -0,0 +1,215 @@
+from utils.almacenamiento import FacturaModificada, obtener_repositorio
+from utils.catalogo import consultar_catalogo, invalidar_factura, invalidar_facturas
+from utils.lote import preparar_factura, preparar_facturas, validar_pedido, validar_pedidos
+
+# Operaciones de facturación sin Streamlit: crear, consultar, editar y
+# eliminar facturas con datos simples (listas y diccionarios), para usarlas
+# desde la API HTTP (utils.api), scripts o terminales de venta. Usan el
+# repositorio configurado y mantienen al día el catálogo compartido, igual
+# que las páginas.
+
+
+class DatosInvalidos(ValueError):
+    """Los productos recibidos no pasan las validaciones."""
+
+    def __init__(self, errores):
+        super().__init__("; ".join(errores))
+        self.errores = errores
+
+
+class LoteInterrumpido(Exception):
+    """
+    El guardado en lote falló después de empezar a escribir: algunas
+    facturas pueden haber quedado guardadas, así que el lote no se puede
+    reintentar entero sin duplicarlas.
+
+    Atributos:
+        resultados: Un diccionario por pedido, como en crear_facturas
+        fallidas: Posiciones de los pedidos que no se guardaron por el error
+    """
+
+    def __init__(self, error, resultados, fallidas):
+        super().__init__(f"Se guardaron {len(resultados) - len(fallidas)} de {len(resultados)} facturas: {error}")
+        self.resultados = resultados
+        self.fallidas = fallidas
+
+
+def _repositorio(repositorio):
+    return repositorio if repositorio is not None else obtener_repositorio()
+
+
+def crear_facturas(lista_productos, repositorio=None):
+    """
+    Crea una factura por pedido, validando y guardando todos juntos (un solo
+    guardado en lote en el repositorio).
+
+    Args:
+        lista_productos: Lista con los productos de cada pedido, como tuplas
+            (nombre, precio, cantidad)
+        repositorio: Repositorio de facturas (por defecto el configurado)
+
+    Returns:
+        list: Un diccionario por pedido, en el mismo orden: {'numero': N} si
+            se guardó o {'errores': [...]} si no
+
+    Raises:
+        LoteInterrumpido: Si el guardado falló después de empezar a escribir
+            (cualquier otra excepción se lanza antes de escribir nada)
+    """
+    repositorio = _repositorio(repositorio)
+    resultados = [{'errores': errores} for errores in validar_pedidos(lista_productos)]
+    validos = [i for i, resultado in enumerate(resultados) if not resultado['errores']]
+    if not validos:
+        return resultados
+
+    facturas = preparar_facturas([lista_productos[i] for i in validos])
+    numeros = repositorio.reservar_numeros(len(validos))
+    error = None
+    try:
+        guardadas = set(repositorio.guardar_lote(
+            [(numero, *factura) for numero, factura in zip(numeros, facturas)]
+        ))
+        invalidar_facturas(repositorio, guardadas)
+    except Exception as e:
+        # Los números son de este lote: los que existen los escribió él
+        guardadas = {numero for numero in numeros if repositorio.version(numero) is not None}
+        error = e
+
+    for i, numero in zip(validos, numeros):
+        resultados[i] = {'numero': numero} if numero in guardadas else {'errores': ["No se pudo guardar la factura"]}
+    if error is not None:
+        fallidas = [i for i, numero in zip(validos, numeros) if numero not in guardadas]
+        raise LoteInterrumpido(error, resultados, fallidas) from error
+    return resultados
+
+
+def crear_factura(productos, repositorio=None):
+    """
+    Crea una factura.
+
+    Args:
+        productos: Lista de tuplas (nombre, precio, cantidad)
+        repositorio: Repositorio de facturas (por defecto el configurado)
+
+    Returns:
+        int: Número de la factura o None si no se pudo guardar
+
+    Raises:
+        DatosInvalidos: Si los productos no son válidos
+    """
+    errores = validar_pedido(productos)
+    if errores:
+        raise DatosInvalidos(errores)
+
+    repositorio = _repositorio(repositorio)
+    numero = repositorio.guardar(*preparar_factura(productos))
+    if numero is not None:
+        invalidar_factura(repositorio, numero)
+    return numero
+
+
+def obtener_factura(numero, repositorio=None):
+    """
+    Obtiene una factura con sus productos.
+
+    Args:
+        numero: Número de la factura
+        repositorio: Repositorio de facturas (por defecto el configurado)
+
+    Returns:
+        dict: Información de la factura (ver RepositorioFacturas) más
+            'productos' como lista de diccionarios nombre, precio y cantidad,
+            o None si no existe
+    """
+    repositorio = _repositorio(repositorio)
+    info = repositorio.obtener_info(numero)
+    if info is None:
+        return None
+    productos = [{'nombre': nombre, 'precio': precio, 'cantidad': cantidad}
+                 for nombre, precio, cantidad in repositorio.cargar(numero)]
+    return {**info, 'productos': productos}
+
+
+def listar_facturas(pagina=1, por_pagina=25, repositorio=None, **filtros):
+    """
+    Obtiene una página del listado de facturas.
+
+    Args:
+        pagina: Número de página, desde 1
+        por_pagina: Facturas por página
+        repositorio: Repositorio de facturas (por defecto el configurado)
+        **filtros: orden, descendente, numero_desde, numero_hasta, total_min,
+            total_max, fecha_desde, fecha_hasta y producto, como en
+            catalogo.consultar_catalogo
+
+    Returns:
+        dict: facturas (las de la página), cantidad (todas las que cumplen
+            los filtros) y hay_mas
+    """
+    facturas, cantidad, hay_mas = consultar_catalogo(_repositorio(repositorio), pagina, por_pagina, **filtros)
+    return {'facturas': facturas, 'cantidad': cantidad, 'hay_mas': hay_mas}
+
+
+def editar_factura(numero, productos, version=None, repositorio=None):
+    """
+    Reemplaza los productos de una factura y recalcula sus totales.
+
+    Args:
+        numero: Número de la factura
+        productos: Lista de tuplas (nombre, precio, cantidad)
+        version: Versión leída de la factura (opcional)
+        repositorio: Repositorio de facturas (por defecto el configurado)
+
+    Returns:
+        bool: True si se guardó, False si la factura no existe o hubo error
+
+    Raises:
+        DatosInvalidos: Si los productos no son válidos
+        FacturaModificada: Si la factura ya no está en esa versión
+    """
+    errores = validar_pedido(productos)
+    if errores:
+        raise DatosInvalidos(errores)
+
+    repositorio = _repositorio(repositorio)
+    try:
+        return repositorio.actualizar(numero, *preparar_factura(productos), version=version)
+    finally:
+        invalidar_factura(repositorio, numero)
+
+
+def eliminar_factura(numero, version=None, repositorio=None):
+    """
+    Elimina una factura (con la ventana para deshacer del repositorio, si
+    tiene).
+
+    Returns:
+        bool: True si se eliminó
+
+    Raises:
+        FacturaModificada: Si la factura ya no está en esa versión
+    """
+    repositorio = _repositorio(repositorio)
+    try:
+        return repositorio.eliminar(numero, version=version)
+    finally:
+        invalidar_factura(repositorio, numero)
+
+
+def eliminar_facturas(numeros, versiones=None, repositorio=None):
+    """
+    Elimina varias facturas en una sola operación.
+
+    Args:
+        numeros: Números de las facturas
+        versiones: Diccionario numero -> versión leída (opcional); las que
+            cambiaron desde entonces no se eliminan
+        repositorio: Repositorio de facturas (por defecto el configurado)
+
+    Returns:
+        list: Números de las facturas eliminadas
+    """
+    repositorio = _repositorio(repositorio)
+    eliminadas = repositorio.eliminar_lote(numeros, versiones)
+    invalidar_facturas(repositorio, numeros)
+    return eliminadas
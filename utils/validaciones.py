@@ -1,3 +1,19 @@
+from utils.dinero import a_centimos, a_soles, calcular_igv_centimos, puntos_basicos
+
+
+def es_numero(valor):
+    """
+    Indica si un valor es un número de Python (int o float, sin contar bool).
+
+    Args:
+        valor: Valor a revisar
+
+    Returns:
+        bool: True si es int o float y no es True/False
+    """
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+
 def dato_valido(precio, cantidad):
     """
     Verifica si el precio y cantidad ingresados son válidos.
@@ -12,32 +28,24 @@ def dato_valido(precio, cantidad):
     Criterios de validación:
     - El precio debe ser un número (int o float) mayor que 0
     - La cantidad debe ser un número entero positivo
-    - No se permiten valores None, negativos o cero
+    - No se permiten valores None, booleanos, NaN, negativos o cero
     """
     try:
         # Verificar que el precio sea un número válido
-        if not isinstance(precio, (int, float)):
+        if not es_numero(precio):
             return False
 
         # Verificar que la cantidad sea un número entero válido
-        if not isinstance(cantidad, int):
-            return False
-
-        # Verificar que el precio sea mayor que 0
-        if precio <= 0:
-            return False
-
-        # Verificar que la cantidad sea mayor que 0
-        if cantidad <= 0:
+        if not isinstance(cantidad, int) or isinstance(cantidad, bool):
             return False
 
-        # Verificar rangos razonables
-        # Precio máximo: S/. 10,000 (productos muy costosos)
-        if precio > 10000:
+        # Precio mayor que 0 y como máximo S/. 10,000 (productos muy costosos);
+        # escrito así también rechaza NaN
+        if not 0 < precio <= 10000:
             return False
 
-        # Cantidad máxima: 999 unidades
-        if cantidad > 999:
+        # Cantidad entre 1 y 999 unidades
+        if not 0 < cantidad <= 999:
             return False
 
         return True
@@ -99,8 +107,8 @@ def validar_numero_factura(numero):
         if not isinstance(numero, int):
             return False
 
-        # Verificar rango (1 a 999)
-        if numero < 1 or numero > 999:
+        # Cualquier número positivo (la numeración no tiene límite superior)
+        if numero < 1:
             return False
 
         return True
@@ -162,8 +170,10 @@ def validar_producto_completo(nombre, precio, cantidad):
     # Validar nombre
     if not validar_nombre_producto(nombre):
         resultado['valido'] = False
-        if not nombre or not nombre.strip():
+        if nombre is None or (isinstance(nombre, str) and not nombre.strip()):
             resultado['errores'].append("El nombre del producto no puede estar vacío")
+        elif not isinstance(nombre, str):
+            resultado['errores'].append("El nombre del producto no es válido")
         elif len(nombre.strip()) < 2:
             resultado['errores'].append("El nombre del producto debe tener al menos 2 caracteres")
         elif len(nombre.strip()) > 50:
@@ -174,7 +184,9 @@ def validar_producto_completo(nombre, precio, cantidad):
     # Validar precio
     if not dato_valido(precio, 1):  # Usamos cantidad 1 para validar solo el precio
         resultado['valido'] = False
-        if precio <= 0:
+        if not es_numero(precio):
+            resultado['errores'].append("El precio no es válido")
+        elif precio <= 0:
             resultado['errores'].append("El precio debe ser mayor que 0")
         elif precio > 10000:
             resultado['errores'].append("El precio no puede ser mayor que S/. 10,000")
@@ -184,7 +196,9 @@ def validar_producto_completo(nombre, precio, cantidad):
     # Validar cantidad
     if not dato_valido(1, cantidad):  # Usamos precio 1 para validar solo la cantidad
         resultado['valido'] = False
-        if cantidad <= 0:
+        if not es_numero(cantidad):
+            resultado['errores'].append("La cantidad no es válida")
+        elif cantidad <= 0:
             resultado['errores'].append("La cantidad debe ser mayor que 0")
         elif cantidad > 999:
             resultado['errores'].append("La cantidad no puede ser mayor que 999")
@@ -247,10 +261,10 @@ def calcular_igv(subtotal, porcentaje_igv=0.18):
         porcentaje_igv (float): Porcentaje de IGV (por defecto 18% = 0.18)
 
     Returns:
-        float: Monto del IGV
+        float: Monto del IGV, redondeado al céntimo
     """
     try:
-        return float(subtotal) * float(porcentaje_igv)
+        return a_soles(calcular_igv_centimos(a_centimos(subtotal), puntos_basicos(porcentaje_igv)))
     except (TypeError, ValueError):
         return 0.0
 
@@ -267,9 +281,9 @@ def calcular_total_con_igv(subtotal, porcentaje_igv=0.18):
         tuple: (igv, total) - Monto del IGV y total con IGV
     """
     try:
-        subtotal = float(subtotal)
-        igv = calcular_igv(subtotal, porcentaje_igv)
-        total = subtotal + igv
-        return igv, total
+        # En céntimos para que el total sea exactamente subtotal + IGV
+        subtotal = a_centimos(subtotal)
+        igv = calcular_igv_centimos(subtotal, puntos_basicos(porcentaje_igv))
+        return a_soles(igv), a_soles(subtotal + igv)
     except (TypeError, ValueError):
-        return 0.0, 0.0
\ No newline at end of file
+        return 0.0, 0.0
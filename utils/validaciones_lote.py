@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+
+
+# Códigos de error de validar_productos_lote; una fila puede tener varios,
+# combinados como bits
+ERROR_NOMBRE_VACIO = 1
+ERROR_NOMBRE_CORTO = 2
+ERROR_NOMBRE_LARGO = 4
+ERROR_NOMBRE_INVALIDO = 8
+ERROR_PRECIO_NO_POSITIVO = 16
+ERROR_PRECIO_EXCESIVO = 32
+ERROR_PRECIO_INVALIDO = 64
+ERROR_CANTIDAD_NO_POSITIVA = 128
+ERROR_CANTIDAD_EXCESIVA = 256
+ERROR_CANTIDAD_INVALIDA = 512
+
+# Mismos mensajes que validar_producto_completo, en el mismo orden
+MENSAJES_ERROR = {
+    ERROR_NOMBRE_VACIO: "El nombre del producto no puede estar vacío",
+    ERROR_NOMBRE_CORTO: "El nombre del producto debe tener al menos 2 caracteres",
+    ERROR_NOMBRE_LARGO: "El nombre del producto no puede tener más de 50 caracteres",
+    ERROR_NOMBRE_INVALIDO: "El nombre del producto no es válido",
+    ERROR_PRECIO_NO_POSITIVO: "El precio debe ser mayor que 0",
+    ERROR_PRECIO_EXCESIVO: "El precio no puede ser mayor que S/. 10,000",
+    ERROR_PRECIO_INVALIDO: "El precio no es válido",
+    ERROR_CANTIDAD_NO_POSITIVA: "La cantidad debe ser mayor que 0",
+    ERROR_CANTIDAD_EXCESIVA: "La cantidad no puede ser mayor que 999",
+    ERROR_CANTIDAD_INVALIDA: "La cantidad no es válida"
+}
+
+
+def _columna(valores):
+    # Las listas se convierten con dtype object para revisar cada valor como
+    # lo hacen las funciones escalares: pandas cambiaría None por NaN y haría
+    # float toda una columna de enteros que tenga un solo None
+    if isinstance(valores, (pd.Series, np.ndarray)):
+        return pd.Series(valores).reset_index(drop=True)
+    return pd.Series(list(valores), dtype=object)
+
+
+def _es_instancia(serie, tipos, tipos_dtype):
+    # Con dtype numérico el tipo se decide por columna; con dtype object,
+    # elemento por elemento como isinstance en las funciones escalares (bool
+    # no cuenta como número)
+    if serie.dtype.kind in tipos_dtype:
+        return np.ones(len(serie), dtype=bool)
+    if serie.dtype.kind == "O":
+        return np.fromiter((isinstance(valor, tipos) and not isinstance(valor, bool) for valor in serie),
+                           dtype=bool, count=len(serie))
+    return np.zeros(len(serie), dtype=bool)
+
+
+def validar_productos_lote(datos):
+    """
+    Valida muchos productos a la vez con operaciones vectorizadas.
+
+    Aplica las mismas reglas que validar_producto_completo, fila por fila:
+    nombre de 2 a 50 caracteres con al menos una letra, precio numérico
+    entre 0 (exclusivo) y 10,000, y cantidad entera entre 1 y 999. None,
+    NaN, booleanos y textos no son números válidos, y una cantidad float se
+    considera no entera, igual que en dato_valido.
+
+    Args:
+        datos: DataFrame (o diccionario de listas o arreglos) con las
+            columnas nombre, precio y cantidad
+
+    Returns:
+        tuple: (validos, codigos) como arreglos de NumPy; validos es una
+            máscara booleana y codigos tiene los bits de error de cada fila
+    """
+    nombres = pd.Series(datos['nombre'], dtype=object).reset_index(drop=True)
+    precios = _columna(datos['precio'])
+    cantidades = _columna(datos['cantidad'])
+
+    codigos = np.zeros(len(nombres), dtype=np.int32)
+    if len(nombres) == 0:
+        return codigos.astype(bool), codigos
+
+    # Nombre
+    limpios = nombres.str.strip()
+    es_texto = limpios.notna().to_numpy()
+    largo = limpios.str.len().fillna(0).to_numpy()
+
+    # [^\W\d_] acepta todas las letras de str.isalpha y algunos caracteres
+    # numéricos no ASCII; esos pocos casos se confirman uno por uno
+    tiene_letra = limpios.str.contains(r"[^\W\d_]", regex=True, na=False)
+    dudosos = tiene_letra & ~limpios.str.contains(r"[A-Za-z]", regex=True, na=False)
+    if dudosos.any():
+        tiene_letra[dudosos] = limpios[dudosos].map(lambda texto: any(c.isalpha() for c in texto))
+    tiene_letra = tiene_letra.to_numpy(dtype=bool)
+
+    # Solo None cuenta como nombre vacío; NaN u otros objetos son inválidos
+    ausente = np.fromiter((nombre is None for nombre in nombres), dtype=bool, count=len(nombres))
+    codigos[(es_texto & (largo == 0)) | ausente] |= ERROR_NOMBRE_VACIO
+    codigos[es_texto & (largo == 1)] |= ERROR_NOMBRE_CORTO
+    codigos[es_texto & (largo > 50)] |= ERROR_NOMBRE_LARGO
+    codigos[(es_texto & (largo >= 2) & (largo <= 50) & ~tiene_letra)
+            | (~es_texto & ~ausente)] |= ERROR_NOMBRE_INVALIDO
+
+    # Precio; los no numéricos quedan como NaN y solo se usan sus máscaras
+    precio_numerico = _es_instancia(precios, (int, float), "iuf")
+    valores_precio = pd.to_numeric(precios, errors="coerce").to_numpy(dtype=float)
+    with np.errstate(invalid="ignore"):
+        no_positivo = precio_numerico & (valores_precio <= 0)
+        excesivo = precio_numerico & (valores_precio > 10000)
+    codigos[no_positivo] |= ERROR_PRECIO_NO_POSITIVO
+    codigos[excesivo] |= ERROR_PRECIO_EXCESIVO
+    codigos[~precio_numerico | np.isnan(valores_precio)] |= ERROR_PRECIO_INVALIDO
+
+    # Cantidad
+    cantidad_numerica = _es_instancia(cantidades, (int, float), "iuf")
+    cantidad_entera = _es_instancia(cantidades, int, "iu")
+    valores_cantidad = pd.to_numeric(cantidades, errors="coerce").to_numpy(dtype=float)
+    with np.errstate(invalid="ignore"):
+        no_positiva = cantidad_numerica & (valores_cantidad <= 0)
+        excesiva = cantidad_numerica & (valores_cantidad > 999)
+    codigos[no_positiva] |= ERROR_CANTIDAD_NO_POSITIVA
+    codigos[excesiva] |= ERROR_CANTIDAD_EXCESIVA
+    codigos[~cantidad_numerica | (~cantidad_entera & ~no_positiva & ~excesiva)] |= ERROR_CANTIDAD_INVALIDA
+
+    return codigos == 0, codigos
+
+
+def mensajes_error(codigo):
+    """
+    Traduce un código de validar_productos_lote a mensajes de error.
+
+    Args:
+        codigo (int): Bits de error de una fila
+
+    Returns:
+        list: Mensajes de error de la fila
+    """
+    return [mensaje for bit, mensaje in MENSAJES_ERROR.items() if int(codigo) & bit]